@@ -0,0 +1,244 @@
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from database.data_access import SingleFlight
+from utils.metrics import metrics
+
+# Token bucket kept in one Redis hash per client, refilled using the server's clock
+REDIS_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+else
+  retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class AdmissionError(Exception):
+    """Raised when a request is turned away before it reaches the LLM"""
+    status = 503
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitedError(AdmissionError):
+    """The client has used up its request budget"""
+    status = 429
+
+
+class OverloadedError(AdmissionError):
+    """Every generation slot is busy and the wait queue is full or too slow"""
+    status = 503
+
+
+def request_fingerprint(data):
+    """Key identifying identical plan requests, for deduplicating them while in flight"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class MemoryBucketStore:
+    def __init__(self, max_keys=100000):
+        """
+        Token buckets held in this process
+
+        The least recently used buckets are dropped beyond max_keys; a dropped
+        bucket comes back full, which only ever errs on the side of the client.
+        """
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        """Take cost tokens from key's bucket; returns (allowed, seconds until it would be)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else (cost - tokens) / rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RedisBucketStore:
+    def __init__(self, client, prefix="trainer:ratelimit:"):
+        """Token buckets shared by every worker through Redis, updated atomically by a Lua script"""
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(REDIS_TOKEN_BUCKET)
+
+    def take(self, key, rate, burst, cost=1):
+        allowed, retry_after = self._script(keys=[self.prefix + key], args=[rate, burst, cost])
+        return bool(allowed), float(retry_after)
+
+
+def create_bucket_store(backend, redis_url=None):
+    """Build the configured token bucket store: 'memory' or 'redis'"""
+    if backend == 'memory':
+        return MemoryBucketStore()
+    if backend == 'redis':
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_STORE=redis requires redis to be installed")
+        return RedisBucketStore(redis.Redis.from_url(redis_url))
+    raise ValueError(f"Unknown rate limit store: {backend}")
+
+
+class TokenBucketLimiter:
+    def __init__(self, per_minute, burst, store=None):
+        """
+        Per-client rate limit: burst requests at once, refilled at per_minute
+
+        per_minute <= 0 disables the limit.
+        """
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self.store = store or MemoryBucketStore()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def take(self, client, cost=1):
+        if not self.enabled:
+            return True, 0
+        return self.store.take(client, self.rate, self.burst, cost)
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent, max_queue=32, queue_timeout=30, limiter=None, retry_after=10):
+        """
+        Admission control in front of plan generation
+
+        Parameters:
+        - max_concurrent: generations running at once, sized to the LLM capacity
+        - max_queue: requests allowed to wait for a slot; further ones are shed
+        - queue_timeout: seconds a request waits for a slot before it is shed
+        - limiter: TokenBucketLimiter applied per client, None for no rate limit
+        - retry_after: Retry-After seconds sent with shed requests
+
+        Identical requests arriving while one is being generated wait for
+        its result instead of generating it again.
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.limiter = limiter
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.queued = 0
+        self._slot_freed = threading.Condition()
+        self._flights = SingleFlight()
+        self._outcomes = metrics.counter("admission_requests_total", "Plan requests by admission outcome", ("outcome",))
+
+    def check_rate(self, client):
+        """Charge one request to client, raising RateLimitedError once its budget is spent"""
+        if self.limiter is None or client is None:
+            return
+        allowed, retry_after = self.limiter.take(client)
+        if not allowed:
+            self._outcomes.inc("rate_limited")
+            raise RateLimitedError("Too many plan requests, slow down", retry_after=max(1, math.ceil(retry_after)))
+
+    def _shed(self, reason):
+        self._outcomes.inc("shed")
+        return OverloadedError(reason, retry_after=self.retry_after)
+
+    def acquire(self, background=False):
+        """
+        Take a generation slot, waiting for one if they are all busy
+
+        Requests wait at most queue_timeout behind at most max_queue others.
+        Background work (queued jobs) waits as long as it takes and doesn't
+        count against max_queue.
+        """
+        with self._slot_freed:
+            if self.in_flight >= self.max_concurrent:
+                if not background and self.queued >= self.max_queue:
+                    raise self._shed("Plan generation is at capacity")
+                self._outcomes.inc("queued")
+                waiting = 0 if background else 1
+                self.queued += waiting
+                try:
+                    deadline = None if background else time.monotonic() + self.queue_timeout
+                    while self.in_flight >= self.max_concurrent:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            raise self._shed("Timed out waiting for a plan generation slot")
+                        self._slot_freed.wait(remaining)
+                finally:
+                    self.queued -= waiting
+            self.in_flight += 1
+            self._outcomes.inc("admitted")
+
+    def release(self):
+        with self._slot_freed:
+            self.in_flight -= 1
+            self._slot_freed.notify()
+
+    @contextmanager
+    def slot(self, background=False):
+        self.acquire(background)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def run(self, client, fn, dedup_key=None):
+        """Rate limit client, then run fn() in a slot, sharing the result of an identical request in flight"""
+        self.check_rate(client)
+
+        def admitted():
+            with self.slot():
+                return fn()
+
+        if dedup_key is None:
+            return admitted()
+        result, shared = self._flights.do(dedup_key, admitted)
+        if shared:
+            self._outcomes.inc("deduplicated")
+        return result
+
+    def stats(self):
+        outcomes = {outcome: count for (outcome,), count in self._outcomes.samples().items()}
+        return {
+            "maxConcurrent": self.max_concurrent,
+            "maxQueue": self.max_queue,
+            "inFlight": self.in_flight,
+            "queued": self.queued,
+            "rateLimit": {
+                "perMinute": round(self.limiter.rate * 60, 3),
+                "burst": self.limiter.burst
+            } if self.limiter is not None and self.limiter.enabled else None,
+            "outcomes": outcomes
+        }
+
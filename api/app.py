@@ -1,336 +1,841 @@
-import os
-import json
-import requests
-import time
-from fpdf import FPDF
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
-from models.fitness_calculator import FitnessCalculator
-from database.supabase_client import SupabaseClient
-from utils.config import Config
-
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app)
-
-# Initialize Supabase client
-supabase_client = SupabaseClient()
-
-PLANS_DIR = os.path.join(os.path.dirname(__file__), '../plans')
-os.makedirs(PLANS_DIR, exist_ok=True)
-
-def generate_with_ollama(prompt):
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={
-            "model": "deepseek-r1:8b",
-            "prompt": prompt,
-            "stream": False
-        }
-    )
-    response.raise_for_status()
-    return response.json()["response"]
-
-def generate_pdf(content, user_name, metrics, age):
-    """Generate a PDF file with the fitness plan"""
-    timestamp = int(time.time())
-    filename = f"fitness_plan_{timestamp}.pdf"
-    filepath = os.path.join(PLANS_DIR, filename)
-    
-    # Function to clean text of problematic Unicode characters
-    def clean_text(text):
-        # Replace curly apostrophes and quotes with straight ones
-        text = text.replace('\u2018', "'").replace('\u2019', "'")
-        text = text.replace('\u201c', '"').replace('\u201d', '"')
-        # Replace other problematic characters
-        text = text.replace('\u2013', '-').replace('\u2014', '-')
-        text = text.replace('\u2022', '*')  # Replace bullet points
-        return text
-    
-    # Create PDF
-    pdf = FPDF()
-    pdf.add_page()
-    
-    # Title
-    pdf.set_font("Arial", "B", 16)
-    pdf.cell(0, 10, f"Personalized Fitness Plan for {clean_text(user_name)}", ln=True, align="C")
-    pdf.ln(5)
-    
-    # Metrics Summary
-    pdf.set_font("Arial", "B", 12)
-    pdf.cell(0, 10, "Your Health Metrics:", ln=True)
-    pdf.set_font("Arial", "", 10)
-    pdf.cell(0, 8, f"BMI: {metrics.get('bmi', 'N/A')}", ln=True)
-    pdf.cell(0, 8, f"Body Fat: {metrics.get('bodyFatPercentage', 'N/A')}%", ln=True)
-    pdf.cell(0, 8, f"BMR: {metrics.get('bmr', 'N/A')} calories/day", ln=True)
-    pdf.cell(0, 8, f"TDEE: {metrics.get('tdee', 'N/A')} calories/day", ln=True)
-    pdf.cell(0, 8, f"Goal Calories: {metrics.get('goalCalories', 'N/A')} calories/day", ln=True)
-    
-    macros = metrics.get('macros', {})
-    pdf.cell(0, 8, f"Macros: Protein: {macros.get('protein', 'N/A')}g | Carbs: {macros.get('carbs', 'N/A')}g | Fat: {macros.get('fat', 'N/A')}g", ln=True)
-    pdf.ln(5)
-    
-    # Content
-    pdf.set_font("Arial", "B", 12)
-    pdf.cell(0, 10, "Your Personalized Plan:", ln=True)
-    pdf.set_font("Arial", "", 10)
-    
-    # Clean the content
-    content = clean_text(content)
-    
-    # Split content by lines and add to PDF
-    lines = content.split('\n')
-    for line in lines:
-        # Skip empty lines
-        if not line.strip():
-            pdf.ln(3)
-            continue
-            
-        # Check if line is a section header (e.g., "WORKOUT PLAN", "MEAL PLAN")
-        if line.strip().upper() == line.strip() and len(line.strip()) > 0 and not line.startswith(' '):
-            pdf.ln(5)
-            pdf.set_font("Arial", "B", 12)
-            pdf.cell(0, 10, line, ln=True)
-            pdf.set_font("Arial", "", 10)
-        else:
-            # For regular text, wrap long lines
-            pdf.multi_cell(0, 5, line)
-    
-    # Age disclaimer for users over 50
-    if age and int(age) >= 50:
-        pdf.ln(10)
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 10, "Important Note for Seniors:", ln=True)
-        pdf.set_font("Arial", "", 10)
-        pdf.multi_cell(0, 5, "Since you are 50 or older, please consider the following:")
-        pdf.multi_cell(0, 5, "- Always consult with your healthcare provider before starting any new exercise program.")
-        pdf.multi_cell(0, 5, "- Begin each workout with a longer warm-up (10-15 minutes) to properly prepare your joints and muscles.")
-        pdf.multi_cell(0, 5, "- Focus on proper form rather than intensity or weight.")
-        pdf.multi_cell(0, 5, "- Consider aquatic exercises which are lower impact on joints.")
-        pdf.multi_cell(0, 5, "- Listen to your body and rest when needed. Recovery may take longer as we age.")
-        pdf.multi_cell(0, 5, "- If you feel pain (not just muscle fatigue), stop the exercise immediately.")
-    
-    # Footer
-    pdf.ln(10)
-    pdf.set_font("Arial", "I", 8)
-    pdf.cell(0, 10, f"Generated on {time.strftime('%Y-%m-%d %H:%M:%S')}", ln=True, align="C")
-    
-    # Save PDF
-    try:
-        pdf.output(filepath)
-        return filename
-    except Exception as e:
-        print(f"Error generating PDF: {e}")
-        # Fallback to text file if PDF generation fails
-        txt_filename = f"fitness_plan_{timestamp}.txt"
-        txt_filepath = os.path.join(PLANS_DIR, txt_filename)
-        with open(txt_filepath, 'w', encoding='utf-8') as f:
-            f.write(f"Personalized Fitness Plan for {user_name}\n\n")
-            f.write("Your Health Metrics:\n")
-            f.write(f"BMI: {metrics.get('bmi', 'N/A')}\n")
-            f.write(f"Body Fat: {metrics.get('bodyFatPercentage', 'N/A')}%\n")
-            f.write(f"BMR: {metrics.get('bmr', 'N/A')} calories/day\n")
-            f.write(f"TDEE: {metrics.get('tdee', 'N/A')} calories/day\n")
-            f.write(f"Goal Calories: {metrics.get('goalCalories', 'N/A')} calories/day\n")
-            f.write(f"Macros: Protein: {macros.get('protein', 'N/A')}g | Carbs: {macros.get('carbs', 'N/A')}g | Fat: {macros.get('fat', 'N/A')}g\n\n")
-            f.write(content)
-            
-            if age and int(age) >= 50:
-                f.write("\n\nImportant Note for Seniors:\n")
-                f.write("Since you are 50 or older, please consider the following:\n")
-                f.write("- Always consult with your healthcare provider before starting any new exercise program.\n")
-                f.write("- Begin each workout with a longer warm-up (10-15 minutes) to properly prepare your joints and muscles.\n")
-                f.write("- Focus on proper form rather than intensity or weight.\n")
-                f.write("- Consider aquatic exercises which are lower impact on joints.\n")
-                f.write("- Listen to your body and rest when needed. Recovery may take longer as we age.\n")
-                f.write("- If you feel pain (not just muscle fatigue), stop the exercise immediately.\n")
-        
-        return txt_filename
-
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    return jsonify({"status": "ok", "message": "API is running"}), 200
-
-@app.route('/api/calculate', methods=['POST'])
-def calculate():
-    try:
-        data = request.json
-        
-        # Extract user data
-        age = data.get('age')
-        weight = data.get('weight')  # in kg
-        height = data.get('height')  # in cm
-        waist = data.get('waist')    # in cm
-        neck = data.get('neck')      # in cm
-        gender = data.get('gender', 'male')
-        activity_level = data.get('activityLevel', 'moderate')
-        goal = data.get('goal', 'maintenance')
-        
-        # Validate required fields
-        if not all([age, weight, height, waist, neck]):
-            return jsonify({"error": "Missing required fields"}), 400
-            
-        # Create calculator instance
-        calculator = FitnessCalculator(
-            age=age,
-            weight=weight,
-            height=height,
-            waist=waist,
-            neck=neck,
-            gender=gender,
-            activity_level=activity_level,
-            goal=goal
-        )
-        
-        # Calculate all metrics
-        results = {
-            "bmi": calculator.calculate_bmi(),
-            "bodyFatPercentage": calculator.calculate_body_fat(),
-            "bmr": calculator.calculate_bmr(),
-            "tdee": calculator.calculate_tdee(),
-            "goalCalories": calculator.calculate_goal_calories(),
-            "macros": calculator.calculate_macros()
-        }
-        
-        return jsonify(results), 200
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/generate-plan', methods=['POST'])
-def generate_plan():
-    try:
-        data = request.json
-        metrics = data.get('metrics', {})
-        preferences = data.get('preferences', {})
-        medical_conditions = data.get('medicalConditions', [])
-        goal = data.get('goal', 'maintenance').lower()
-        user_name = data.get('name', 'User')
-        age = data.get('age')
-
-        # Macros calculation remains as is
-        macros = metrics.get('macros', {})
-
-        # Determine workout plan days based on goal
-        if 'muscle' in goal:
-            workout_days = 6
-        else:
-            workout_days = 3
-
-        # Fat loss: add explicit calorie deficit instruction
-        fat_loss_instruction = ''
-        if 'fat' in goal or 'loss' in goal or 'weight' in goal:
-            fat_loss_instruction = 'The meal plan MUST be in a calorie deficit based on the user\'s TDEE and goal calories. Meals should be filling, high in protein, and support fat loss.'
-
-        # Add age-specific considerations for older adults
-        age_instructions = ''
-        if age and int(age) >= 50:
-            age_instructions = """
-Since the user is 50 or older, include these IMPORTANT exercise modifications:
-- Reduce high-impact exercises (like jumping, running on hard surfaces)
-- Include more joint-friendly activities (swimming, cycling, elliptical)
-- Focus on mobility and flexibility exercises
-- Decrease weight/resistance but maintain proper form
-- Include more comprehensive warm-ups and cool-downs
-- Suggest longer recovery periods between training days
-- Emphasize proper hydration and nutrition for recovery
-- Recommend using perceived exertion rather than maximum effort
-"""
-
-        # Build prompt for Ollama (plain text, not JSON)
-        prompt = f"""
-You are a professional fitness and nutrition coach creating a personalized plan for {user_name}, age {age}. Based on the following data, generate a detailed, readable plan in plain text:
-
-User metrics:
-- BMI: {metrics.get('bmi', 'Not provided')}
-- Body Fat %: {metrics.get('bodyFatPercentage', 'Not provided')}%
-- BMR: {metrics.get('bmr', 'Not provided')} calories
-- TDEE: {metrics.get('tdee', 'Not provided')} calories
-- Goal calories: {metrics.get('goalCalories', 'Not provided')} calories
-- Macros: Protein: {macros.get('protein', 'Not provided')}g, Carbs: {macros.get('carbs', 'Not provided')}g, Fat: {macros.get('fat', 'Not provided')}g
-
-Preferences:
-- Cuisine: {preferences.get('cuisine', 'Not provided')}
-- Restrictions: {preferences.get('restrictions', 'None')}
-- Medical conditions: {', '.join(medical_conditions) if medical_conditions else 'None'}
-- Primary goal: {goal}
-
-{fat_loss_instruction}
-{age_instructions}
-
-Please provide:
-1. A {workout_days}-day workout plan, with each day described in detail.
-2. A 3-day meal plan, with each meal (breakfast, lunch, dinner, snacks) described in detail.
-3. Rest day activities and recommendations.
-4. Morning and evening routine suggestions for optimal health.
-5. A general suggestion or opinion based on the user's metrics and calculated values, regardless of their goal.
-
-Format the output as readable sections with clear headings for each part. Use ALL CAPS for main section headings. Do not use JSON or markdown. Make it personalized for {user_name} directly, using their name throughout the plan.
-"""
-        
-        # Generate the response using Ollama
-        response_text = generate_with_ollama(prompt)
-
-        # Generate PDF with the response
-        pdf_filename = generate_pdf(response_text, user_name, metrics, age)
-
-        # Return macros and download link for the PDF
-        return jsonify({
-            "macros": macros,
-            "planFile": pdf_filename
-        }), 200
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/plan-file/<filename>', methods=['GET'])
-def download_plan_file(filename):
-    return send_from_directory(PLANS_DIR, filename, as_attachment=True)
-
-@app.route('/api/user', methods=['POST'])
-def create_user():
-    try:
-        data = request.json
-        result = supabase_client.create_user(data)
-        return jsonify(result), 201
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/user/<user_id>', methods=['GET'])
-def get_user(user_id):
-    try:
-        result = supabase_client.get_user(user_id)
-        if result:
-            return jsonify(result), 200
-        return jsonify({"error": "User not found"}), 404
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/user/<user_id>', methods=['PUT'])
-def update_user(user_id):
-    try:
-        data = request.json
-        result = supabase_client.update_user(user_id, data)
-        return jsonify(result), 200
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/plan/<user_id>', methods=['POST'])
-def save_plan(user_id):
-    try:
-        data = request.json
-        result = supabase_client.save_plan(user_id, data)
-        return jsonify(result), 201
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/plan/<user_id>', methods=['GET'])
-def get_plan(user_id):
-    try:
-        result = supabase_client.get_plan(user_id)
-        if result:
-            return jsonify(result), 200
-        return jsonify({"error": "Plan not found"}), 404
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-if __name__ == '__main__':
+import os
+import hmac
+import json
+import time
+from functools import lru_cache, partial
+from contextlib import contextmanager, nullcontext
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
+from flask_cors import CORS
+from models.fitness_calculator import calculate_metrics
+from database.data_access import DataAccessLayer
+from api.admission import AdmissionController, AdmissionError, TokenBucketLimiter, create_bucket_store, request_fingerprint
+from api.plan_sections import SectionedPlanGenerator, build_plan_prompt
+from api.plan_structure import StructuredPlanParser, parse_plan
+from api.plan_cache import PlanCache, plan_cache_key, lookup_plan, personalize
+from api.plan_storage import create_plan_storage, staging_basename, parse_plan_name, should_precompress, PlanGarbageCollector
+from api.streaming import ThinkFilter, strip_think, sse_event
+from api.prewarm import PlanPrewarmer, ProfileTracker
+from api.jobs import JobQueue, QueueFullError, JOB_DONE, JOB_FAILED
+from utils.config import Config
+from utils.lazy import LazyComponent, WarmUp
+from utils.llm_errors import LLMUnavailableError
+from utils.metrics import metrics, SlowRequestProfiler, SIZE_BUCKETS
+
+# Initialize Flask app
+app = Flask(__name__)
+app.config['USE_X_SENDFILE'] = Config.USE_X_SENDFILE
+CORS(app, expose_headers=['ETag', 'Content-Range', 'Accept-Ranges', 'Retry-After'])
+
+# Sampling profiler for slow requests, can be switched on at runtime
+profiler = SlowRequestProfiler(threshold=Config.PROFILER_THRESHOLD, interval=Config.PROFILER_INTERVAL)
+profiler.configure(enabled=Config.PROFILER_ENABLED)
+
+# Metrics for recently submitted inputs, keyed on the normalized input tuple
+cached_metrics = lru_cache(maxsize=Config.CALCULATE_CACHE_SIZE)(calculate_metrics)
+
+# Heavy clients are built on first use so a worker that only serves cheap
+# routes never imports supabase, fpdf or requests. The factories import
+# their modules for the same reason.
+def create_supabase_client():
+    from database.supabase_client import SupabaseClient
+    if Config.SUPABASE_BACKEND == 'memory':
+        from database.memory_store import InMemorySupabase
+        return SupabaseClient(client=InMemorySupabase(latency=Config.SUPABASE_MEMORY_LATENCY), plan_index=plan_index)
+    return SupabaseClient(plan_index=plan_index)
+
+supabase_client = LazyComponent("supabase", create_supabase_client)
+
+# Read-through cached, coalesced user and plan reads with batched writes
+data_access = DataAccessLayer(supabase_client, ttl=Config.DATA_CACHE_TTL, max_entries=Config.DATA_CACHE_MAX_ENTRIES)
+
+# Content-addressed plan files never change, so clients may keep them for a year
+PLAN_FILE_MAX_AGE = 365 * 24 * 3600
+
+PLANS_DIR = Config.PLANS_DIR or os.path.join(os.path.dirname(__file__), '../plans')
+
+def create_storage():
+    os.makedirs(PLANS_DIR, exist_ok=True)
+    return create_plan_storage(
+        Config.PLAN_STORAGE_BACKEND,
+        PLANS_DIR,
+        bucket=Config.PLAN_STORAGE_BUCKET,
+        endpoint_url=Config.PLAN_STORAGE_ENDPOINT,
+        precompress=Config.PLAN_PRECOMPRESS
+    )
+
+def create_plan_index():
+    from database.plan_index import PlanIndex
+    return PlanIndex(Config.PLAN_INDEX_PATH or os.path.join(PLANS_DIR, 'plan_index.sqlite3'))
+
+# Per-user plan history, also read in place of Supabase in mock mode
+plan_index = LazyComponent("index", create_plan_index)
+
+def create_measurement_store():
+    from database.measurement_store import MeasurementStore
+    return MeasurementStore(
+        Config.PROGRESS_DB_PATH or os.path.join(os.path.dirname(__file__), '../progress/progress.sqlite3'),
+        rolling_days=Config.PROGRESS_ROLLING_DAYS,
+        max_users=Config.PROGRESS_CACHE_USERS
+    )
+
+# Per-user measurement history with incrementally derived metrics for progress charts
+measurement_store = LazyComponent("progress", create_measurement_store)
+
+def create_collected_storage():
+    storage = create_storage()
+    plan_gc.start()
+    return storage
+
+# Content-addressed, sharded plan storage with background retention. The
+# collector starts once storage is first built and only touches it after its
+# first interval.
+plan_storage = LazyComponent("storage", create_collected_storage)
+plan_gc = PlanGarbageCollector(
+    plan_storage,
+    ttl=Config.PLAN_RETENTION_TTL,
+    max_bytes=Config.PLAN_STORAGE_QUOTA_BYTES,
+    interval=Config.PLAN_GC_INTERVAL
+)
+
+def create_render_pool():
+    from api.render_pool import RenderPool
+    return RenderPool(plan_storage.staging_dir, workers=Config.RENDER_WORKERS, start_method=Config.RENDER_START_METHOD)
+
+def create_llm_client():
+    from utils.llm_router import LLMRouter
+    return LLMRouter.from_config(Config)
+
+# Plans are rendered in worker processes so CPU-bound PDF work doesn't hold the GIL;
+# warming it up spawns the workers
+render_pool = LazyComponent("pdf", create_render_pool, warm_up=lambda pool: pool.start())
+
+# Routes generations across the configured Ollama backends
+llm_client = LazyComponent("llm", create_llm_client)
+
+# Components listed in WARM_UP are initialized in the background at startup;
+# /api/ready answers 503 until they are
+warm_up = WarmUp({
+    "supabase": supabase_client,
+    "storage": plan_storage,
+    "index": plan_index,
+    "progress": measurement_store,
+    "pdf": render_pool,
+    "llm": llm_client
+})
+warm_up.start(Config.WARM_UP)
+
+# Cache of generated plan text, keyed on the normalized prompt inputs.
+# Its directory is only created once the first entry is written.
+plan_cache = None
+if Config.PLAN_CACHE_ENABLED:
+    plan_cache = PlanCache(
+        cache_dir=Config.PLAN_CACHE_DIR or os.path.join(os.path.dirname(__file__), '../plan_cache'),
+        memory_entries=Config.PLAN_CACHE_MEMORY_ENTRIES,
+        ttl=Config.PLAN_CACHE_TTL,
+        max_disk_bytes=Config.PLAN_CACHE_MAX_BYTES
+    )
+
+def generate_with_ollama(prompt, options=None):
+    start = time.perf_counter()
+    response = llm_client.generate(prompt, options)
+    metrics.observe_generation(response, time.perf_counter() - start)
+    return strip_think(response["response"])
+
+def stream_with_ollama(prompt):
+    """Yield completion text from Ollama's NDJSON stream with <think> blocks removed"""
+    think_filter = ThinkFilter()
+    start = time.perf_counter()
+    for chunk in llm_client.stream(prompt):
+        if chunk.get("done"):
+            metrics.observe_generation(chunk, time.perf_counter() - start)
+        text = think_filter.feed(chunk.get("response", ""))
+        if text:
+            yield text
+    text = think_filter.flush()
+    if text:
+        yield text
+
+# Each section is short, so it gets a tighter token limit than a whole plan
+section_options = Config.get_generation_options(Config.OLLAMA_SECTION_NUM_PREDICT)
+
+# Generates plans as independently cached sections, so a tweak only regenerates what it affects.
+# The executor is shared, so it runs the sections of every admitted plan at once.
+section_generator = None
+if Config.PLAN_SECTIONED:
+    section_generator = SectionedPlanGenerator(
+        lambda prompt: generate_with_ollama(prompt, section_options),
+        cache=plan_cache,
+        max_parallel=Config.get_admission_capacity() * Config.PLAN_SECTION_PARALLELISM,
+        bucketing=Config.PLAN_CACHE_BUCKETING
+    )
+
+def generate_pdf(content, user_name, metrics, age):
+    """Generate a PDF file with the fitness plan and return its content-addressed name"""
+    staged = render_pool.render(content, user_name, metrics, age, staging_basename())
+    path = os.path.join(plan_storage.staging_dir, staged)
+    plan_file_bytes.observe(os.path.getsize(path), os.path.splitext(staged)[1].lstrip('.'))
+    return plan_storage.put_file(path)
+
+def send_plan_file(filename):
+    """
+    Send a stored plan as a download
+
+    Content-addressed plans never change, so their digest is a strong ETag
+    and they are cached as immutable. send_file answers If-None-Match with
+    304 and Range requests with 206, and local files go out through the
+    server's file wrapper (sendfile) or X-Sendfile when USE_X_SENDFILE is on.
+    Clients accepting gzip get the precompressed variant of .txt plans.
+    """
+    digest = parse_plan_name(filename)
+    compressible = Config.PLAN_PRECOMPRESS and should_precompress(filename)
+    want_gzip = compressible and request.accept_encodings['gzip'] > 0
+    etag = None
+    if digest is not None:
+        etag = f"{digest}-gzip" if want_gzip else digest
+        # Revalidations are answered without touching storage
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return plan_file_cache_headers(response, compressible)
+
+    source = None
+    if want_gzip:
+        source = plan_storage.compressed_path(filename) or plan_storage.open_compressed(filename)
+    if source is not None:
+        response = send_file(source, mimetype='text/plain', as_attachment=True, download_name=filename,
+                             etag=etag or True, max_age=PLAN_FILE_MAX_AGE if digest else None)
+        response.headers['Content-Encoding'] = 'gzip'
+        return plan_file_cache_headers(response, compressible, immutable=digest is not None)
+
+    source = plan_storage.local_path(filename)
+    if source is None:
+        if not plan_storage.exists(filename):
+            return jsonify({"error": "Plan file not found"}), 404
+        source = plan_storage.open(filename)
+    response = send_file(source, as_attachment=True, download_name=filename,
+                         etag=digest or True, max_age=PLAN_FILE_MAX_AGE if digest else None)
+    return plan_file_cache_headers(response, compressible, immutable=digest is not None)
+
+def plan_file_cache_headers(response, compressible, immutable=True):
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = PLAN_FILE_MAX_AGE
+        response.cache_control.immutable = True
+    if compressible:
+        response.vary.add('Accept-Encoding')
+    return response
+
+# Request instrumentation
+
+http_requests = metrics.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_duration = metrics.histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+http_errors = metrics.counter("http_errors_total", "Requests that failed with an exception, by type", ("route", "error"))
+plan_file_bytes = metrics.histogram("plan_file_bytes", "Size of rendered plan files", ("format",), buckets=SIZE_BUCKETS)
+
+def current_route():
+    """Route template of the current request, so labels stay bounded"""
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+def error_response(e, status=500):
+    """JSON error response, counted by route and exception type"""
+    http_errors.inc(current_route(), type(e).__name__)
+    return jsonify({"error": str(e)}), status
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    metrics.begin_trace()
+    profiler.request_started(f"{request.method} {request.path}")
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    route = current_route()
+    http_requests.inc(request.method, route, str(response.status_code))
+    http_duration.observe(elapsed, request.method, route)
+    spans = metrics.end_trace()
+    if spans:
+        response.headers['Server-Timing'] = ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans)
+    return response
+
+@app.teardown_request
+def finish_request_profile(error=None):
+    profiler.request_finished()
+
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    return jsonify({"status": "ok", "message": "API is running"}), 200
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    return jsonify(warm_up.stats()), 200 if warm_up.ready else 503
+
+@app.route('/api/calculate', methods=['POST'])
+def calculate():
+    try:
+        data = request.json
+        
+        # Extract user data
+        age = data.get('age')
+        weight = data.get('weight')  # in kg
+        height = data.get('height')  # in cm
+        waist = data.get('waist')    # in cm
+        neck = data.get('neck')      # in cm
+        gender = data.get('gender', 'male')
+        activity_level = data.get('activityLevel', 'moderate')
+        goal = data.get('goal', 'maintenance')
+        
+        # Validate required fields
+        if not all([age, weight, height, waist, neck]):
+            return jsonify({"error": "Missing required fields"}), 400
+            
+        # Repeat submissions of the same form are served from the LRU memo
+        results = cached_metrics(
+            float(age), float(weight), float(height), float(waist), float(neck),
+            gender.lower(), activity_level.lower(), goal.lower()
+        )
+        
+        return jsonify(results), 200
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/progress/<user_id>', methods=['POST'])
+def add_measurements(user_id):
+    try:
+        data = request.json
+        points = data.get('points', [data]) if isinstance(data, dict) else data
+        if not isinstance(points, list) or not points or not all(isinstance(point, dict) for point in points):
+            return jsonify({"error": "Expected a measurement or a list of measurements"}), 400
+        try:
+            result = measurement_store.add(user_id, points)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(result), 201
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/progress/<user_id>', methods=['GET'])
+def get_progress(user_id):
+    try:
+        from database.sqlite_store import parse_time
+        try:
+            start = parse_time(request.args['start']) if 'start' in request.args else None
+            end = parse_time(request.args['end']) if 'end' in request.args else None
+            max_points = min(int(request.args.get('points', Config.PROGRESS_MAX_POINTS)), Config.PROGRESS_MAX_POINTS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        result = measurement_store.query(user_id, start, end, max(1, max_points))
+        if result is None:
+            return jsonify({"error": "No measurements found"}), 404
+        return jsonify(result), 200
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/calculate/batch', methods=['POST'])
+def calculate_batch():
+    try:
+        data = request.json
+        users = data.get('users') if isinstance(data, dict) else data
+        if not isinstance(users, list):
+            return jsonify({"error": "Expected a list of users"}), 400
+
+        # Rows that aren't objects or miss required fields get an error entry, the rest are computed together
+        results = [None] * len(users)
+        valid = []
+        for index, user in enumerate(users):
+            if not isinstance(user, dict):
+                results[index] = {"error": "Invalid user"}
+            elif not all([user.get('age'), user.get('weight'), user.get('height'), user.get('waist'), user.get('neck')]):
+                results[index] = {"error": "Missing required fields"}
+            else:
+                valid.append(index)
+
+        if valid:
+            # numpy is only loaded once a batch is actually requested
+            from models.batch_calculator import BatchFitnessCalculator
+            rows = [users[index] for index in valid]
+            calculator = BatchFitnessCalculator(
+                ages=[row['age'] for row in rows],
+                weights=[row['weight'] for row in rows],
+                heights=[row['height'] for row in rows],
+                waists=[row['waist'] for row in rows],
+                necks=[row['neck'] for row in rows],
+                genders=[row.get('gender', 'male') for row in rows],
+                activity_levels=[row.get('activityLevel', 'moderate') for row in rows],
+                goals=[row.get('goal', 'maintenance') for row in rows]
+            )
+            for index, result in zip(valid, calculator.calculate_all()):
+                results[index] = result
+
+        return jsonify({"results": results}), 200
+    except Exception as e:
+        return error_response(e)
+
+def lookup_cached_plan(data):
+    """Return (cache_key, cached_text) for a whole-plan request; both are None when sections are cached instead"""
+    if plan_prewarmer is not None:
+        plan_prewarmer.record(data)
+    return lookup_plan(plan_cache, data, sectioned=section_generator is not None, bucketing=Config.PLAN_CACHE_BUCKETING)
+
+def save_structured_plan(data, plan, plan_file, cached=False):
+    """Record the plan in the plan index and fitness_plans when the request is made for a user"""
+    user_id = data.get('userId')
+    if not user_id:
+        return None
+    try:
+        plan_index.record(user_id, plan_file, input_hash=request_fingerprint(data), metrics=data.get('metrics'),
+                          plan=plan.to_record(), cached=cached)
+    except Exception as e:
+        print(f"Warning: could not index plan for user {user_id}: {e}")
+    try:
+        return data_access.save_plan(user_id, dict(plan.to_record(), planFile=plan_file))
+    except Exception as e:
+        # The PDF is already rendered; a failed save shouldn't fail the request
+        print(f"Warning: could not save plan for user {user_id}: {e}")
+        return None
+
+def create_plan(data, stage=None):
+    """
+    Run prompt -> LLM -> PDF for a plan request and return the response body
+
+    stage is an optional callable returning a context manager per stage name,
+    used by the job queue to time each step.
+    """
+    job_stage = stage or (lambda name: nullcontext())
+
+    @contextmanager
+    def stage(name):
+        # Every stage feeds the metrics; job requests also record it on the job
+        with metrics.span(name), job_stage(name):
+            yield
+
+    user_name = data.get('name', 'User')
+
+    with stage("cache"):
+        cache_key, cached_text = lookup_cached_plan(data)
+
+    regenerated = []
+    if cached_text is not None:
+        response_text = personalize(cached_text, user_name)
+    elif section_generator is not None:
+        # Sections are generated in parallel, reusing any whose inputs are unchanged
+        with stage("llm"):
+            response_text, regenerated = section_generator.generate(data)
+    else:
+        with stage("prompt"):
+            prompt = build_plan_prompt(data)
+
+        # Generate the response using Ollama
+        with stage("llm"):
+            response_text = generate_with_ollama(prompt)
+        regenerated = ["plan"]
+
+        if cache_key is not None:
+            plan_cache.store(cache_key, response_text, user_name)
+
+    # Parse the text once; the PDF and the saved plan both use the structure
+    with stage("parse"):
+        plan = parse_plan(response_text)
+
+    # Generate PDF with the response
+    with stage("pdf"):
+        pdf_filename = generate_pdf(plan, user_name, data.get('metrics', {}), data.get('age'))
+
+    with stage("save"):
+        save_structured_plan(data, plan, pdf_filename, cached=cached_text is not None)
+
+    # Return macros, the structured plan and download link for the PDF
+    return {
+        "macros": data.get('metrics', {}).get('macros', {}),
+        "plan": plan.to_dict(),
+        "planFile": pdf_filename,
+        "cached": cached_text is not None,
+        "regeneratedSections": regenerated
+    }
+
+# Admission control in front of every plan generation: per-client rate limits,
+# a concurrency cap sized to the LLM backends and deduplication of identical requests
+admission = AdmissionController(
+    Config.get_admission_capacity(),
+    max_queue=Config.ADMISSION_MAX_QUEUE,
+    queue_timeout=Config.ADMISSION_QUEUE_TIMEOUT,
+    limiter=TokenBucketLimiter(
+        Config.RATE_LIMIT_PER_MINUTE,
+        Config.RATE_LIMIT_BURST,
+        store=create_bucket_store(Config.RATE_LIMIT_STORE, Config.RATE_LIMIT_REDIS_URL)
+    ),
+    retry_after=Config.ADMISSION_RETRY_AFTER
+)
+
+def client_key():
+    """Rate limit key: the client address, since user IDs in the request are not authenticated"""
+    return f"ip:{request.remote_addr}"
+
+def admission_response(e):
+    response = jsonify({"error": str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, e.status
+
+# Controller whose slots the plan jobs take; the ASGI server replaces it with its
+# own so jobs and live requests share one cap
+job_admission = admission
+
+def run_plan_job(data, stage):
+    # Jobs are already queued, so they wait for a slot instead of being shed
+    with job_admission.slot(background=True):
+        return create_plan(data, stage)
+
+# Background worker pool for job-based plan generation
+plan_jobs = JobQueue(run_plan_job, workers=Config.PLAN_JOB_WORKERS, max_queue=Config.PLAN_JOB_QUEUE_SIZE)
+
+def prewarm_units(data):
+    """(cache_key, generate) for each plan cache entry the plan for data misses"""
+    if section_generator is not None:
+        return [(cache_key, partial(section_generator.generate_section, section, data, cache_key))
+                for section, cache_key in section_generator.missing_sections(data)]
+    cache_key = plan_cache_key(data, bucketing=Config.PLAN_CACHE_BUCKETING)
+    if plan_cache.contains(cache_key):
+        return []
+
+    def generate():
+        return plan_cache.store(cache_key, generate_with_ollama(build_plan_prompt(data)), data['name'])
+    return [(cache_key, generate)]
+
+# Generates plans for the most requested profiles during off-peak hours, only
+# while no live generation is running, so matching requests hit the plan cache
+plan_prewarmer = None
+if plan_cache is not None and Config.PREWARM_ENABLED:
+    plan_prewarmer = PlanPrewarmer(
+        prewarm_units,
+        ProfileTracker(window=Config.PREWARM_WINDOW, max_samples=Config.PREWARM_MAX_SAMPLES, bucketing=Config.PLAN_CACHE_BUCKETING),
+        hours=Config.PREWARM_HOURS,
+        budget=Config.PREWARM_BUDGET,
+        max_concurrent=Config.PREWARM_MAX_CONCURRENT,
+        max_live=Config.PREWARM_MAX_LIVE,
+        min_requests=Config.PREWARM_MIN_REQUESTS,
+        interval=Config.PREWARM_INTERVAL
+    )
+    plan_prewarmer.add_load_source(lambda: admission.in_flight + admission.queued + plan_jobs.depth())
+    plan_prewarmer.start()
+
+metrics.gauge("plan_jobs_queued", "Plan jobs waiting for a worker", plan_jobs.depth)
+metrics.gauge("admission_in_flight", "Plan generations holding an admission slot", lambda: admission.in_flight)
+metrics.gauge("admission_queued", "Plan requests waiting for an admission slot", lambda: admission.queued)
+metrics.gauge("data_cache_entries", "Entries in the user and plan read cache", lambda: data_access.stats()["entries"])
+metrics.gauge("plan_cache_hit_rate", "Plan cache hit rate", lambda: plan_cache.stats()["hitRate"] if plan_cache else None)
+
+@app.route('/api/generate-plan', methods=['POST'])
+def generate_plan():
+    try:
+        data = request.json
+        body = admission.run(client_key(), lambda: create_plan(data), dedup_key=request_fingerprint(data))
+        return jsonify(body), 200
+    except AdmissionError as e:
+        return admission_response(e)
+    except LLMUnavailableError as e:
+        response = jsonify({"error": str(e)})
+        if e.retry_after:
+            response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/generate-plan/stream', methods=['POST'])
+def generate_plan_stream():
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+
+    # Admitted up front so a rejection is a plain 429/503, not an error event;
+    # the slot is held until the stream is closed
+    try:
+        admission.check_rate(client_key())
+        admission.acquire()
+    except AdmissionError as e:
+        return admission_response(e)
+
+    def events():
+        try:
+            user_name = data.get('name', 'User')
+            cache_key, cached_text = lookup_cached_plan(data)
+            parser = StructuredPlanParser()
+            parts = []
+
+            if cached_text is not None:
+                chunks = [personalize(cached_text, user_name)]
+            elif section_generator is not None:
+                chunks = (("\n\n" if index else "") + text
+                          for index, (_, text, _) in enumerate(section_generator.iter_sections(data)))
+            else:
+                chunks = stream_with_ollama(build_plan_prompt(data))
+
+            # Forward each section, parsed, as soon as the next heading closes it
+            for text in chunks:
+                parts.append(text)
+                for section, body in parser.feed(text):
+                    yield sse_event("section", {"heading": section.heading, "text": body, "section": section.to_dict()})
+            for section, body in parser.flush():
+                yield sse_event("section", {"heading": section.heading, "text": body, "section": section.to_dict()})
+
+            response_text = "".join(parts).lstrip('\n')
+            if cached_text is None and cache_key is not None:
+                plan_cache.store(cache_key, response_text, user_name)
+
+            with metrics.span("pdf"):
+                pdf_filename = generate_pdf(parser.plan, user_name, data.get('metrics', {}), data.get('age'))
+            save_structured_plan(data, parser.plan, pdf_filename, cached=cached_text is not None)
+            yield sse_event("done", {
+                "macros": data.get('metrics', {}).get('macros', {}),
+                "planFile": pdf_filename,
+                "cached": cached_text is not None
+            })
+        except Exception as e:
+            http_errors.inc('/api/generate-plan/stream', type(e).__name__)
+            yield sse_event("error", {"error": str(e)})
+
+    response = Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    response.call_on_close(admission.release)
+    return response
+
+@app.route('/api/generate-plan/jobs', methods=['POST'])
+def submit_plan_job():
+    try:
+        data = request.json
+        admission.check_rate(client_key())
+        job = plan_jobs.submit(data)
+    except AdmissionError as e:
+        return admission_response(e)
+    except QueueFullError as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = str(Config.PLAN_JOB_RETRY_AFTER)
+        return response, 429
+    except Exception as e:
+        return error_response(e)
+
+    response = jsonify(job.to_dict())
+    response.headers['Location'] = f"/api/generate-plan/jobs/{job.id}"
+    return response, 202
+
+@app.route('/api/generate-plan/jobs/<job_id>', methods=['GET'])
+def get_plan_job(job_id):
+    job = plan_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/api/generate-plan/jobs/<job_id>/file', methods=['GET'])
+def download_plan_job_file(job_id):
+    job = plan_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status == JOB_FAILED:
+        return jsonify(job.to_dict()), 500
+    if job.status != JOB_DONE:
+        return jsonify(job.to_dict()), 202
+    return send_plan_file(job.result["planFile"])
+
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.expose(), mimetype='text/plain; version=0.0.4')
+
+def admin_error():
+    """
+    Error response unless the request carries the ADMIN_TOKEN bearer token
+
+    Admin routes are switched off while ADMIN_TOKEN is unset; their settings
+    then only come from the environment.
+    """
+    if not Config.ADMIN_TOKEN:
+        return jsonify({"error": "Admin endpoints are disabled, set ADMIN_TOKEN to enable them"}), 403
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), Config.ADMIN_TOKEN.encode()):
+        return jsonify({"error": "Admin token required"}), 401
+    return None
+
+@app.route('/api/metrics/profiler', methods=['GET', 'POST'])
+def slow_request_profiler():
+    # Stacks expose code paths and settings can slow every request, so both need the admin token
+    denied = admin_error()
+    if denied is not None:
+        return denied
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object"}), 400
+        try:
+            profiler.configure(enabled=data.get('enabled'), threshold=data.get('threshold'), interval=data.get('interval'))
+        except (TypeError, ValueError) as e:
+            return error_response(e, 400)
+    return jsonify(profiler.stats()), 200
+
+@app.route('/api/calculate/stats', methods=['GET'])
+def calculate_cache_stats():
+    info = cached_metrics.cache_info()
+    return jsonify({"hits": info.hits, "misses": info.misses, "entries": info.currsize, "maxEntries": info.maxsize}), 200
+
+@app.route('/api/llm/stats', methods=['GET'])
+def llm_stats():
+    return jsonify(llm_client.stats()), 200
+
+@app.route('/api/admission/stats', methods=['GET'])
+def admission_stats():
+    return jsonify(admission.stats()), 200
+
+@app.route('/api/plan-cache/stats', methods=['GET'])
+def plan_cache_stats():
+    if plan_cache is None:
+        return jsonify({"enabled": False}), 200
+    stats = {"enabled": True, **plan_cache.stats()}
+    if section_generator is not None:
+        stats["sections"] = section_generator.stats()
+    return jsonify(stats), 200
+
+@app.route('/api/plan-prewarm/stats', methods=['GET'])
+def plan_prewarm_stats():
+    if plan_prewarmer is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **plan_prewarmer.stats()}), 200
+
+@app.route('/api/plan-storage/stats', methods=['GET'])
+def plan_storage_stats():
+    return jsonify(plan_gc.stats()), 200
+
+@app.route('/api/plan-file/<filename>', methods=['GET'])
+def download_plan_file(filename):
+    return send_plan_file(filename)
+
+@app.route('/api/plan-index/stats', methods=['GET'])
+def plan_index_stats():
+    return jsonify(plan_index.stats()), 200
+
+@app.route('/api/progress/stats', methods=['GET'])
+def progress_stats():
+    return jsonify(measurement_store.stats()), 200
+
+@app.route('/api/data/stats', methods=['GET'])
+def data_access_stats():
+    return jsonify(data_access.stats()), 200
+
+@app.route('/api/user', methods=['POST'])
+def create_user():
+    try:
+        data = request.json
+        result = data_access.create_user(data)
+        return jsonify(result), 201
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/users/batch', methods=['POST'])
+def create_users():
+    try:
+        users = request.json
+        if not isinstance(users, list):
+            return jsonify({"error": "Expected a JSON array of users"}), 400
+        result = data_access.create_users(users)
+        return jsonify(result), 201
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/users', methods=['GET'])
+def get_users():
+    try:
+        user_ids = [user_id for user_id in request.args.get('ids', '').split(',') if user_id]
+        if not user_ids:
+            return jsonify({"error": "Missing ids query parameter"}), 400
+        result = data_access.get_users(user_ids)
+        return jsonify(result), 200
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/user/<user_id>', methods=['GET'])
+def get_user(user_id):
+    try:
+        result = data_access.get_user(user_id)
+        if result:
+            return jsonify(result), 200
+        return jsonify({"error": "User not found"}), 404
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/user/<user_id>', methods=['PUT'])
+def update_user(user_id):
+    try:
+        data = request.json
+        result = data_access.update_user(user_id, data)
+        return jsonify(result), 200
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/plan/<user_id>', methods=['POST'])
+def save_plan(user_id):
+    try:
+        data = request.json
+        result = data_access.save_plan(user_id, data)
+        return jsonify(result), 201
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/plans/batch', methods=['POST'])
+def save_plans():
+    try:
+        plans = request.json
+        if not isinstance(plans, list) or not all(isinstance(plan, dict) and plan.get("user_id") for plan in plans):
+            return jsonify({"error": "Expected a JSON array of plans, each with a user_id"}), 400
+        result = data_access.save_plans(plans)
+        return jsonify(result), 201
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/plan/<user_id>', methods=['GET'])
+def get_plan(user_id):
+    try:
+        result = data_access.get_plan(user_id)
+        if result:
+            return jsonify(result), 200
+        return jsonify({"error": "Plan not found"}), 404
+    except Exception as e:
+        return error_response(e)
+
+def plan_history_response(user_id, start=None, end=None):
+    """A page of the user's indexed plans, newest first, continued with ?cursor="""
+    try:
+        rows, next_cursor = plan_index.history(
+            user_id,
+            limit=int(request.args.get('limit', 20)),
+            cursor=request.args.get('cursor'),
+            start=start,
+            end=end
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"plans": rows, "nextCursor": next_cursor}), 200
+
+@app.route('/api/plan/<user_id>/history', methods=['GET'])
+def get_plan_history(user_id):
+    try:
+        return plan_history_response(user_id)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/plan/<user_id>/range', methods=['GET'])
+def get_plan_range(user_id):
+    try:
+        from database.sqlite_store import parse_time
+        start, end = request.args.get('start'), request.args.get('end')
+        if start is None and end is None:
+            return jsonify({"error": "Expected start and/or end"}), 400
+        try:
+            start = parse_time(start) if start is not None else None
+            end = parse_time(end) if end is not None else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return plan_history_response(user_id, start, end)
+    except Exception as e:
+        return error_response(e)
+
+if __name__ == '__main__':
     app.run(debug=True, port=5000) 
\ No newline at end of file
@@ -0,0 +1,374 @@
+"""
+ASGI serving mode for the API
+
+Plan generation, LLM streaming and the user/plan routes are served by
+coroutines: waiting on Ollama holds no thread, PDF rendering goes to the
+render pool and blocking Supabase, cache and file I/O run in worker threads.
+Every other route is passed through to the Flask app unchanged. Run with:
+    uvicorn api.asgi:app --port 5000
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from api import app as flask_api
+from api.admission import AdmissionError, request_fingerprint
+from api.async_admission import AsyncAdmissionController
+from api.plan_cache import personalize
+from api.plan_sections import build_plan_prompt
+from api.plan_storage import staging_basename
+from api.plan_structure import StructuredPlanParser, parse_plan
+from api.streaming import ThinkFilter, strip_think, sse_event
+from utils.config import Config
+from utils.lazy import LazyComponent
+from utils.llm_errors import LLMUnavailableError
+from utils.metrics import metrics
+
+
+def create_llm_client():
+    from utils.async_llm_client import AsyncLLMRouter
+    return AsyncLLMRouter.from_config(Config)
+
+llm_client = LazyComponent("llm", create_llm_client)
+
+# Same limits as the Flask app; the token buckets are shared with it
+admission = AsyncAdmissionController(
+    Config.get_admission_capacity(),
+    max_queue=Config.ADMISSION_MAX_QUEUE,
+    queue_timeout=Config.ADMISSION_QUEUE_TIMEOUT,
+    limiter=flask_api.admission.limiter,
+    retry_after=Config.ADMISSION_RETRY_AFTER
+)
+
+# Plan jobs, served by the Flask app, take their slots here too, so live
+# requests and jobs together stay within one capacity
+flask_api.job_admission = admission
+
+# Speculative generation pauses for live traffic on either server
+if flask_api.plan_prewarmer is not None:
+    flask_api.plan_prewarmer.add_load_source(lambda: admission.in_flight + admission.queued)
+
+CORS_HEADERS = {"Access-Control-Allow-Origin": "*", "Access-Control-Expose-Headers": "Retry-After"}
+
+
+def json_response(body, status=200, headers=None):
+    return JSONResponse(body, status_code=status, headers={**CORS_HEADERS, **(headers or {})})
+
+
+def instrumented(route):
+    """Record the same request metrics as the Flask hooks for a coroutine handler"""
+    def decorator(handler):
+        async def wrapper(request):
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except Exception as e:
+                flask_api.http_errors.inc(route, type(e).__name__)
+                return json_response({"error": str(e)}, 500)
+            finally:
+                flask_api.http_requests.inc(request.method, route, str(status))
+                flask_api.http_duration.observe(time.perf_counter() - start, request.method, route)
+        return wrapper
+    return decorator
+
+
+def client_key(request):
+    """Rate limit key: the client address, as in the Flask app"""
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def admission_response(e):
+    return json_response({"error": str(e)}, e.status, {"Retry-After": str(e.retry_after)})
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def generate_text(prompt, options=None):
+    start = time.perf_counter()
+    response = await llm_client.generate(prompt, options)
+    metrics.observe_generation(response, time.perf_counter() - start)
+    return strip_think(response["response"])
+
+
+async def generate_section_text(prompt):
+    return await generate_text(prompt, flask_api.section_options)
+
+
+async def stream_text(prompt):
+    """Yield completion text from the streamed generation with <think> blocks removed"""
+    think_filter = ThinkFilter()
+    start = time.perf_counter()
+    async for chunk in llm_client.stream(prompt):
+        if chunk.get("done"):
+            metrics.observe_generation(chunk, time.perf_counter() - start)
+        text = think_filter.feed(chunk.get("response", ""))
+        if text:
+            yield text
+    text = think_filter.flush()
+    if text:
+        yield text
+
+
+async def render_plan(content, user_name, plan_metrics, age):
+    """Render the PDF off the event loop and move it into plan storage"""
+    render_pool = flask_api.render_pool
+    plan_storage = flask_api.plan_storage
+    basename = staging_basename()
+    if render_pool.inline:
+        staged = await asyncio.to_thread(render_pool.render, content, user_name, plan_metrics, age, basename)
+    else:
+        staged = await asyncio.wrap_future(render_pool.submit(content, user_name, plan_metrics, age, basename))
+    path = os.path.join(plan_storage.staging_dir, staged)
+    flask_api.plan_file_bytes.observe(os.path.getsize(path), os.path.splitext(staged)[1].lstrip('.'))
+    return await asyncio.to_thread(plan_storage.put_file, path)
+
+
+async def create_plan(data):
+    """Coroutine version of api.app.create_plan"""
+    user_name = data.get('name', 'User')
+    section_generator = flask_api.section_generator
+
+    with metrics.span("cache"):
+        cache_key, cached_text = await asyncio.to_thread(flask_api.lookup_cached_plan, data)
+
+    regenerated = []
+    if cached_text is not None:
+        response_text = personalize(cached_text, user_name)
+    elif section_generator is not None:
+        with metrics.span("llm"):
+            response_text, regenerated = await section_generator.generate_async(data, generate_section_text)
+    else:
+        with metrics.span("llm"):
+            response_text = await generate_text(build_plan_prompt(data))
+        regenerated = ["plan"]
+
+        if cache_key is not None:
+            await asyncio.to_thread(flask_api.plan_cache.store, cache_key, response_text, user_name)
+
+    with metrics.span("parse"):
+        plan = parse_plan(response_text)
+
+    with metrics.span("pdf"):
+        pdf_filename = await render_plan(plan, user_name, data.get('metrics', {}), data.get('age'))
+
+    with metrics.span("save"):
+        await asyncio.to_thread(flask_api.save_structured_plan, data, plan, pdf_filename, cached_text is not None)
+
+    return {
+        "macros": data.get('metrics', {}).get('macros', {}),
+        "plan": plan.to_dict(),
+        "planFile": pdf_filename,
+        "cached": cached_text is not None,
+        "regeneratedSections": regenerated
+    }
+
+
+@instrumented('/api/health')
+async def health_check(request):
+    return json_response({"status": "ok", "message": "API is running", "server": "asgi"})
+
+
+@instrumented('/api/calculate')
+async def calculate(request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return json_response({"error": "Expected a JSON object"}, 400)
+    if not all([data.get('age'), data.get('weight'), data.get('height'), data.get('waist'), data.get('neck')]):
+        return json_response({"error": "Missing required fields"}, 400)
+    # A few microseconds of arithmetic, cheaper inline than a hop to an executor
+    results = flask_api.cached_metrics(
+        float(data['age']), float(data['weight']), float(data['height']), float(data['waist']), float(data['neck']),
+        data.get('gender', 'male').lower(), data.get('activityLevel', 'moderate').lower(), data.get('goal', 'maintenance').lower()
+    )
+    return json_response(results)
+
+
+@instrumented('/api/generate-plan')
+async def generate_plan(request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return json_response({"error": "Expected a JSON object"}, 400)
+    try:
+        body = await admission.run(client_key(request), lambda: create_plan(data), dedup_key=request_fingerprint(data))
+        return json_response(body)
+    except AdmissionError as e:
+        return admission_response(e)
+    except LLMUnavailableError as e:
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        return json_response({"error": str(e)}, 503, headers)
+
+
+@instrumented('/api/generate-plan/stream')
+async def generate_plan_stream(request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return json_response({"error": "Expected a JSON object"}, 400)
+
+    # Admitted up front, so a full server still answers 503; events() gives the slot back however the stream ends
+    try:
+        admission.check_rate(client_key(request))
+        await admission.acquire()
+    except AdmissionError as e:
+        return admission_response(e)
+
+    async def events():
+        try:
+            user_name = data.get('name', 'User')
+            section_generator = flask_api.section_generator
+            cache_key, cached_text = await asyncio.to_thread(flask_api.lookup_cached_plan, data)
+            parser = StructuredPlanParser()
+            parts = []
+
+            async def chunks():
+                if cached_text is not None:
+                    yield personalize(cached_text, user_name)
+                elif section_generator is not None:
+                    index = 0
+                    async for _, text, _ in section_generator.iter_sections_async(data, generate_section_text):
+                        yield ("\n\n" if index else "") + text
+                        index += 1
+                else:
+                    async for text in stream_text(build_plan_prompt(data)):
+                        yield text
+
+            async for text in chunks():
+                parts.append(text)
+                for section, body in parser.feed(text):
+                    yield sse_event("section", {"heading": section.heading, "text": body, "section": section.to_dict()})
+            for section, body in parser.flush():
+                yield sse_event("section", {"heading": section.heading, "text": body, "section": section.to_dict()})
+
+            response_text = "".join(parts).lstrip('\n')
+            if cached_text is None and cache_key is not None:
+                await asyncio.to_thread(flask_api.plan_cache.store, cache_key, response_text, user_name)
+
+            with metrics.span("pdf"):
+                pdf_filename = await render_plan(parser.plan, user_name, data.get('metrics', {}), data.get('age'))
+            await asyncio.to_thread(flask_api.save_structured_plan, data, parser.plan, pdf_filename, cached_text is not None)
+            yield sse_event("done", {
+                "macros": data.get('metrics', {}).get('macros', {}),
+                "planFile": pdf_filename,
+                "cached": cached_text is not None
+            })
+        except Exception as e:
+            flask_api.http_errors.inc('/api/generate-plan/stream', type(e).__name__)
+            yield sse_event("error", {"error": str(e)})
+        finally:
+            # Also runs when sending fails or the client disconnects and the stream is cancelled;
+            # shielded so the cancellation can't interrupt the release itself
+            await asyncio.shield(admission.release())
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={**CORS_HEADERS, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@instrumented('/api/llm/stats')
+async def llm_stats(request):
+    return json_response(llm_client.stats())
+
+
+@instrumented('/api/admission/stats')
+async def admission_stats(request):
+    return json_response(admission.stats())
+
+
+# Users and plans: the data access layer is blocking, so its calls run in worker threads
+
+@instrumented('/api/user')
+async def create_user(request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return json_response({"error": "Expected a JSON object"}, 400)
+    result = await asyncio.to_thread(flask_api.data_access.create_user, data)
+    return json_response(result, 201)
+
+
+@instrumented('/api/user/<user_id>')
+async def user(request):
+    user_id = request.path_params['user_id']
+    if request.method == 'PUT':
+        data = await read_json(request)
+        if not isinstance(data, dict):
+            return json_response({"error": "Expected a JSON object"}, 400)
+        result = await asyncio.to_thread(flask_api.data_access.update_user, user_id, data)
+        return json_response(result)
+    result = await asyncio.to_thread(flask_api.data_access.get_user, user_id)
+    if result:
+        return json_response(result)
+    return json_response({"error": "User not found"}, 404)
+
+
+@instrumented('/api/plan/<user_id>')
+async def plan(request):
+    user_id = request.path_params['user_id']
+    if request.method == 'POST':
+        data = await read_json(request)
+        if not isinstance(data, dict):
+            return json_response({"error": "Expected a JSON object"}, 400)
+        result = await asyncio.to_thread(flask_api.data_access.save_plan, user_id, data)
+        return json_response(result, 201)
+    result = await asyncio.to_thread(flask_api.data_access.get_plan, user_id)
+    if result:
+        return json_response(result)
+    return json_response({"error": "Plan not found"}, 404)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # uvicorn only starts accepting connections once the WARM_UP components are ready
+    await asyncio.to_thread(flask_api.warm_up.wait)
+    admission.bind(asyncio.get_running_loop())
+    if "llm" in flask_api.warm_up.names:
+        llm_client.get()
+    try:
+        yield
+    finally:
+        if flask_api.plan_prewarmer is not None:
+            flask_api.plan_prewarmer.stop()
+        if llm_client.initialized:
+            await llm_client.aclose()
+        if flask_api.render_pool.initialized:
+            await asyncio.to_thread(flask_api.render_pool.shutdown)
+        if flask_api.plan_index.initialized:
+            flask_api.plan_index.close()
+        if flask_api.measurement_store.initialized:
+            flask_api.measurement_store.close()
+
+
+routes = [
+    Route('/api/health', health_check, methods=['GET']),
+    Route('/api/calculate', calculate, methods=['POST']),
+    Route('/api/generate-plan', generate_plan, methods=['POST']),
+    Route('/api/generate-plan/stream', generate_plan_stream, methods=['POST']),
+    Route('/api/llm/stats', llm_stats, methods=['GET']),
+    Route('/api/admission/stats', admission_stats, methods=['GET']),
+    Route('/api/user', create_user, methods=['POST']),
+    Route('/api/user/{user_id}', user, methods=['GET', 'PUT']),
+    Route('/api/plan/{user_id}', plan, methods=['GET', 'POST']),
+    # Everything else, including CORS preflights, is served by the Flask app
+    Mount('/', app=WSGIMiddleware(flask_api.app))
+]
+
+app = Starlette(routes=routes, lifespan=lifespan)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port=Config.PORT)
@@ -0,0 +1,82 @@
+import asyncio
+from contextlib import contextmanager
+
+from api.admission import AdmissionController
+
+
+class AsyncAdmissionController(AdmissionController):
+    """
+    AdmissionController for the event loop: requests wait for a slot on an
+    asyncio.Condition and duplicates await the first request's task
+    """
+
+    def __init__(self, max_concurrent, max_queue=32, queue_timeout=30, limiter=None, retry_after=10):
+        super().__init__(max_concurrent, max_queue=max_queue, queue_timeout=queue_timeout,
+                         limiter=limiter, retry_after=retry_after)
+        self._slot_freed = None
+        self._tasks = {}
+        self._loop = None
+
+    def bind(self, loop):
+        """Let threads outside loop, such as the job workers, take slots through slot()"""
+        self._loop = loop
+
+    async def acquire(self, background=False):
+        if self._slot_freed is None:
+            self._slot_freed = asyncio.Condition()
+        async with self._slot_freed:
+            if self.in_flight >= self.max_concurrent:
+                if not background and self.queued >= self.max_queue:
+                    raise self._shed("Plan generation is at capacity")
+                self._outcomes.inc("queued")
+                waiting = 0 if background else 1
+                self.queued += waiting
+                try:
+                    await asyncio.wait_for(
+                        self._slot_freed.wait_for(lambda: self.in_flight < self.max_concurrent),
+                        None if background else self.queue_timeout
+                    )
+                except asyncio.TimeoutError:
+                    raise self._shed("Timed out waiting for a plan generation slot")
+                finally:
+                    self.queued -= waiting
+            self.in_flight += 1
+            self._outcomes.inc("admitted")
+
+    async def release(self):
+        async with self._slot_freed:
+            self.in_flight -= 1
+            self._slot_freed.notify()
+
+    @contextmanager
+    def slot(self, background=False):
+        """Hold a slot from a worker thread, so its work counts against the same cap as the event loop's"""
+        if self._loop is None:
+            raise RuntimeError("AsyncAdmissionController.slot() needs bind() to be called first")
+        asyncio.run_coroutine_threadsafe(self.acquire(background), self._loop).result()
+        try:
+            yield
+        finally:
+            asyncio.run_coroutine_threadsafe(self.release(), self._loop).result()
+
+    async def run(self, client, fn, dedup_key=None):
+        """Coroutine version of run(); fn is an async callable"""
+        self.check_rate(client)
+
+        async def admitted():
+            await self.acquire()
+            try:
+                return await fn()
+            finally:
+                await self.release()
+
+        if dedup_key is None:
+            return await admitted()
+        # Shielded, so a client that disconnects doesn't cancel a generation others are waiting on
+        task = self._tasks.get(dedup_key)
+        if task is not None:
+            self._outcomes.inc("deduplicated")
+            return await asyncio.shield(task)
+        task = self._tasks[dedup_key] = asyncio.ensure_future(admitted())
+        task.add_done_callback(lambda _: self._tasks.pop(dedup_key, None))
+        return await asyncio.shield(task)
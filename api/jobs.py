@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class Job:
+    def __init__(self, payload):
+        """A single unit of work tracked by the JobQueue"""
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = JOB_QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Seconds spent in each stage, in the order the stages ran
+        self.timings = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        """Time a named stage of the job"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - start, 4)
+
+    def to_dict(self):
+        """Public view of the job for the status endpoint"""
+        job = {
+            "jobId": self.id,
+            "status": self.status,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "timings": dict(self.timings)
+        }
+        if self.status == JOB_DONE:
+            job["result"] = self.result
+        if self.status == JOB_FAILED:
+            job["error"] = self.error
+        return job
+
+
+class JobQueue:
+    def __init__(self, handler, workers=2, max_queue=100, max_finished=1000):
+        """
+        Bounded worker pool that runs handler(payload, stage) for submitted jobs
+
+        Parameters:
+        - handler: callable taking the job payload and a stage timer, returning the result
+        - workers: number of worker threads
+        - max_queue: jobs allowed to wait before submit() raises QueueFullError
+        - max_finished: finished jobs kept for polling before the oldest are dropped
+        """
+        self.handler = handler
+        self.workers = workers
+        self.max_finished = max_finished
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start(self):
+        """Start the worker threads on first use"""
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"plan-job-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, payload):
+        """Queue a job and return it, or raise QueueFullError when the queue is full"""
+        self._start()
+        job = Job(payload)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFullError("Plan generation queue is full, try again later")
+        return job
+
+    def get(self, job_id):
+        """Look up a job by id"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self):
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+            job.timings["queued"] = round(job.started_at - job.created_at, 4)
+            try:
+                job.result = self.handler(job.payload, job.stage)
+                job.status = JOB_DONE
+            except Exception as e:
+                job.error = str(e)
+                job.status = JOB_FAILED
+            finally:
+                job.finished_at = time.time()
+                job.payload = None
+                self._queue.task_done()
+                self._prune()
+
+    def _prune(self):
+        """Drop the oldest finished jobs once more than max_finished are kept"""
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.status in (JOB_DONE, JOB_FAILED)]
+            for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[job_id]
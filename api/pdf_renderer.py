@@ -0,0 +1,247 @@
+import os
+import time
+from functools import lru_cache
+from itertools import repeat
+
+from fpdf import FPDF
+from fpdf.fonts import fpdf_charwidths
+
+from api.plan_structure import StructuredPlan, parse_plan
+
+# Replacements for characters the built-in PDF fonts cannot encode
+CLEAN_TEXT_TABLE = str.maketrans({
+    '\u2018': "'", '\u2019': "'",
+    '\u201c': '"', '\u201d': '"',
+    '\u2013': '-', '\u2014': '-',
+    '\u2022': '*'
+})
+
+SENIOR_NOTE_TITLE = "Important Note for Seniors:"
+SENIOR_NOTE_LINES = (
+    "Since you are 50 or older, please consider the following:",
+    "- Always consult with your healthcare provider before starting any new exercise program.",
+    "- Begin each workout with a longer warm-up (10-15 minutes) to properly prepare your joints and muscles.",
+    "- Focus on proper form rather than intensity or weight.",
+    "- Consider aquatic exercises which are lower impact on joints.",
+    "- Listen to your body and rest when needed. Recovery may take longer as we age.",
+    "- If you feel pain (not just muscle fatigue), stop the exercise immediately."
+)
+
+
+def clean_text(text):
+    """Replace curly quotes, dashes and bullets with characters the PDF fonts support"""
+    return text.translate(CLEAN_TEXT_TABLE)
+
+
+def as_plan(content):
+    """A StructuredPlan as is, or plan text parsed into one"""
+    return content if isinstance(content, StructuredPlan) else parse_plan(content)
+
+
+def metrics_lines(metrics):
+    """The lines of the health metrics summary, shared by the PDF and text renderers"""
+    macros = metrics.get('macros', {})
+    return [
+        f"BMI: {metrics.get('bmi', 'N/A')}",
+        f"Body Fat: {metrics.get('bodyFatPercentage', 'N/A')}%",
+        f"BMR: {metrics.get('bmr', 'N/A')} calories/day",
+        f"TDEE: {metrics.get('tdee', 'N/A')} calories/day",
+        f"Goal Calories: {metrics.get('goalCalories', 'N/A')} calories/day",
+        f"Macros: Protein: {macros.get('protein', 'N/A')}g | Carbs: {macros.get('carbs', 'N/A')}g | Fat: {macros.get('fat', 'N/A')}g"
+    ]
+
+
+@lru_cache(maxsize=8192)
+def wrap_line(text, font_key, font_size, wmax):
+    """
+    Split one line into the segments FPDF.multi_cell would produce with align='J'
+
+    Returns a tuple of (segment, word_spacing) pairs. word_spacing is None for
+    segments that are not justified. Results are cached, so repeated lines and
+    static fragments are only measured once across requests.
+    """
+    cw = fpdf_charwidths[font_key]
+    # Fast path: most plan lines fit on one line
+    if sum(map(cw.get, text, repeat(0))) <= wmax:
+        return ((text, None),)
+
+    segments = []
+    nb = len(text)
+    sep = -1
+    i = j = 0
+    width = line_width = 0
+    spaces = 0
+    while i < nb:
+        c = text[i]
+        if c == ' ':
+            sep = i
+            line_width = width
+            spaces += 1
+        width += cw.get(c, 0)
+        if width > wmax:
+            if sep == -1:
+                if i == j:
+                    i += 1
+                segments.append((text[j:i], None))
+            else:
+                word_spacing = (wmax - line_width) / 1000.0 * font_size / (spaces - 1) if spaces > 1 else 0
+                segments.append((text[j:sep], word_spacing))
+                i = sep + 1
+            sep = -1
+            j = i
+            width = 0
+            spaces = 0
+        else:
+            i += 1
+    segments.append((text[j:i], None))
+    return tuple(segments)
+
+
+class PlanRenderer:
+    def __init__(self, output_dir):
+        """
+        Renders fitness plans to PDF, falling back to plain text
+
+        Line wrapping reuses cached font metrics and layouts across requests,
+        and the static senior disclaimer is laid out once per renderer.
+        """
+        self.output_dir = output_dir
+        self._senior_note = None
+
+    def _write_segments(self, pdf, segments, w, h):
+        """
+        Write pre-wrapped segments as FPDF.cell(w, h, segment, 0, 2, 'J') would
+
+        Text operators are built directly and appended to the page in one write.
+        Segments that need a page break go through cell() so FPDF handles the new page.
+        """
+        k = pdf.k
+        x = (pdf.x + pdf.c_margin) * k
+        baseline = .5 * h + .3 * pdf.font_size
+        bulk = not pdf.color_flag and not pdf.underline and not pdf.unifontsubset
+        ops = []
+        for segment, word_spacing in segments:
+            if word_spacing is not None:
+                pdf.ws = word_spacing
+                ops.append('%.3f Tw' % (word_spacing * k))
+            elif pdf.ws > 0:
+                pdf.ws = 0
+                ops.append('0 Tw')
+            if not bulk or pdf.y + h > pdf.page_break_trigger:
+                if ops:
+                    pdf._out('\n'.join(ops))
+                    ops = []
+                pdf.cell(w, h, segment, 0, 2, 'J', 0)
+                continue
+            if segment:
+                ops.append('BT %.2f %.2f Td (%s) Tj ET' % (x, (pdf.h - (pdf.y + baseline)) * k, pdf._escape(segment)))
+            pdf.lasth = h
+            pdf.y += h
+        if ops:
+            pdf._out('\n'.join(ops))
+        pdf.x = pdf.l_margin
+
+    def _senior_note_layout(self, pdf):
+        """Lay out the senior disclaimer once and reuse it for every plan"""
+        if self._senior_note is None:
+            w = pdf.w - pdf.r_margin - pdf.l_margin
+            wmax = (w - 2 * pdf.c_margin) * 1000.0 / pdf.font_size
+            font_key = pdf.font_family + pdf.font_style
+            self._senior_note = (w, [wrap_line(line, font_key, pdf.font_size, wmax) for line in SENIOR_NOTE_LINES])
+        return self._senior_note
+
+    def _write_body(self, pdf, plan):
+        """Write the plan's sections, rendering the body lines between headings in bulk"""
+        w = pdf.w - pdf.r_margin - pdf.l_margin
+        font_key = pdf.font_family + pdf.font_style
+        font_size = pdf.font_size
+        wmax = (w - 2 * pdf.c_margin) * 1000.0 / font_size
+        segments = []
+        for section in plan.sections:
+            for block, text in section.blocks():
+                if block == "text":
+                    segments.extend(wrap_line(clean_text(text.replace('\r', '')), font_key, font_size, wmax))
+                    continue
+                if segments:
+                    self._write_segments(pdf, segments, w, 5)
+                    segments = []
+                if block == "blank":
+                    pdf.ln(3)
+                elif block == "heading":
+                    pdf.ln(5)
+                    pdf.set_font("Arial", "B", 12)
+                    pdf.cell(0, 10, clean_text(text), ln=True)
+                    pdf.set_font("Arial", "", 10)
+                else:
+                    pdf.set_font("Arial", "B", 10)
+                    pdf.cell(0, 7, clean_text(text), ln=True)
+                    pdf.set_font("Arial", "", 10)
+        if segments:
+            self._write_segments(pdf, segments, w, 5)
+
+    def render_pdf(self, content, user_name, metrics, age, filepath):
+        """Render the plan, a StructuredPlan or plan text, as a PDF at filepath"""
+        pdf = FPDF()
+        pdf.add_page()
+
+        # Title
+        pdf.set_font("Arial", "B", 16)
+        pdf.cell(0, 10, f"Personalized Fitness Plan for {clean_text(user_name)}", ln=True, align="C")
+        pdf.ln(5)
+
+        # Metrics Summary
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 10, "Your Health Metrics:", ln=True)
+        pdf.set_font("Arial", "", 10)
+        for line in metrics_lines(metrics):
+            pdf.cell(0, 8, line, ln=True)
+        pdf.ln(5)
+
+        # Content
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 10, "Your Personalized Plan:", ln=True)
+        pdf.set_font("Arial", "", 10)
+        self._write_body(pdf, as_plan(content))
+
+        # Age disclaimer for users over 50
+        if age and int(age) >= 50:
+            pdf.ln(10)
+            pdf.set_font("Arial", "B", 12)
+            pdf.cell(0, 10, SENIOR_NOTE_TITLE, ln=True)
+            pdf.set_font("Arial", "", 10)
+            w, layouts = self._senior_note_layout(pdf)
+            for segments in layouts:
+                self._write_segments(pdf, segments, w, 5)
+
+        # Footer
+        pdf.ln(10)
+        pdf.set_font("Arial", "I", 8)
+        pdf.cell(0, 10, f"Generated on {time.strftime('%Y-%m-%d %H:%M:%S')}", ln=True, align="C")
+
+        pdf.output(filepath)
+
+    def render_text(self, content, user_name, metrics, age, filepath):
+        """Render the plan as a plain text file at filepath"""
+        parts = [f"Personalized Fitness Plan for {user_name}\n\n", "Your Health Metrics:\n"]
+        parts.extend(f"{line}\n" for line in metrics_lines(metrics))
+        parts.append("\n")
+        parts.append(clean_text(as_plan(content).to_text()))
+        if age and int(age) >= 50:
+            parts.append(f"\n\n{SENIOR_NOTE_TITLE}\n")
+            parts.extend(f"{line}\n" for line in SENIOR_NOTE_LINES)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write("".join(parts))
+
+    def render(self, content, user_name, metrics, age, basename):
+        """Render basename.pdf, or basename.txt if the PDF fails, and return the file name"""
+        plan = as_plan(content)
+        filename = f"{basename}.pdf"
+        try:
+            self.render_pdf(plan, user_name, metrics, age, os.path.join(self.output_dir, filename))
+            return filename
+        except Exception as e:
+            print(f"Error generating PDF: {e}")
+            # Fallback to text file if PDF generation fails
+            txt_filename = f"{basename}.txt"
+            self.render_text(plan, user_name, metrics, age, os.path.join(self.output_dir, txt_filename))
+            return txt_filename
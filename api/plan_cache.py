@@ -0,0 +1,329 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Placeholder stored in place of the user's name so cached plans can be re-personalized
+NAME_PLACEHOLDER = "{{USER_NAME}}"
+
+# Bucket sizes used when metric bucketing is enabled
+METRIC_BUCKETS = {
+    "bmi": 0.5,
+    "bodyFatPercentage": 1,
+    "bmr": 50,
+    "tdee": 50,
+    "goalCalories": 50
+}
+MACRO_BUCKET = 5  # grams
+AGE_BUCKET = 5    # years
+
+
+def _bucket(value, size):
+    """Round a numeric value to the nearest bucket, leaving anything else untouched"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    return round(round(value / size) * size, 2)
+
+
+def canonical_inputs(data, bucketing=False):
+    """
+    Normalized view of the request inputs that end up in the plan prompt
+
+    The user's name is left out because cached plans are re-personalized.
+    With bucketing, metrics and age are rounded so near-identical users share a plan.
+    """
+    metrics = data.get('metrics', {}) or {}
+    preferences = data.get('preferences', {}) or {}
+    macros = metrics.get('macros', {}) or {}
+    age = data.get('age')
+
+    key_metrics = {name: metrics.get(name) for name in METRIC_BUCKETS}
+    key_macros = {name: macros.get(name) for name in ('protein', 'carbs', 'fat')}
+    if bucketing:
+        key_metrics = {name: _bucket(value, METRIC_BUCKETS[name]) for name, value in key_metrics.items()}
+        key_macros = {name: _bucket(value, MACRO_BUCKET) for name, value in key_macros.items()}
+        try:
+            age = int(age) // AGE_BUCKET * AGE_BUCKET
+        except (TypeError, ValueError):
+            pass
+
+    return {
+        "goal": str(data.get('goal', 'maintenance')).strip().lower(),
+        "age": age,
+        "metrics": key_metrics,
+        "macros": key_macros,
+        "cuisine": str(preferences.get('cuisine', '')).strip().lower(),
+        "restrictions": str(preferences.get('restrictions', '')).strip().lower(),
+        "medicalConditions": sorted(str(condition).strip().lower() for condition in data.get('medicalConditions', []) or [])
+    }
+
+
+def hash_inputs(canonical):
+    encoded = json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def plan_cache_key(data, bucketing=False):
+    """Canonical hash of the request inputs that end up in the plan prompt"""
+    return hash_inputs(canonical_inputs(data, bucketing))
+
+
+# Names that are also everyday words. They are never replaced by the placeholder,
+# which would put the next user's name where "will" or "may" was written, so a
+# plan that still contains one is not cached at all.
+COMMON_WORD_NAMES = frozenset({
+    "april", "art", "bill", "bob", "chase", "dawn", "drew", "faith", "frank", "gene", "grace", "guy",
+    "hope", "hunter", "jack", "jade", "joy", "june", "mark", "max", "may", "miles", "pat", "penny",
+    "ray", "rich", "river", "rob", "rose", "ruby", "sky", "summer", "sunny", "will"
+})
+
+
+def _names_pattern(names):
+    return re.compile(r'\b(?:' + '|'.join(re.escape(name) for name in names) + r')\b', re.IGNORECASE)
+
+
+def lookup_plan(cache, data, sectioned=False, bucketing=False):
+    """
+    (cache_key, cached_text) of the whole-plan cache entry for a plan request; either may be None
+
+    Plans for users with medical conditions are always generated fresh, and
+    sectioned plans are cached per section, so a whole-plan lookup would
+    only count a miss. Shared by the API and the bulk CLI so both cache alike.
+    """
+    if cache is None or sectioned or data.get('medicalConditions'):
+        return None, None
+    cache_key = plan_cache_key(data, bucketing=bucketing)
+    return cache_key, cache.get(cache_key)
+
+
+def depersonalize(text, user_name):
+    """
+    Replace the user's name with the placeholder before caching
+
+    The full name is replaced first, then each part of it on its own and in
+    any case, so a plan that addresses "John Smith" as "John" or in a "JOHN'S
+    PLAN" heading carries no name to other users. Returns None when a part of
+    the name is left, e.g. one of COMMON_WORD_NAMES; such text must not be cached.
+    """
+    if not user_name or not user_name.strip():
+        return text
+    parts = {part for part in re.findall(r"\w+", user_name) if len(part) > 1}
+    names = sorted({user_name.strip()} | parts, key=len, reverse=True)
+    replaced = [name for name in names if name.lower() not in COMMON_WORD_NAMES]
+    if replaced:
+        text = _names_pattern(replaced).sub(NAME_PLACEHOLDER, text)
+    if parts and _names_pattern(parts).search(text):
+        return None
+    return text
+
+
+def personalize(text, user_name):
+    """Put the requesting user's name back into a cached plan"""
+    return text.replace(NAME_PLACEHOLDER, user_name or "User")
+
+
+class PlanCache:
+    def __init__(self, cache_dir=None, memory_entries=256, ttl=7 * 24 * 3600, max_disk_bytes=256 * 1024 * 1024):
+        """
+        Two-tier cache of generated plan text: an in-memory LRU in front of an on-disk store
+
+        Parameters:
+        - cache_dir: directory for the disk tier, created with the first entry; None keeps the cache memory-only
+        - memory_entries: maximum number of plans kept in memory
+        - ttl: seconds a plan stays valid in either tier
+        - max_disk_bytes: disk tier size above which the oldest files are evicted
+        """
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # Running size of the disk tier, counted by the first scan and kept up to date on writes
+        self._disk_bytes = None
+        self._stats = {
+            "hits": 0,
+            "memoryHits": 0,
+            "diskHits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memoryEvictions": 0,
+            "diskEvictions": 0,
+            "expirations": 0,
+            "nameRejections": 0
+        }
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Return the cached plan text for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, text = entry
+                if now - stored_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memoryHits"] += 1
+                    return text
+                del self._memory[key]
+                self._stats["expirations"] += 1
+
+        text = self._read_disk(key, now)
+        with self._lock:
+            if text is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._stats["diskHits"] += 1
+            self._remember(key, text, now)
+        return text
+
+    def contains(self, key):
+        """Whether key has a valid entry, without counting a lookup or promoting it"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                return True
+        if not self.cache_dir:
+            return False
+        try:
+            return now - os.path.getmtime(self._path(key)) <= self.ttl
+        except OSError:
+            return False
+
+    def set(self, key, text):
+        """Store plan text under key in both tiers"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, text, now)
+            self._stats["stores"] += 1
+        self._write_disk(key, text, now)
+
+    def store(self, key, text, user_name):
+        """
+        Depersonalize plan text for user_name and store it under key
+
+        Returns False, storing nothing, when the name can't be fully removed.
+        """
+        text = depersonalize(text, user_name)
+        if text is None:
+            with self._lock:
+                self._stats["nameRejections"] += 1
+            return False
+        self.set(key, text)
+        return True
+
+    def _remember(self, key, text, stored_at):
+        """Add an entry to the memory tier, evicting the least recently used ones (lock held)"""
+        self._memory[key] = (stored_at, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["memoryEvictions"] += 1
+
+    def _read_disk(self, key, now):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now - entry.get("storedAt", 0) > self.ttl:
+            self._remove(path)
+            with self._lock:
+                self._stats["expirations"] += 1
+            return None
+        return entry.get("text")
+
+    def _write_disk(self, key, text, stored_at):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so readers never see a partial entry
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"storedAt": stored_at, "text": text}, f)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing plan cache entry: {e}")
+            self._remove(tmp_path)
+            return
+
+        # The directory is only scanned once the running total goes over the limit
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += size - replaced
+            scan = self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes
+        if scan:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """
+        Drop expired files, then the oldest ones until the disk tier fits in max_disk_bytes
+
+        Evicts down to 90% of the limit, so a full cache isn't scanned again on
+        the next write, and resets the running total to what the scan found.
+        """
+        now = time.time()
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.ttl:
+                    self._remove(path)
+                    with self._lock:
+                        self._stats["expirations"] += 1
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        files.sort()
+        if total > self.max_disk_bytes:
+            for _, size, path in files:
+                if total <= self.max_disk_bytes * 0.9:
+                    break
+                self._remove(path)
+                total -= size
+                with self._lock:
+                    self._stats["diskEvictions"] += 1
+        with self._lock:
+            self._disk_bytes = total
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        """Counters plus current tier sizes, for sizing the cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memoryEntries"] = len(self._memory)
+            stats["diskBytes"] = self._disk_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hitRate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,348 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from api.plan_cache import canonical_inputs, hash_inputs, personalize
+from api.plan_structure import is_plan_heading
+from utils.metrics import metrics
+
+# Bump when the section prompts change so cached sections are regenerated
+SECTION_PROMPT_VERSION = 2
+
+
+def workout_days(goal):
+    """Workout plan length for a goal"""
+    return 6 if 'muscle' in goal else 3
+
+
+def fat_loss_instruction(goal):
+    if 'fat' in goal or 'loss' in goal or 'weight' in goal:
+        return 'The meal plan MUST be in a calorie deficit based on the user\'s TDEE and goal calories. Meals should be filling, high in protein, and support fat loss.'
+    return ''
+
+
+def age_instructions(age):
+    """Exercise modifications for older adults"""
+    if age and int(age) >= 50:
+        return """
+Since the user is 50 or older, include these IMPORTANT exercise modifications:
+- Reduce high-impact exercises (like jumping, running on hard surfaces)
+- Include more joint-friendly activities (swimming, cycling, elliptical)
+- Focus on mobility and flexibility exercises
+- Decrease weight/resistance but maintain proper form
+- Include more comprehensive warm-ups and cool-downs
+- Suggest longer recovery periods between training days
+- Emphasize proper hydration and nutrition for recovery
+- Recommend using perceived exertion rather than maximum effort
+"""
+    return ''
+
+
+def build_plan_prompt(data):
+    """Build the plain-text Ollama prompt for a plan request"""
+    metrics = data.get('metrics', {})
+    preferences = data.get('preferences', {})
+    medical_conditions = data.get('medicalConditions', [])
+    goal = data.get('goal', 'maintenance').lower()
+    user_name = data.get('name', 'User')
+    age = data.get('age')
+
+    # Macros calculation remains as is
+    macros = metrics.get('macros', {})
+
+    # Workout length, fat loss calorie deficit and age-specific considerations for older adults
+    days = workout_days(goal)
+    fat_loss = fat_loss_instruction(goal)
+    older_adult = age_instructions(age)
+    headings = ", ".join(section.title for section in PLAN_SECTIONS)
+
+    # Build prompt for Ollama (plain text, not JSON)
+    prompt = f"""
+You are a professional fitness and nutrition coach creating a personalized plan for {user_name}, age {age}. Based on the following data, generate a detailed, readable plan in plain text:
+
+User metrics:
+- BMI: {metrics.get('bmi', 'Not provided')}
+- Body Fat %: {metrics.get('bodyFatPercentage', 'Not provided')}%
+- BMR: {metrics.get('bmr', 'Not provided')} calories
+- TDEE: {metrics.get('tdee', 'Not provided')} calories
+- Goal calories: {metrics.get('goalCalories', 'Not provided')} calories
+- Macros: Protein: {macros.get('protein', 'Not provided')}g, Carbs: {macros.get('carbs', 'Not provided')}g, Fat: {macros.get('fat', 'Not provided')}g
+
+Preferences:
+- Cuisine: {preferences.get('cuisine', 'Not provided')}
+- Restrictions: {preferences.get('restrictions', 'None')}
+- Medical conditions: {', '.join(medical_conditions) if medical_conditions else 'None'}
+- Primary goal: {goal}
+
+{fat_loss}
+{older_adult}
+
+Please provide:
+1. A {days}-day workout plan, with each day described in detail.
+2. A 3-day meal plan, with each meal (breakfast, lunch, dinner, snacks) described in detail.
+3. Rest day activities and recommendations.
+4. Morning and evening routine suggestions for optimal health.
+5. A general suggestion or opinion based on the user's metrics and calculated values, regardless of their goal.
+
+Format the output as readable sections, one per part, each starting with its heading on its own line: {headings}. Use ALL CAPS only for these headings. Do not use JSON or markdown. Make it personalized for {user_name} directly, using their name throughout the plan.
+"""
+    return prompt
+
+
+def _metric_lines(data):
+    metrics = data.get('metrics', {}) or {}
+    macros = metrics.get('macros', {}) or {}
+    return {
+        "bmi": f"- BMI: {metrics.get('bmi', 'Not provided')}",
+        "bodyFatPercentage": f"- Body Fat %: {metrics.get('bodyFatPercentage', 'Not provided')}%",
+        "bmr": f"- BMR: {metrics.get('bmr', 'Not provided')} calories",
+        "tdee": f"- TDEE: {metrics.get('tdee', 'Not provided')} calories",
+        "goalCalories": f"- Goal calories: {metrics.get('goalCalories', 'Not provided')} calories",
+        "macros": f"- Macros: Protein: {macros.get('protein', 'Not provided')}g, Carbs: {macros.get('carbs', 'Not provided')}g, Fat: {macros.get('fat', 'Not provided')}g"
+    }
+
+
+class PlanSection:
+    def __init__(self, name, title, depends_on, metrics, request, extra=None):
+        """
+        One independently generated part of the plan
+
+        Parameters:
+        - name: short identifier used in cache keys and stats
+        - title: ALL CAPS heading the section starts with
+        - depends_on: canonical input fields (dotted for nested ones) the prompt uses
+        - metrics: metric lines included in the prompt
+        - request: callable(data) returning what to ask for
+        - extra: optional callable(data) returning additional instructions
+        """
+        self.name = name
+        self.title = title
+        self.depends_on = tuple(depends_on)
+        self.metrics = tuple(metrics)
+        self.request = request
+        self.extra = extra
+
+    def cache_key(self, data, bucketing=False):
+        """Hash of only the inputs this section depends on"""
+        canonical = canonical_inputs(data, bucketing)
+        inputs = {}
+        for field in self.depends_on:
+            value = canonical
+            for part in field.split('.'):
+                value = value.get(part) if isinstance(value, dict) else None
+            inputs[field] = value
+        return hash_inputs({"section": self.name, "version": SECTION_PROMPT_VERSION, "inputs": inputs})
+
+    def build_prompt(self, data):
+        """Prompt for this section alone, containing only the inputs it depends on"""
+        preferences = data.get('preferences', {}) or {}
+        medical_conditions = data.get('medicalConditions', []) or []
+        goal = data.get('goal', 'maintenance').lower()
+        user_name = data.get('name', 'User')
+        age = data.get('age')
+
+        metric_lines = _metric_lines(data)
+        details = [metric_lines[name] for name in self.metrics]
+        if 'cuisine' in self.depends_on:
+            details.append(f"- Cuisine: {preferences.get('cuisine', 'Not provided')}")
+        if 'restrictions' in self.depends_on:
+            details.append(f"- Restrictions: {preferences.get('restrictions', 'None')}")
+        details.append(f"- Medical conditions: {', '.join(medical_conditions) if medical_conditions else 'None'}")
+        details.append(f"- Primary goal: {goal}")
+        extra = self.extra(data) if self.extra else ''
+        person = f"{user_name}, age {age}" if 'age' in self.depends_on else user_name
+
+        return f"""
+You are a professional fitness and nutrition coach writing one part of a personalized plan for {person}. Based on the following data, write this part in plain text:
+
+{chr(10).join(details)}
+
+{extra}
+
+Please provide {self.request(data)}
+
+Start with the heading {self.title} on its own line and write only this part of the plan. Use ALL CAPS only for that heading. Do not use JSON or markdown. Make it personalized for {user_name} directly, using their name throughout.
+"""
+
+    def normalize(self, text):
+        """Make sure generated text starts with the section heading"""
+        text = text.strip('\n')
+        first_line = text.split('\n', 1)[0]
+        if not is_plan_heading(first_line):
+            text = f"{self.title}\n{text}"
+        return text
+
+
+PLAN_SECTIONS = (
+    PlanSection(
+        "workout", "WORKOUT PLAN",
+        ("goal", "age", "metrics.bmi", "metrics.bodyFatPercentage"),
+        ("bmi", "bodyFatPercentage"),
+        lambda data: f"a {workout_days(data.get('goal', 'maintenance').lower())}-day workout plan, with each day described in detail.",
+        lambda data: age_instructions(data.get('age'))
+    ),
+    PlanSection(
+        "meal", "MEAL PLAN",
+        ("goal", "metrics.tdee", "metrics.goalCalories", "macros", "cuisine", "restrictions"),
+        ("tdee", "goalCalories", "macros"),
+        lambda data: "a 3-day meal plan, with each meal (breakfast, lunch, dinner, snacks) described in detail.",
+        lambda data: fat_loss_instruction(data.get('goal', 'maintenance').lower())
+    ),
+    PlanSection(
+        "rest_day", "REST DAY RECOMMENDATIONS",
+        ("goal", "age"),
+        (),
+        lambda data: "rest day activities and recommendations.",
+        lambda data: age_instructions(data.get('age'))
+    ),
+    PlanSection(
+        "routines", "MORNING AND EVENING ROUTINES",
+        ("goal", "age"),
+        (),
+        lambda data: "morning and evening routine suggestions for optimal health."
+    ),
+    PlanSection(
+        "summary", "GENERAL SUGGESTIONS",
+        ("goal", "age", "metrics", "macros"),
+        ("bmi", "bodyFatPercentage", "bmr", "tdee", "goalCalories", "macros"),
+        lambda data: "a general suggestion or opinion based on the user's metrics and calculated values, regardless of their goal."
+    )
+)
+
+
+class SectionedPlanGenerator:
+    def __init__(self, generate, cache=None, sections=PLAN_SECTIONS, max_parallel=5, bucketing=False):
+        """
+        Generates a plan as independent sections, in parallel, reusing cached sections
+
+        Parameters:
+        - generate: callable(prompt) returning the completion text
+        - cache: PlanCache for section text, keyed on each section's own inputs
+        - sections: PlanSection objects in plan order
+        - max_parallel: sections generated at once
+        - bucketing: round metrics and age in the cache keys, like the plan cache
+
+        A cuisine change, for example, only regenerates the meal section.
+        Requests with medical conditions are never served from the cache.
+        """
+        self.generate_text = generate
+        self.cache = cache
+        self.sections = tuple(sections)
+        self.bucketing = bucketing
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_parallel), thread_name_prefix="plan-section")
+        self._lock = threading.Lock()
+        self._stats = {"generated": 0, "reused": 0}
+
+    def _generate_text(self, section, data):
+        with metrics.span(f"llm.{section.name}"):
+            return section.normalize(self.generate_text(section.build_prompt(data)))
+
+    def _generate_section(self, section, data, cache_key, user_name):
+        text = self._generate_text(section, data)
+        if cache_key is not None:
+            self.cache.store(cache_key, text, user_name)
+        return text
+
+    def missing_sections(self, data):
+        """(section, cache_key) for each section of the plan for data that isn't cached"""
+        if self.cache is None or data.get('medicalConditions'):
+            return []
+        keys = ((section, section.cache_key(data, self.bucketing)) for section in self.sections)
+        return [(section, cache_key) for section, cache_key in keys if not self.cache.contains(cache_key)]
+
+    def generate_section(self, section, data, cache_key):
+        """Generate one section ahead of the requests that need it; returns whether it was cached under cache_key"""
+        return self.cache.store(cache_key, self._generate_text(section, data), data.get('name', 'User'))
+
+    def iter_sections(self, data):
+        """
+        Yield (section, text, reused) in plan order
+
+        Missing sections are all submitted up front, so later sections keep
+        generating while earlier ones are yielded.
+        """
+        user_name = data.get('name', 'User')
+        use_cache = self.cache is not None and not data.get('medicalConditions')
+
+        pending = []
+        for section in self.sections:
+            cache_key = section.cache_key(data, self.bucketing) if use_cache else None
+            cached = self.cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                pending.append((section, personalize(cached, user_name), True))
+            else:
+                future = self._executor.submit(self._generate_section, section, data, cache_key, user_name)
+                pending.append((section, future, False))
+
+        with self._lock:
+            self._stats["reused"] += sum(1 for _, _, reused in pending if reused)
+            self._stats["generated"] += sum(1 for _, _, reused in pending if not reused)
+
+        try:
+            for section, result, reused in pending:
+                yield section, result if reused else result.result(), reused
+        finally:
+            # Don't leave sections generating for a request that gave up
+            for _, result, reused in pending:
+                if not reused:
+                    result.cancel()
+
+    def generate(self, data):
+        """Return (plan text, names of the sections that were regenerated)"""
+        parts = []
+        regenerated = []
+        for section, text, reused in self.iter_sections(data):
+            parts.append(text)
+            if not reused:
+                regenerated.append(section.name)
+        return "\n\n".join(parts), regenerated
+
+    async def _section_async(self, section, data, generate, use_cache, user_name):
+        # asyncio is imported here so the WSGI app doesn't pay for it at startup
+        import asyncio
+        cache_key = section.cache_key(data, self.bucketing) if use_cache else None
+        if cache_key is not None:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                return personalize(cached, user_name), True
+        with metrics.span(f"llm.{section.name}"):
+            text = section.normalize(await generate(section.build_prompt(data)))
+        if cache_key is not None:
+            await asyncio.to_thread(self.cache.store, cache_key, text, user_name)
+        return text, False
+
+    async def iter_sections_async(self, data, generate):
+        """
+        Coroutine version of iter_sections() for the ASGI server
+
+        generate is an async callable(prompt) returning the completion text.
+        All sections run concurrently on the event loop; the LLM router bounds
+        how many reach the backends. Cache disk I/O runs in worker threads.
+        """
+        import asyncio
+        user_name = data.get('name', 'User')
+        use_cache = self.cache is not None and not data.get('medicalConditions')
+        tasks = [asyncio.ensure_future(self._section_async(section, data, generate, use_cache, user_name))
+                 for section in self.sections]
+        try:
+            for section, task in zip(self.sections, tasks):
+                text, reused = await task
+                with self._lock:
+                    self._stats["reused" if reused else "generated"] += 1
+                yield section, text, reused
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def generate_async(self, data, generate):
+        """Coroutine version of generate()"""
+        parts = []
+        regenerated = []
+        async for section, text, reused in self.iter_sections_async(data, generate):
+            parts.append(text)
+            if not reused:
+                regenerated.append(section.name)
+        return "\n\n".join(parts), regenerated
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,413 @@
+import gzip
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+# Content-addressed plan file names: fitness_plan_<32 hex digits>.<ext>
+PLAN_NAME_PATTERN = re.compile(r'^fitness_plan_([0-9a-f]{32})\.(pdf|txt)$')
+# Names written before content addressing, kept readable from the storage root
+LEGACY_NAME_PATTERN = re.compile(r'^fitness_plan_\d+\.(pdf|txt)$')
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Plan formats that get a gzip variant stored next to them when precompression is on
+PRECOMPRESSED_EXTENSIONS = {'txt'}
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+def _gzip_file(path, target):
+    """Write a gzip copy of path to target atomically"""
+    tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+    with open(path, 'rb') as source, open(tmp_path, 'wb') as target_file:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=target_file, compresslevel=9, mtime=0) as compressed:
+            for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+                compressed.write(chunk)
+    os.replace(tmp_path, target)
+
+
+def should_precompress(name):
+    return name.rsplit('.', 1)[-1] in PRECOMPRESSED_EXTENSIONS
+
+
+def plan_name(digest, extension):
+    return f"fitness_plan_{digest}.{extension}"
+
+
+def parse_plan_name(name):
+    """Return the content digest of a plan file name, or None for anything else"""
+    match = PLAN_NAME_PATTERN.match(name)
+    return match.group(1) if match else None
+
+
+def shard_key(name):
+    """Hashed sub-directory key for a plan file, e.g. ab/cd/fitness_plan_abcd....pdf"""
+    digest = parse_plan_name(name)
+    if digest is None:
+        raise ValueError(f"Not a content-addressed plan name: {name}")
+    return f"{digest[:2]}/{digest[2:4]}/{name}"
+
+
+class PlanStorage(ABC):
+    """
+    Interface for plan file storage backends
+
+    Files are stored under content-addressed names and rendered plans are
+    handed over from a local staging directory with put_file().
+    """
+    staging_dir = None
+
+    @abstractmethod
+    def put_file(self, path):
+        """Move a rendered file into storage and return its content-addressed name"""
+
+    @abstractmethod
+    def exists(self, name):
+        """Whether a plan is stored under name"""
+
+    @abstractmethod
+    def open(self, name):
+        """Return a readable binary file object for a stored plan"""
+
+    def local_path(self, name):
+        """Filesystem path of a stored plan, or None if the backend is not local"""
+        return None
+
+    def compressed_path(self, name):
+        """Filesystem path of a stored plan's gzip variant, or None"""
+        return None
+
+    def open_compressed(self, name):
+        """Readable gzip variant of a stored plan, or None if there is none"""
+        return None
+
+    @abstractmethod
+    def delete(self, name):
+        """Remove a stored plan; missing plans are ignored"""
+
+    @abstractmethod
+    def list(self):
+        """Yield (name, size_in_bytes, modified_timestamp) for every stored plan"""
+
+
+class LocalPlanStorage(PlanStorage):
+    def __init__(self, root, precompress=False):
+        """
+        Plans stored on the local filesystem under two levels of hashed sub-directories
+
+        With precompress, .txt plans also get a .gz copy next to them.
+        """
+        self.root = root
+        self.precompress = precompress
+        self.staging_dir = os.path.join(root, '.staging')
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def _path(self, name):
+        if PLAN_NAME_PATTERN.match(name):
+            return os.path.join(self.root, *shard_key(name).split('/'))
+        if LEGACY_NAME_PATTERN.match(name):
+            return os.path.join(self.root, name)
+        return None
+
+    def put_file(self, path):
+        extension = os.path.splitext(path)[1].lstrip('.')
+        name = plan_name(_file_digest(path), extension)
+        target = self._path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if self.precompress and should_precompress(name) and not os.path.exists(target + '.gz'):
+            _gzip_file(path, target + '.gz')
+        # Same filesystem as the staging directory, so this is an atomic rename
+        os.replace(path, target)
+        return name
+
+    def exists(self, name):
+        path = self._path(name)
+        return path is not None and os.path.isfile(path)
+
+    def open(self, name):
+        path = self._path(name)
+        if path is None:
+            raise FileNotFoundError(name)
+        return open(path, 'rb')
+
+    def local_path(self, name):
+        path = self._path(name)
+        return path if path is not None and os.path.isfile(path) else None
+
+    def compressed_path(self, name):
+        path = self._path(name)
+        if path is None or not os.path.isfile(path + '.gz'):
+            return None
+        return path + '.gz'
+
+    def open_compressed(self, name):
+        path = self.compressed_path(name)
+        return open(path, 'rb') if path is not None else None
+
+    def delete(self, name):
+        path = self._path(name)
+        if path is None:
+            return
+        for target in (path, path + '.gz'):
+            try:
+                os.remove(target)
+            except FileNotFoundError:
+                pass
+
+    def list(self):
+        with os.scandir(self.root) as top:
+            for entry in top:
+                if entry.is_file() and LEGACY_NAME_PATTERN.match(entry.name):
+                    stat = entry.stat()
+                    yield entry.name, stat.st_size, stat.st_mtime
+                elif entry.is_dir() and len(entry.name) == 2:
+                    yield from self._list_shard(entry.path)
+
+    def _list_shard(self, shard):
+        for root, _, names in os.walk(shard):
+            for name in names:
+                if PLAN_NAME_PATTERN.match(name):
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except FileNotFoundError:
+                        continue
+                    yield name, stat.st_size, stat.st_mtime
+
+
+class ObjectPlanStorage(PlanStorage):
+    def __init__(self, client, bucket, prefix='plans/', staging_dir=None, precompress=False):
+        """
+        Plans stored in an S3-compatible object store
+
+        client is anything with the boto3 S3 client methods put_object,
+        get_object, head_object, delete_object and list_objects_v2.
+        Rendering still happens on local disk in staging_dir. With precompress,
+        .txt plans also get a .gz object next to them.
+        """
+        self.client = client
+        self.precompress = precompress
+        self.bucket = bucket
+        self.prefix = prefix
+        self.staging_dir = staging_dir
+        os.makedirs(staging_dir, exist_ok=True)
+
+    def _key(self, name):
+        return self.prefix + shard_key(name)
+
+    def put_file(self, path):
+        extension = os.path.splitext(path)[1].lstrip('.')
+        name = plan_name(_file_digest(path), extension)
+        with open(path, 'rb') as f:
+            body = f.read()
+        if self.precompress and should_precompress(name):
+            self.client.put_object(Bucket=self.bucket, Key=self._key(name) + '.gz', Body=gzip.compress(body, compresslevel=9, mtime=0))
+        self.client.put_object(Bucket=self.bucket, Key=self._key(name), Body=body)
+        os.remove(path)
+        return name
+
+    def exists(self, name):
+        if parse_plan_name(name) is None:
+            return False
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+            return True
+        except Exception:
+            return False
+
+    def open(self, name):
+        if parse_plan_name(name) is None:
+            raise FileNotFoundError(name)
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(name))
+        except Exception:
+            raise FileNotFoundError(name)
+        return io.BytesIO(response['Body'].read())
+
+    def open_compressed(self, name):
+        if not self.precompress or parse_plan_name(name) is None or not should_precompress(name):
+            return None
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(name) + '.gz')
+        except Exception:
+            return None
+        return io.BytesIO(response['Body'].read())
+
+    def delete(self, name):
+        if parse_plan_name(name) is not None:
+            self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+            if should_precompress(name):
+                self.client.delete_object(Bucket=self.bucket, Key=self._key(name) + '.gz')
+
+    def list(self):
+        token = None
+        while True:
+            kwargs = {"Bucket": self.bucket, "Prefix": self.prefix}
+            if token:
+                kwargs["ContinuationToken"] = token
+            response = self.client.list_objects_v2(**kwargs)
+            for item in response.get('Contents', []):
+                name = item['Key'].rsplit('/', 1)[-1]
+                if not PLAN_NAME_PATTERN.match(name):
+                    # gzip variants are deleted together with their plan
+                    continue
+                modified = item['LastModified']
+                yield name, item['Size'], modified.timestamp() if hasattr(modified, 'timestamp') else modified
+            if not response.get('IsTruncated'):
+                break
+            token = response.get('NextContinuationToken')
+
+
+class InMemoryObjectStore:
+    def __init__(self):
+        """
+        Local stand-in for an S3 bucket, implementing the subset of the boto3
+        client used by ObjectPlanStorage
+        """
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body):
+        with self._lock:
+            self._objects[(Bucket, Key)] = (bytes(Body), time.time())
+        return {}
+
+    def _get(self, Bucket, Key):
+        with self._lock:
+            if (Bucket, Key) not in self._objects:
+                raise KeyError(f"NoSuchKey: {Key}")
+            return self._objects[(Bucket, Key)]
+
+    def get_object(self, Bucket, Key):
+        body, _ = self._get(Bucket, Key)
+        return {"Body": io.BytesIO(body), "ContentLength": len(body)}
+
+    def head_object(self, Bucket, Key):
+        body, modified = self._get(Bucket, Key)
+        return {"ContentLength": len(body), "LastModified": modified}
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self._objects.pop((Bucket, Key), None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None, MaxKeys=1000):
+        with self._lock:
+            keys = sorted(key for bucket, key in self._objects if bucket == Bucket and key.startswith(Prefix))
+            start = keys.index(ContinuationToken) if ContinuationToken in keys else 0
+            page = keys[start:start + MaxKeys]
+            contents = [{
+                "Key": key,
+                "Size": len(self._objects[(Bucket, key)][0]),
+                "LastModified": self._objects[(Bucket, key)][1]
+            } for key in page]
+        response = {"Contents": contents, "IsTruncated": start + MaxKeys < len(keys)}
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = keys[start + MaxKeys]
+        return response
+
+
+class PlanGarbageCollector:
+    def __init__(self, storage, ttl=30 * 24 * 3600, max_bytes=1024 ** 3, interval=3600):
+        """
+        Deletes plans older than ttl, then the oldest plans until storage fits max_bytes
+
+        Runs every interval seconds on a daemon thread once started.
+        Stale files left in the staging directory by crashed renders are removed too.
+        """
+        self.storage = storage
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.last_run = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {"runs": 0, "expired": 0, "evicted": 0, "bytesFreed": 0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="plan-gc", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.collect()
+            except Exception as e:
+                print(f"Error collecting plan files: {e}")
+
+    def collect(self):
+        """Run one garbage collection pass and return the updated counters"""
+        now = time.time()
+        kept = []
+        total = 0
+        for name, size, modified in self.storage.list():
+            if now - modified > self.ttl:
+                self.storage.delete(name)
+                self._stats["expired"] += 1
+                self._stats["bytesFreed"] += size
+            else:
+                kept.append((modified, name, size))
+                total += size
+
+        kept.sort()
+        for _, name, size in kept:
+            if total <= self.max_bytes:
+                break
+            self.storage.delete(name)
+            total -= size
+            self._stats["evicted"] += 1
+            self._stats["bytesFreed"] += size
+
+        self._clean_staging(now)
+        self._stats["runs"] += 1
+        self.last_run = now
+        return self.stats()
+
+    def _clean_staging(self, now, max_age=3600):
+        staging_dir = self.storage.staging_dir
+        if not staging_dir or not os.path.isdir(staging_dir):
+            return
+        for entry in os.scandir(staging_dir):
+            try:
+                if entry.is_file() and now - entry.stat().st_mtime > max_age:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return dict(self._stats, lastRun=self.last_run)
+
+
+def staging_basename():
+    """Unique base name for a plan rendered into the staging directory"""
+    return f"render_{uuid.uuid4().hex}"
+
+
+def create_plan_storage(backend, root, bucket=None, endpoint_url=None, precompress=False):
+    """Build the configured storage backend: 'local', 'memory' or 's3'"""
+    if backend == 'local':
+        return LocalPlanStorage(root, precompress=precompress)
+    staging_dir = os.path.join(root, '.staging')
+    if backend == 'memory':
+        return ObjectPlanStorage(InMemoryObjectStore(), bucket or 'plans', staging_dir=staging_dir, precompress=precompress)
+    if backend == 's3':
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("PLAN_STORAGE_BACKEND=s3 requires boto3 to be installed")
+        client = boto3.client('s3', endpoint_url=endpoint_url)
+        return ObjectPlanStorage(client, bucket, staging_dir=staging_dir, precompress=precompress)
+    raise ValueError(f"Unknown plan storage backend: {backend}")
@@ -0,0 +1,379 @@
+import re
+
+from api.streaming import SectionSplitter, is_section_header
+
+# Section kinds by keywords in their ALL CAPS heading, checked in order
+SECTION_KINDS = (
+    ("workout", ("WORKOUT", "EXERCISE", "TRAINING")),
+    ("meal", ("MEAL", "NUTRITION", "DIET")),
+    ("rest_day", ("REST",)),
+    ("routines", ("ROUTINE",)),
+    ("summary", ("SUGGESTION", "GENERAL", "SUMMARY", "RECOMMENDATION", "OPINION")),
+)
+
+BULLET_PATTERN = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s+')
+NUMBER_PATTERN = re.compile(r'^\d+[.)]\s+')
+DAY_PATTERN = re.compile(r'^(?:day\s*\d+|(?:mon|tues|wednes|thurs|fri|satur|sun)day)\b', re.IGNORECASE)
+MEAL_PATTERN = re.compile(r'^(breakfast|lunch|dinner|snacks?|pre-workout|post-workout)\b\s*(?:[:\-]\s*(.*))?$', re.IGNORECASE)
+ROUTINE_PATTERN = re.compile(r'^((?:morning|evening|night|bedtime)(?:\s+routine)?)\b\s*(?:[:\-]\s*(.*))?$', re.IGNORECASE)
+
+
+def section_kind(heading):
+    """Which part of the plan a heading starts: workout, meal, rest_day, routines, summary or other"""
+    heading = (heading or "").upper()
+    for kind, keywords in SECTION_KINDS:
+        if any(keyword in heading for keyword in keywords):
+            return kind
+    return "other"
+
+
+def is_plan_heading(line):
+    """
+    Whether a line starts a new section of the plan
+
+    Only unindented ALL CAPS lines naming one of the sections the prompts ask
+    for count, numbered ("1. WORKOUT PLAN") or not. Bullets ("- HIIT") and
+    day, meal or routine headings in capitals ("DAY 1: UPPER BODY") belong to
+    the section they are in.
+    """
+    if not is_section_header(line) or BULLET_PATTERN.match(NUMBER_PATTERN.sub('', line)):
+        return False
+    title = _title(line)
+    if DAY_PATTERN.match(title) or MEAL_PATTERN.match(title) or ROUTINE_PATTERN.match(title):
+        return False
+    return section_kind(title) != "other"
+
+
+def _plain(line):
+    """A line without its bullet marker and markdown emphasis"""
+    return BULLET_PATTERN.sub('', line).replace('**', '').strip()
+
+
+def _title(line):
+    return _plain(line).rstrip(':').strip()
+
+
+def _with_notes(data, notes):
+    if notes:
+        data["notes"] = notes
+    return data
+
+
+class WorkoutDay:
+    def __init__(self, title, exercises=None, notes=None):
+        """A workout day; notes are the free lines written after its exercises"""
+        self.title = title
+        self.exercises = exercises or []
+        self.notes = notes or []
+
+    def to_dict(self):
+        return _with_notes({"title": self.title, "exercises": self.exercises}, self.notes)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["title"], list(data.get("exercises", [])), list(data.get("notes", [])))
+
+
+class Meal:
+    def __init__(self, name, description="", details=None):
+        self.name = name
+        self.description = description
+        self.details = details or []
+
+    def to_dict(self):
+        return {"name": self.name, "description": self.description, "details": self.details}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data.get("description", ""), list(data.get("details", [])))
+
+
+class MealDay:
+    def __init__(self, title, meals=None, notes=None, intro=None):
+        """A meal plan day; intro and notes are the free lines written before and after its meals"""
+        self.title = title
+        self.meals = meals or []
+        self.notes = notes or []
+        self.intro = intro or []
+
+    def to_dict(self):
+        data = {"title": self.title, "meals": [meal.to_dict() for meal in self.meals], "notes": self.notes}
+        if self.intro:
+            data["intro"] = self.intro
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["title"], [Meal.from_dict(meal) for meal in data.get("meals", [])], list(data.get("notes", [])),
+                   list(data.get("intro", [])))
+
+
+class Routine:
+    def __init__(self, name, steps=None, notes=None):
+        self.name = name
+        self.steps = steps or []
+        self.notes = notes or []
+
+    def to_dict(self):
+        return _with_notes({"name": self.name, "steps": self.steps}, self.notes)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], list(data.get("steps", [])), list(data.get("notes", [])))
+
+
+class PlanSectionContent:
+    def __init__(self, kind, heading, intro=None, workout_days=None, meal_days=None, routines=None, notes=None):
+        """
+        One section of a generated plan, parsed once into typed parts
+
+        intro holds the lines before the first day or routine and notes the
+        free text after the last one. Workout sections fill workout_days, meal
+        sections meal_days and routine sections routines; the rest only
+        have intro lines.
+        """
+        self.kind = kind
+        self.heading = heading
+        self.intro = intro or []
+        self.workout_days = workout_days or []
+        self.meal_days = meal_days or []
+        self.routines = routines or []
+        self.notes = notes or []
+
+    def to_dict(self):
+        data = {"kind": self.kind, "heading": self.heading, "intro": self.intro}
+        if self.workout_days:
+            data["workoutDays"] = [day.to_dict() for day in self.workout_days]
+        if self.meal_days:
+            data["mealDays"] = [day.to_dict() for day in self.meal_days]
+        if self.routines:
+            data["routines"] = [routine.to_dict() for routine in self.routines]
+        if self.notes:
+            data["notes"] = self.notes
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["kind"], data.get("heading"), list(data.get("intro", [])),
+            [WorkoutDay.from_dict(day) for day in data.get("workoutDays", [])],
+            [MealDay.from_dict(day) for day in data.get("mealDays", [])],
+            [Routine.from_dict(routine) for routine in data.get("routines", [])],
+            list(data.get("notes", []))
+        )
+
+    def blocks(self):
+        """
+        Yield ("heading" | "group" | "text" | "blank", text) in reading order
+
+        The PDF and text renderers lay the plan out from these, so neither has
+        to guess which lines are headings.
+        """
+        if self.heading:
+            yield "heading", self.heading
+        for line in self.intro:
+            yield ("text", line) if line.strip() else ("blank", "")
+        for day in self.workout_days:
+            yield "group", day.title
+            for exercise in day.exercises:
+                yield "text", f"- {exercise}"
+            yield from _note_blocks(day.notes)
+        for day in self.meal_days:
+            if day.title:
+                yield "group", day.title
+            for line in day.intro:
+                yield "text", line
+            for meal in day.meals:
+                yield "text", f"- {meal.name}: {meal.description}" if meal.description else f"- {meal.name}"
+                for detail in meal.details:
+                    yield "text", f"  - {detail}"
+            yield from _note_blocks(day.notes)
+        for routine in self.routines:
+            yield "group", routine.name
+            for step in routine.steps:
+                yield "text", f"- {step}"
+            yield from _note_blocks(routine.notes)
+        for line in self.notes:
+            yield ("text", line) if line.strip() else ("blank", "")
+
+
+def _note_blocks(notes):
+    """Blocks closing a day or routine: its notes, set apart by a blank line, then the blank after it"""
+    if notes:
+        yield "blank", ""
+        for line in notes:
+            yield ("text", line) if line.strip() else ("blank", "")
+    yield "blank", ""
+
+
+def _trim(lines):
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    while lines and not lines[-1].strip():
+        lines.pop()
+    return lines
+
+
+def _has_items(group):
+    if isinstance(group, WorkoutDay):
+        return bool(group.exercises)
+    if isinstance(group, MealDay):
+        return bool(group.meals or group.intro)
+    return bool(group.steps)
+
+
+def _has_groups(section):
+    return bool(section.workout_days or section.meal_days or section.routines)
+
+
+def parse_section(heading, body):
+    """
+    Parse one section's heading and body text into a PlanSectionContent
+
+    Every line stays where it was written: free lines under a meal become its
+    details, and free lines after a closed day or routine become its notes,
+    or the section's notes after the last one.
+    """
+    kind = section_kind(heading)
+    section = PlanSectionContent(kind, heading)
+    group = None  # the day or routine lines are currently added to
+    closed = None  # the last day or routine, once a blank line closed it
+    after_closed = []  # free lines written after it
+
+    def start(new_group):
+        if closed is not None:
+            closed.notes.extend(_trim(after_closed))
+            after_closed.clear()
+        return new_group
+
+    for line in body.split('\n'):
+        plain = _plain(line)
+        if not plain:
+            # A blank line closes a day or routine once it has items
+            if group is not None and _has_items(group):
+                closed, group = group, None
+            elif group is None:
+                (after_closed if _has_groups(section) else section.intro).append("")
+            continue
+
+        if kind == "workout" and DAY_PATTERN.match(plain):
+            group = start(WorkoutDay(_title(line)))
+            section.workout_days.append(group)
+        elif kind == "meal" and DAY_PATTERN.match(plain):
+            group = start(MealDay(_title(line)))
+            section.meal_days.append(group)
+        elif kind == "meal" and MEAL_PATTERN.match(plain):
+            match = MEAL_PATTERN.match(plain)
+            if not isinstance(group, MealDay):
+                group = start(MealDay(""))
+                section.meal_days.append(group)
+            group.meals.append(Meal(match.group(1).title(), (match.group(2) or "").strip()))
+        elif kind == "routines" and ROUTINE_PATTERN.match(plain):
+            match = ROUTINE_PATTERN.match(plain)
+            group = start(Routine(match.group(1).title(), [match.group(2).strip()] if match.group(2) else []))
+            section.routines.append(group)
+        elif isinstance(group, WorkoutDay):
+            group.exercises.append(plain)
+        elif isinstance(group, Routine):
+            group.steps.append(plain)
+        elif isinstance(group, MealDay):
+            # Lines under a meal describe it; lines before the first meal introduce the day
+            (group.meals[-1].details if group.meals else group.intro).append(plain)
+        elif _has_groups(section):
+            after_closed.append(line.rstrip())
+        else:
+            section.intro.append(line.rstrip())
+
+    section.notes.extend(after_closed)
+    _trim(section.intro)
+    _trim(section.notes)
+    return section
+
+
+class StructuredPlan:
+    def __init__(self, sections=None):
+        """A generated plan as typed sections, in the order they were written"""
+        self.sections = sections or []
+
+    def section(self, kind):
+        """The first section of a kind, or None"""
+        return next((section for section in self.sections if section.kind == kind), None)
+
+    @property
+    def workout_days(self):
+        return [day for section in self.sections for day in section.workout_days]
+
+    @property
+    def meal_days(self):
+        return [day for section in self.sections for day in section.meal_days]
+
+    @property
+    def routines(self):
+        return [routine for section in self.sections for routine in section.routines]
+
+    def to_dict(self):
+        return {"sections": [section.to_dict() for section in self.sections]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls([PlanSectionContent.from_dict(section) for section in data.get("sections", [])])
+
+    def to_record(self):
+        """The workoutPlan and mealPlan columns of a fitness_plans row"""
+        rest = self.section("rest_day")
+        return {
+            "workoutPlan": {
+                "days": [day.to_dict() for day in self.workout_days],
+                "restDays": [line for line in rest.intro if line.strip()] if rest else [],
+                "routines": [routine.to_dict() for routine in self.routines]
+            },
+            "mealPlan": {"days": [day.to_dict() for day in self.meal_days]}
+        }
+
+    def to_text(self):
+        """The plan as plain text, laid out the same way as the PDF"""
+        lines = []
+        for section in self.sections:
+            for block, text in section.blocks():
+                if block == "heading":
+                    lines.extend(["", text, ""] if lines and lines[-1] else [text, ""])
+                elif text or (lines and lines[-1]):
+                    lines.append(text)
+        while lines and not lines[-1]:
+            lines.pop()
+        return "\n".join(lines)
+
+
+class StructuredPlanParser:
+    def __init__(self):
+        """
+        Builds a StructuredPlan from streamed plan text
+
+        Each section is parsed once, as soon as the next heading (or the end
+        of the stream) completes it.
+        """
+        self._splitter = SectionSplitter(is_plan_heading)
+        self.plan = StructuredPlan()
+
+    def _parse(self, sections):
+        parsed = []
+        for heading, body in sections:
+            section = parse_section(heading, body)
+            self.plan.sections.append(section)
+            parsed.append((section, body))
+        return parsed
+
+    def feed(self, text):
+        """Add text and return the sections it completed as (PlanSectionContent, body text) tuples"""
+        return self._parse(self._splitter.feed(text))
+
+    def flush(self):
+        return self._parse(self._splitter.flush())
+
+
+def parse_plan(text):
+    """Parse complete plan text into a StructuredPlan"""
+    parser = StructuredPlanParser()
+    parser.feed(text)
+    parser.flush()
+    return parser.plan
@@ -0,0 +1,297 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+
+from api.plan_cache import canonical_inputs, hash_inputs
+from utils.metrics import metrics
+
+# Name used in speculative prompts; it is replaced by the placeholder before caching
+PREWARM_USER_NAME = "Alex"
+
+
+def parse_hours(hours):
+    """(start, end) hours from "1-6", end exclusive and wrapping past midnight; None for any hour"""
+    if not hours or not hours.strip():
+        return None
+    try:
+        start, end = (int(part) for part in hours.split('-'))
+    except ValueError:
+        raise ValueError(f"Invalid off-peak hours: {hours}, expected start-end such as 1-6")
+    if not (0 <= start < 24 and 0 <= end <= 24) or start == end:
+        raise ValueError(f"Invalid off-peak hours: {hours}")
+    return start, end
+
+
+def profile_request(canonical, name=PREWARM_USER_NAME):
+    """
+    A plan request with the given canonical inputs
+
+    canonical_inputs() of the result equals canonical, so plans generated
+    for it are cached under the keys a matching live request looks up.
+    """
+    metrics_values = {key: value for key, value in canonical["metrics"].items() if value is not None}
+    macros = {key: value for key, value in canonical["macros"].items() if value is not None}
+    preferences = {key: canonical[key] for key in ("cuisine", "restrictions") if canonical[key]}
+    return {
+        "name": name,
+        "goal": canonical["goal"],
+        "age": canonical["age"],
+        "metrics": dict(metrics_values, macros=macros),
+        "preferences": preferences
+    }
+
+
+class ProfileTracker:
+    def __init__(self, window=7 * 24 * 3600, max_samples=5000, bucketing=False):
+        """
+        Counts how often each input profile was requested recently
+
+        Counts are kept in memory only, so a restart starts a new window.
+        A profile is the canonical plan cache inputs of a request: goal (and
+        with it the workout day count), age, metrics, macros, cuisine and
+        restrictions. With bucketing, age and metrics are rounded to the same
+        bands as the plan cache. Only the last max_samples requests within
+        window seconds are counted.
+        """
+        self.window = window
+        self.max_samples = max_samples
+        self.bucketing = bucketing
+        self._samples = deque()
+        self._counts = {}
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def record(self, data, now=None):
+        """Count a plan request and return its profile hash; requests with medical conditions are not counted"""
+        if data.get('medicalConditions'):
+            return None
+        canonical = canonical_inputs(data, self.bucketing)
+        profile_hash = hash_inputs(canonical)
+        now = time.time() if now is None else now
+        with self._lock:
+            self._samples.append((now, profile_hash))
+            self._counts[profile_hash] = self._counts.get(profile_hash, 0) + 1
+            self._profiles[profile_hash] = canonical
+            self._expire(now)
+        return profile_hash
+
+    def _expire(self, now):
+        """Drop samples older than the window or beyond max_samples (lock held)"""
+        while self._samples and (len(self._samples) > self.max_samples or now - self._samples[0][0] > self.window):
+            _, profile_hash = self._samples.popleft()
+            self._counts[profile_hash] -= 1
+            if not self._counts[profile_hash]:
+                del self._counts[profile_hash]
+                del self._profiles[profile_hash]
+
+    def profiles(self, now=None):
+        """(count, profile hash, canonical inputs) of every tracked profile, most requested first"""
+        with self._lock:
+            self._expire(time.time() if now is None else now)
+            profiles = [(count, profile_hash, self._profiles[profile_hash]) for profile_hash, count in self._counts.items()]
+        profiles.sort(key=lambda profile: profile[0], reverse=True)
+        return profiles
+
+    def stats(self):
+        with self._lock:
+            return {"requests": len(self._samples), "profiles": len(self._counts)}
+
+
+class PlanPrewarmer:
+    def __init__(self, plan_units, tracker, hours=None, budget=200, max_concurrent=1, max_live=0, min_requests=2,
+                 interval=60):
+        """
+        Generates plans for frequently requested profiles ahead of requests
+
+        During the off-peak hours, every interval seconds, the cache entries
+        that the tracked profiles' plans still miss are generated, so a
+        daytime request matching a profile is served from the plan cache
+        with only its name personalized and the PDF rendered.
+
+        Parameters:
+        - plan_units: callable(request) returning (cache_key, generate) pairs
+          for the entries its plan misses; generate() fills one entry and
+          returns whether it could be cached, i.e. the name was fully removed
+        - tracker: ProfileTracker fed by live plan requests
+        - hours: off-peak hours such as "1-6", None or "" for any hour
+        - budget: generations per off-peak window (per day without hours)
+        - max_concurrent: speculative generations at once
+        - max_live: live plan generations (running or queued) above which
+          no new speculative generation starts
+        - min_requests: requests needing an entry before it is generated
+
+        Entries shared by several profiles (a routines section depends only
+        on goal and age, for example) are prioritized by the requests of all
+        of them, so the budget goes to the entries most likely to be hit.
+        """
+        self.plan_units = plan_units
+        self.tracker = tracker
+        self.hours = parse_hours(hours)
+        self.budget = budget
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_live = max_live
+        self.min_requests = min_requests
+        self.interval = interval
+        self.load_sources = []
+        self.last_run = None
+        self._window = None
+        self._spent = 0
+        self._prewarmed = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {"runs": 0, "skippedBusy": 0, "budgetExhausted": 0, "matchedRequests": 0}
+        self._outcomes = metrics.counter("plan_prewarm_total", "Speculative plan generations by outcome", ("outcome",))
+
+    def add_load_source(self, live_generations):
+        """Register a callable returning live plan generations running or queued, e.g. an admission controller's"""
+        self.load_sources.append(live_generations)
+
+    def record(self, data):
+        """Count a live plan request towards its profile"""
+        profile_hash = self.tracker.record(data)
+        if profile_hash is not None:
+            with self._lock:
+                if profile_hash in self._prewarmed:
+                    self._stats["matchedRequests"] += 1
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="plan-prewarm", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error pre-generating plans: {e}")
+
+    def window(self, now=None):
+        """Date the current off-peak window started on, or None outside the off-peak hours"""
+        moment = datetime.fromtimestamp(time.time() if now is None else now)
+        if self.hours is None:
+            return moment.date()
+        start, end = self.hours
+        if start < end:
+            return moment.date() if start <= moment.hour < end else None
+        if moment.hour >= start:
+            return moment.date()
+        return (moment - timedelta(days=1)).date() if moment.hour < end else None
+
+    def live_generations(self):
+        return sum(source() for source in self.load_sources)
+
+    def _can_start(self, reserve=True):
+        """Whether one more speculative generation fits the window, the budget and the live load; reserves it"""
+        window = self.window()
+        with self._lock:
+            if window is None or self._stop.is_set():
+                return False
+            if window != self._window:
+                self._window, self._spent = window, 0
+            if self._spent >= self.budget:
+                self._stats["budgetExhausted"] += 1
+                return False
+        if self.live_generations() > self.max_live:
+            with self._lock:
+                self._stats["skippedBusy"] += 1
+            return False
+        if reserve:
+            with self._lock:
+                self._spent += 1
+        return True
+
+    def candidates(self):
+        """(requests, cache_key, generate, profile hashes) for every missing entry worth generating, highest first"""
+        units = {}
+        for count, profile_hash, canonical in self.tracker.profiles():
+            for cache_key, generate in self.plan_units(profile_request(canonical)):
+                unit = units.get(cache_key)
+                if unit is None:
+                    units[cache_key] = [count, cache_key, generate, [profile_hash]]
+                else:
+                    unit[0] += count
+                    unit[3].append(profile_hash)
+        ranked = sorted(units.values(), key=lambda unit: unit[0], reverse=True)
+        return [tuple(unit) for unit in ranked if unit[0] >= self.min_requests]
+
+    def _generate(self, generate, profile_hashes):
+        if not generate():
+            return False
+        with self._lock:
+            for profile_hash in profile_hashes:
+                self._prewarmed[profile_hash] = time.time()
+                self._prewarmed.move_to_end(profile_hash)
+            while len(self._prewarmed) > self.tracker.max_samples:
+                self._prewarmed.popitem(last=False)
+        return True
+
+    def run_once(self):
+        """
+        Generate missing entries for the tracked profiles, most requested first
+
+        Stops at the end of the off-peak window, when the budget is spent,
+        when live traffic arrives or after a failed generation. Returns the
+        number of entries generated and cached.
+        """
+        with self._lock:
+            self._stats["runs"] += 1
+        self.last_run = time.time()
+        # Finding the missing entries reads the cache, so it is skipped when nothing could start
+        if not self._can_start(reserve=False):
+            return 0
+
+        generated = 0
+        failed = False
+        running = set()
+        with ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="plan-prewarm") as executor:
+            for _, _, generate, profile_hashes in self.candidates():
+                while len(running) >= self.max_concurrent:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        outcome = self._finish(future)
+                        generated += outcome == "generated"
+                        failed = failed or outcome == "failed"
+                if failed or not self._can_start():
+                    break
+                running.add(executor.submit(self._generate, generate, profile_hashes))
+            for future in running:
+                generated += self._finish(future) == "generated"
+        return generated
+
+    def _finish(self, future):
+        """Count a finished generation and return its outcome: generated, discarded or failed"""
+        try:
+            cached = future.result()
+        except Exception as e:
+            # The backend may be down; the next run tries again
+            print(f"Warning: speculative plan generation failed: {e}")
+            self._outcomes.inc("failed")
+            return "failed"
+        # Discarded when the name couldn't be fully removed from the text, so it wasn't cached
+        outcome = "generated" if cached else "discarded"
+        self._outcomes.inc(outcome)
+        return outcome
+
+    def stats(self):
+        outcomes = {outcome: count for (outcome,), count in self._outcomes.samples().items()}
+        with self._lock:
+            stats = dict(self._stats, budget=self.budget, spent=self._spent, prewarmedProfiles=len(self._prewarmed))
+        return dict(
+            stats,
+            hours=f"{self.hours[0]}-{self.hours[1]}" if self.hours else None,
+            inWindow=self.window() is not None,
+            maxConcurrent=self.max_concurrent,
+            maxLive=self.max_live,
+            minRequests=self.min_requests,
+            liveGenerations=self.live_generations(),
+            tracked=self.tracker.stats(),
+            outcomes=outcomes,
+            lastRun=self.last_run
+        )
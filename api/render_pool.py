@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from api.pdf_renderer import PlanRenderer
+
+# One renderer per worker process, so its layout caches survive between plans
+_worker_renderer = None
+
+
+def _render_in_worker(output_dir, content, user_name, metrics, age, basename):
+    """Runs in a worker process: render the plan straight into output_dir"""
+    global _worker_renderer
+    if _worker_renderer is None or _worker_renderer.output_dir != output_dir:
+        _worker_renderer = PlanRenderer(output_dir)
+    return _worker_renderer.render(content, user_name, metrics, age, basename)
+
+
+def _warm_up():
+    """Runs in a worker process: import and initialize the renderer ahead of the first plan"""
+    return os.getpid()
+
+
+class RenderPool:
+    def __init__(self, output_dir, workers=0, start_method="spawn"):
+        """
+        Renders plans in a process pool so CPU-bound FPDF work stays off request threads
+
+        Only the plan (text or StructuredPlan), user name, metrics and age are sent to the workers,
+        which write the file into output_dir themselves and return its name.
+        With workers=0 plans are rendered inline in the calling thread.
+        """
+        self.output_dir = output_dir
+        self.workers = workers
+        self.start_method = start_method
+        self._inline = PlanRenderer(output_dir) if workers <= 0 else None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def inline(self):
+        """True when plans are rendered in the calling thread instead of worker processes"""
+        return self._inline is not None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(self.start_method)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def start(self):
+        """Spawn the worker processes now instead of on the first plan"""
+        if self._inline is not None:
+            return
+        executor = self._get_executor()
+        for future in [executor.submit(_warm_up) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, content, user_name, metrics, age, basename):
+        """Queue a plan for rendering and return a Future for the file name"""
+        if self._inline is not None:
+            raise RuntimeError("RenderPool is running inline, call render() instead")
+        return self._get_executor().submit(_render_in_worker, self.output_dir, content, user_name, metrics, age, basename)
+
+    def render(self, content, user_name, metrics, age, basename):
+        """Render a plan and return the file name, waiting on a worker if the pool is enabled"""
+        if self._inline is not None:
+            return self._inline.render(content, user_name, metrics, age, basename)
+        return self.submit(content, user_name, metrics, age, basename).result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
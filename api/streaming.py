@@ -0,0 +1,112 @@
+import json
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def _partial_suffix(text, tag):
+    """Length of the longest suffix of text that is a prefix of tag"""
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if tag.startswith(text[-size:]):
+            return size
+    return 0
+
+
+def strip_think(text):
+    """Remove deepseek-r1 <think> reasoning blocks from a complete completion"""
+    think_filter = ThinkFilter()
+    return (think_filter.feed(text) + think_filter.flush()).lstrip('\n')
+
+
+def is_section_header(line):
+    """ALL CAPS, unindented lines with at least one letter are treated as section headings"""
+    stripped = line.strip()
+    return bool(stripped) and not line.startswith(' ') and stripped.upper() == stripped and any(c.isalpha() for c in stripped)
+
+
+class ThinkFilter:
+    def __init__(self):
+        """
+        Incrementally drops <think>...</think> blocks from a token stream
+
+        Tags may be split across tokens, so a short tail that could be the start
+        of a tag is held back until the next token arrives.
+        """
+        self._buffer = ""
+        self._inside = False
+
+    def feed(self, chunk):
+        """Add a chunk of model output and return the text that is safe to forward"""
+        self._buffer += chunk
+        visible = []
+        while True:
+            if self._inside:
+                end = self._buffer.find(THINK_CLOSE)
+                if end == -1:
+                    keep = _partial_suffix(self._buffer, THINK_CLOSE)
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                self._buffer = self._buffer[end + len(THINK_CLOSE):]
+                self._inside = False
+            else:
+                start = self._buffer.find(THINK_OPEN)
+                if start == -1:
+                    keep = _partial_suffix(self._buffer, THINK_OPEN)
+                    visible.append(self._buffer[:len(self._buffer) - keep])
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                visible.append(self._buffer[:start])
+                self._buffer = self._buffer[start + len(THINK_OPEN):]
+                self._inside = True
+        return "".join(visible)
+
+    def flush(self):
+        """Return any held-back text at the end of the stream"""
+        text = "" if self._inside else self._buffer
+        self._buffer = ""
+        return text
+
+
+class SectionSplitter:
+    def __init__(self, is_heading=is_section_header):
+        """Groups streamed plan text into sections that start at lines is_heading accepts, ALL CAPS ones by default"""
+        self.is_heading = is_heading
+        self._partial_line = ""
+        self._heading = None
+        self._lines = []
+
+    def feed(self, text):
+        """Add text and return the sections completed by it as (heading, body) tuples"""
+        self._partial_line += text
+        *lines, self._partial_line = self._partial_line.split('\n')
+        sections = []
+        for line in lines:
+            if self.is_heading(line):
+                section = self._take()
+                if section is not None:
+                    sections.append(section)
+                self._heading = line.strip()
+            else:
+                self._lines.append(line)
+        return sections
+
+    def flush(self):
+        """Return the last section once the stream has ended"""
+        if self._partial_line:
+            self.feed('\n')
+        section = self._take()
+        return [section] if section is not None else []
+
+    def _take(self):
+        body = "\n".join(self._lines).strip('\n')
+        heading = self._heading
+        self._heading = None
+        self._lines = []
+        if heading is None and not body.strip():
+            return None
+        return heading, body
+
+
+def sse_event(event, data):
+    """Format a Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,132 @@
+"""
+Load test /api/generate-plan under the Flask threaded server and the ASGI app
+
+Starts the Ollama stub with a slow first token, runs each server in a
+subprocess against it and fires more concurrent plan requests than there
+are LLM slots, so most of them wait in the LLM queue. Reports latency
+percentiles and the server's peak thread count and RSS (Linux).
+Run from the repository root:
+    python -m benchmarks.bench_async_serving --requests 500 --llm-slots 32 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+from benchmarks.ollama_stub import start_stub
+
+PLAN_REQUEST = {
+    "name": "Alex", "age": 34, "gender": "male", "goal": "lose_fat", "activityLevel": "moderate",
+    "workoutPreference": "gym", "dietaryPreference": "non-vegetarian", "cuisine": "indian",
+    "metrics": {"bmi": 24.1, "bodyFatPercentage": 19.5, "bmr": 1720, "tdee": 2666, "goalCalories": 2133,
+                "macros": {"protein": 176, "carbs": 181, "fat": 59}}
+}
+
+SERVERS = {
+    "flask": [sys.executable, "-c", "import sys; from api.app import app; app.run(port=int(sys.argv[1]), threaded=True)"],
+    "asgi": [sys.executable, "-m", "uvicorn", "api.asgi:app", "--log-level", "warning", "--port"],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_usage(pid):
+    """(threads, RSS in MB) from /proc, or (0, 0) where it is unavailable"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            fields = dict(line.split(":", 1) for line in status if ":" in line)
+        return int(fields["Threads"]), int(fields["VmRSS"].split()[0]) / 1024
+    except (OSError, KeyError):
+        return 0, 0
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0
+
+
+async def fire(url, requests):
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=requests)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        async def one():
+            nonlocal errors
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/api/generate-plan", json=PLAN_REQUEST)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except httpx.HTTPError:
+                errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return latencies, errors, time.perf_counter() - start
+
+
+def run(kind, stub_url, requests, llm_slots):
+    port = free_port()
+    env = dict(os.environ, OLLAMA_URL=stub_url, OLLAMA_MAX_CONCURRENCY=str(llm_slots), OLLAMA_QUEUE_TIMEOUT="600",
+               PLAN_CACHE_ENABLED="0", PLAN_SECTIONED="0", RENDER_WORKERS=os.getenv("RENDER_WORKERS", "0"), PROFILER_ENABLED="0",
+               RATE_LIMIT_PER_MINUTE="0")
+    server = subprocess.Popen(SERVERS[kind] + [str(port)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    peak = {"threads": 0, "rss": 0.0}
+    stop = threading.Event()
+
+    def sample():
+        while not stop.is_set():
+            threads, rss = process_usage(server.pid)
+            peak["threads"] = max(peak["threads"], threads)
+            peak["rss"] = max(peak["rss"], rss)
+            time.sleep(0.05)
+
+    try:
+        for _ in range(200):
+            try:
+                httpx.get(f"{url}/api/health", timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        idle_threads, idle_rss = process_usage(server.pid)
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        latencies, errors, elapsed = asyncio.run(fire(url, requests))
+        stop.set()
+        sampler.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{kind:6} {len(latencies):4} ok {errors:3} errors in {elapsed:6.2f}s  "
+          f"p50 {percentile(latencies, 0.5):6.2f}s  p95 {percentile(latencies, 0.95):6.2f}s  "
+          f"threads {idle_threads}->{peak['threads']}  RSS {idle_rss:.0f}->{peak['rss']:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='concurrent plan requests')
+    parser.add_argument('--latency', type=float, default=0.5, help='stub seconds before the first token')
+    parser.add_argument('--llm-slots', type=int, default=32, help='OLLAMA_MAX_CONCURRENCY for the servers')
+    parser.add_argument('--server', choices=sorted(SERVERS), action='append', help='defaults to both')
+    args = parser.parse_args()
+
+    stub = start_stub(latency=args.latency)
+    print(f"{args.requests} concurrent /api/generate-plan requests, {args.llm_slots} LLM slots, stub latency {args.latency}s")
+    for kind in args.server or ["flask", "asgi"]:
+        run(kind, stub.url, args.requests, args.llm_slots)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Compare the per-object FitnessCalculator path with BatchFitnessCalculator
+
+Run from the repository root:
+    python -m benchmarks.bench_batch_calculator --users 100000
+"""
+import argparse
+import random
+import time
+
+from models.fitness_calculator import FitnessCalculator
+from models.batch_calculator import BatchFitnessCalculator
+
+GENDERS = ['male', 'female']
+ACTIVITY_LEVELS = ['sedentary', 'light', 'moderate', 'active', 'very_active']
+GOALS = ['lose_fat', 'maintenance', 'build_muscle']
+
+
+def make_users(count, seed=42):
+    """Generate random but plausible user inputs"""
+    rng = random.Random(seed)
+    users = []
+    for _ in range(count):
+        users.append({
+            "age": rng.randint(18, 80),
+            "weight": round(rng.uniform(45, 140), 1),
+            "height": round(rng.uniform(150, 205), 1),
+            "waist": round(rng.uniform(65, 130), 1),
+            "neck": round(rng.uniform(30, 45), 1),
+            "gender": rng.choice(GENDERS),
+            "activityLevel": rng.choice(ACTIVITY_LEVELS),
+            "goal": rng.choice(GOALS)
+        })
+    return users
+
+
+def run_scalar(users):
+    """Compute metrics the way /api/calculate does, one object per user"""
+    results = []
+    for user in users:
+        calculator = FitnessCalculator(
+            age=user['age'],
+            weight=user['weight'],
+            height=user['height'],
+            waist=user['waist'],
+            neck=user['neck'],
+            gender=user['gender'],
+            activity_level=user['activityLevel'],
+            goal=user['goal']
+        )
+        results.append({
+            "bmi": calculator.calculate_bmi(),
+            "bodyFatPercentage": calculator.calculate_body_fat(),
+            "bmr": calculator.calculate_bmr(),
+            "tdee": calculator.calculate_tdee(),
+            "goalCalories": calculator.calculate_goal_calories(),
+            "macros": calculator.calculate_macros()
+        })
+    return results
+
+
+def make_batch(users):
+    """Build a BatchFitnessCalculator from a list of user dicts"""
+    return BatchFitnessCalculator(
+        ages=[user['age'] for user in users],
+        weights=[user['weight'] for user in users],
+        heights=[user['height'] for user in users],
+        waists=[user['waist'] for user in users],
+        necks=[user['neck'] for user in users],
+        genders=[user['gender'] for user in users],
+        activity_levels=[user['activityLevel'] for user in users],
+        goals=[user['goal'] for user in users]
+    )
+
+
+def run_batch(users):
+    """Compute metrics for all users in one columnar pass, returning row dicts"""
+    return make_batch(users).calculate_all()
+
+
+def run_batch_columns(users):
+    """Compute metrics for all users without materializing row dicts"""
+    calculator = make_batch(users)
+    return calculator.calculate_bmi(), calculator.calculate_body_fat(), calculator.calculate_macros()
+
+
+def best_of(func, users, repeat):
+    """Return the best wall time and the last result of func(users)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(users)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000, help='number of users per run')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per path, best time is reported')
+    args = parser.parse_args()
+
+    users = make_users(args.users)
+
+    scalar_time, scalar_results = best_of(run_scalar, users, args.repeat)
+    batch_time, batch_results = best_of(run_batch, users, args.repeat)
+    columns_time, _ = best_of(run_batch_columns, users, args.repeat)
+
+    mismatches = sum(1 for a, b in zip(scalar_results, batch_results) if a != b)
+
+    print(f"Users per run:     {args.users}")
+    print(f"Per-object path:   {scalar_time:.3f}s  ({args.users / scalar_time:,.0f} users/s)")
+    print(f"Batch path:        {batch_time:.3f}s  ({args.users / batch_time:,.0f} users/s)")
+    print(f"Batch, columns:    {columns_time:.3f}s  ({args.users / columns_time:,.0f} users/s)")
+    print(f"Speedup:           {scalar_time / batch_time:.1f}x (rows), {scalar_time / columns_time:.1f}x (columns)")
+    print(f"Mismatched rows:   {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
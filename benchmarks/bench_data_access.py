@@ -0,0 +1,100 @@
+"""
+Count Supabase round trips saved by the data access layer
+
+Replays a read-heavy request mix against the in-memory table stand-in, once
+straight through SupabaseClient and once through DataAccessLayer, and then
+fires concurrent reads of the same keys to show request coalescing.
+Run from the repository root:
+    python -m benchmarks.bench_data_access --users 200 --requests 5000 --latency 0.002
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database.data_access import DataAccessLayer
+from database.memory_store import InMemorySupabase
+from database.supabase_client import SupabaseClient
+
+
+def seed(users):
+    """Build a store with users and one plan each, in two bulk round trips"""
+    store = InMemorySupabase()
+    client = SupabaseClient(client=store)
+    created = client.create_users([{"name": f"User {i}", "email": f"user{i}@example.com"} for i in range(users)])
+    client.save_plans([{"user_id": user["id"], "mealPlan": {"days": 7}} for user in created])
+    return store, client, [user["id"] for user in created]
+
+
+def workload(user_ids, requests, seed_value=0):
+    """Read-mostly request mix: 45% get_user, 45% get_plan, 10% update_user"""
+    rng = random.Random(seed_value)
+    hot = user_ids[:max(1, len(user_ids) // 10)]
+    for _ in range(requests):
+        # Most traffic goes to a small set of active users
+        user_id = rng.choice(hot) if rng.random() < 0.8 else rng.choice(user_ids)
+        roll = rng.random()
+        if roll < 0.45:
+            yield "get_user", (user_id,)
+        elif roll < 0.9:
+            yield "get_plan", (user_id,)
+        else:
+            yield "update_user", (user_id, {"weight": rng.randint(50, 100)})
+
+
+def replay(target, store, operations, latency):
+    store.latency = latency
+    before = store.round_trips
+    start = time.perf_counter()
+    for method, args in operations:
+        getattr(target, method)(*args)
+    elapsed = time.perf_counter() - start
+    store.latency = 0.0
+    return store.round_trips - before, elapsed
+
+
+def coalescing(store, client, user_id, threads, latency):
+    """Concurrent reads of one cold key: round trips with and without the data access layer"""
+    store.latency = latency
+    results = {}
+    for label, target in (("direct", client), ("data access", DataAccessLayer(client))):
+        before = store.round_trips
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(lambda _: target.get_user(user_id), range(threads)))
+        results[label] = store.round_trips - before
+    store.latency = 0.0
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.002, help='simulated seconds per round trip')
+    parser.add_argument('--threads', type=int, default=32, help='concurrent readers for the coalescing test')
+    args = parser.parse_args()
+
+    store, client, user_ids = seed(args.users)
+    operations = list(workload(user_ids, args.requests))
+
+    direct_trips, direct_time = replay(client, store, operations, args.latency)
+    data_access = DataAccessLayer(client)
+    cached_trips, cached_time = replay(data_access, store, operations, args.latency)
+
+    before = store.round_trips
+    client.get_users(user_ids)
+    bulk_trips = store.round_trips - before
+
+    coalesced = coalescing(store, client, user_ids[-1], args.threads, args.latency)
+
+    print(f"{args.requests} requests over {args.users} users, {args.latency * 1000:.1f} ms per round trip")
+    print(f"Direct:       {direct_trips:6d} round trips  {direct_time:7.2f} s")
+    print(f"Data access:  {cached_trips:6d} round trips  {cached_time:7.2f} s  ({data_access.stats()})")
+    print(f"Saved:        {1 - cached_trips / direct_trips:6.1%} of round trips")
+    print(f"get_users for {args.users} ids: {bulk_trips} round trip (vs {args.users} single reads)")
+    print(f"{args.threads} concurrent cold reads: {coalesced['direct']} round trips direct, "
+          f"{coalesced['data access']} with coalescing")
+
+
+if __name__ == '__main__':
+    main()
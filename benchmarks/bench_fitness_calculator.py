@@ -0,0 +1,181 @@
+"""
+Microbenchmark the /api/calculate path: original FitnessCalculator vs the memoized one
+
+Times computing every metric for a user, the way /api/calculate does, with
+the original class (reproduced below), the __slots__ class with per-instance
+memoization, and the LRU-memoized calculate_metrics on a stream of form
+submissions where some inputs repeat. Run from the repository root:
+    python -m benchmarks.bench_fitness_calculator --users 20000 --repeat 0.5
+"""
+import argparse
+import math
+import random
+import sys
+import time
+import tracemalloc
+from functools import lru_cache
+
+from benchmarks.bench_batch_calculator import make_users
+from models.fitness_calculator import FitnessCalculator, calculate_metrics
+
+
+class LegacyFitnessCalculator:
+    """FitnessCalculator before memoization, kept as the baseline"""
+
+    def __init__(self, age, weight, height, waist, neck, gender='male', activity_level='moderate', goal='maintenance'):
+        self.age = age
+        self.weight = weight
+        self.height = height
+        self.waist = waist
+        self.neck = neck
+        self.gender = gender.lower()
+        self.activity_level = activity_level.lower()
+        self.goal = goal.lower()
+        self.activity_multipliers = {
+            'sedentary': 1.2,
+            'light': 1.375,
+            'moderate': 1.55,
+            'active': 1.725,
+            'very_active': 1.9
+        }
+        self.goal_multipliers = {
+            'lose_fat': 0.8,
+            'maintenance': 1.0,
+            'build_muscle': 1.1
+        }
+
+    def calculate_bmi(self):
+        height_in_meters = self.height / 100
+        return round(self.weight / (height_in_meters ** 2), 2)
+
+    def calculate_body_fat(self):
+        height_in_inches = self.height / 2.54
+        waist_in_inches = self.waist / 2.54
+        neck_in_inches = self.neck / 2.54
+        if self.gender == 'male':
+            body_fat = 495 / (1.0324 - 0.19077 * (math.log10(waist_in_inches - neck_in_inches)) + 0.15456 * (math.log10(height_in_inches))) - 450
+        else:
+            hip_in_inches = waist_in_inches * 1.4
+            body_fat = 495 / (1.29579 - 0.35004 * (math.log10(waist_in_inches + hip_in_inches - neck_in_inches)) + 0.22100 * (math.log10(height_in_inches))) - 450
+        return round(body_fat, 2)
+
+    def calculate_bmr(self):
+        if self.gender == 'male':
+            bmr = (10 * self.weight) + (6.25 * self.height) - (5 * self.age) + 5
+        else:
+            bmr = (10 * self.weight) + (6.25 * self.height) - (5 * self.age) - 161
+        return round(bmr)
+
+    def calculate_tdee(self):
+        return round(self.calculate_bmr() * self.activity_multipliers.get(self.activity_level, 1.55))
+
+    def calculate_goal_calories(self):
+        return round(self.calculate_tdee() * self.goal_multipliers.get(self.goal, 1.0))
+
+    def calculate_macros(self):
+        goal_calories = self.calculate_goal_calories()
+        if self.goal == 'lose_fat':
+            protein_g = self.weight * 2.2
+        elif self.goal == 'build_muscle':
+            protein_g = self.weight * 2.2 * 1.1
+        else:
+            protein_g = self.weight * 2.2 * 0.8
+        protein_calories = protein_g * 4
+        fat_calories = goal_calories * 0.25 if self.goal == 'lose_fat' else goal_calories * 0.3
+        fat_g = fat_calories / 9
+        carb_g = (goal_calories - protein_calories - fat_calories) / 4
+        return {"protein": round(protein_g), "carbs": round(carb_g), "fat": round(fat_g)}
+
+
+def arguments(user):
+    return (user['age'], user['weight'], user['height'], user['waist'], user['neck'],
+            user['gender'], user['activityLevel'], user['goal'])
+
+
+def normalized(user):
+    """The key /api/calculate memoizes on"""
+    return (float(user['age']), float(user['weight']), float(user['height']), float(user['waist']), float(user['neck']),
+            user['gender'].lower(), user['activityLevel'].lower(), user['goal'].lower())
+
+
+def run_legacy(users):
+    results = []
+    for user in users:
+        calculator = LegacyFitnessCalculator(*arguments(user))
+        results.append({
+            "bmi": calculator.calculate_bmi(),
+            "bodyFatPercentage": calculator.calculate_body_fat(),
+            "bmr": calculator.calculate_bmr(),
+            "tdee": calculator.calculate_tdee(),
+            "goalCalories": calculator.calculate_goal_calories(),
+            "macros": calculator.calculate_macros()
+        })
+    return results
+
+
+def run_memoized(users):
+    return [FitnessCalculator(*arguments(user)).calculate_all() for user in users]
+
+
+def run_lru(users, maxsize=4096):
+    cached = lru_cache(maxsize=maxsize)(calculate_metrics)
+    return [cached(*normalized(user)) for user in users]
+
+
+def submissions(count, repeat, seed=7):
+    """Form submissions where a `repeat` fraction re-submits an earlier input"""
+    rng = random.Random(seed)
+    unique = make_users(count)
+    stream = []
+    for user in unique:
+        if stream and rng.random() < repeat:
+            stream.append(rng.choice(stream[-500:]))
+        else:
+            stream.append(user)
+    return stream
+
+
+def best_of(fn, users, rounds=5):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(users)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def instance_bytes(factory, count=10000):
+    """Average memory held by one calculator instance"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    instances = [factory(30, 70.0, 175.0, 80.0, 38.0) for _ in range(count)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del instances
+    return used / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--repeat', type=float, default=0.5, help='fraction of submissions that repeat an earlier input')
+    args = parser.parse_args()
+
+    users = submissions(args.users, args.repeat)
+    legacy, memoized, lru = run_legacy(users), run_memoized(users), run_lru(users)
+    mismatches = sum(1 for a, b, c in zip(legacy, memoized, lru) if not (a == b == c))
+
+    legacy_time = best_of(run_legacy, users)
+    memoized_time = best_of(run_memoized, users)
+    lru_time = best_of(run_lru, users)
+
+    print(f"{args.users} submissions, {args.repeat:.0%} repeats, Python {sys.version.split()[0]}")
+    print(f"Original class:     {legacy_time * 1e6 / args.users:7.2f} us/request")
+    print(f"Memoized __slots__: {memoized_time * 1e6 / args.users:7.2f} us/request  ({legacy_time / memoized_time:.2f}x)")
+    print(f"LRU on inputs:      {lru_time * 1e6 / args.users:7.2f} us/request  ({legacy_time / lru_time:.2f}x)")
+    print(f"Instance size:      {instance_bytes(LegacyFitnessCalculator):.0f} bytes -> {instance_bytes(FitnessCalculator):.0f} bytes")
+    print(f"Mismatched results: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
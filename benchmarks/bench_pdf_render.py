@@ -0,0 +1,116 @@
+"""
+Benchmark plan PDF rendering: plans/second and peak memory
+
+Compares PlanRenderer with the original per-line multi_cell renderer on short,
+typical and very long LLM outputs. Run from the repository root:
+    python -m benchmarks.bench_pdf_render --plans 50
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from fpdf import FPDF
+
+from api.pdf_renderer import PlanRenderer, clean_text, metrics_lines, SENIOR_NOTE_TITLE, SENIOR_NOTE_LINES
+from api.streaming import strip_think
+from benchmarks.ollama_stub import SAMPLE_PLAN
+
+METRICS = {
+    "bmi": 24.69,
+    "bodyFatPercentage": 18.2,
+    "bmr": 1780,
+    "tdee": 2759,
+    "goalCalories": 2207,
+    "macros": {"protein": 176, "carbs": 238, "fat": 61}
+}
+
+LONG_PARAGRAPH = (
+    "Consistency matters more than intensity, so pick a schedule you can keep for months rather than weeks, "
+    "and treat every session as practice for the next one instead of a test you need to pass. "
+) * 6
+
+
+def make_cases():
+    """Short, typical and very long plan bodies"""
+    typical = strip_think(SAMPLE_PLAN)
+    short = "\n".join(typical.split("\n")[:12])
+    long = "\n\n".join([typical, LONG_PARAGRAPH] * 15)
+    return {"short": short, "typical": typical, "long": long}
+
+
+def render_legacy(content, user_name, metrics, age, filepath):
+    """The original generate_pdf layout, one multi_cell call per line"""
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(0, 10, f"Personalized Fitness Plan for {clean_text(user_name)}", ln=True, align="C")
+    pdf.ln(5)
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 10, "Your Health Metrics:", ln=True)
+    pdf.set_font("Arial", "", 10)
+    for line in metrics_lines(metrics):
+        pdf.cell(0, 8, line, ln=True)
+    pdf.ln(5)
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 10, "Your Personalized Plan:", ln=True)
+    pdf.set_font("Arial", "", 10)
+    for line in clean_text(content).split('\n'):
+        if not line.strip():
+            pdf.ln(3)
+            continue
+        if line.strip().upper() == line.strip() and len(line.strip()) > 0 and not line.startswith(' '):
+            pdf.ln(5)
+            pdf.set_font("Arial", "B", 12)
+            pdf.cell(0, 10, line, ln=True)
+            pdf.set_font("Arial", "", 10)
+        else:
+            pdf.multi_cell(0, 5, line)
+    if age and int(age) >= 50:
+        pdf.ln(10)
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 10, SENIOR_NOTE_TITLE, ln=True)
+        pdf.set_font("Arial", "", 10)
+        for line in SENIOR_NOTE_LINES:
+            pdf.multi_cell(0, 5, line)
+    pdf.ln(10)
+    pdf.set_font("Arial", "I", 8)
+    pdf.cell(0, 10, f"Generated on {time.strftime('%Y-%m-%d %H:%M:%S')}", ln=True, align="C")
+    pdf.output(filepath)
+
+
+def measure(render, content, plans, output_dir):
+    """Return (plans/second, peak traced memory in KiB) for rendering content repeatedly"""
+    filepath = os.path.join(output_dir, "bench.pdf")
+    render(content, "Alex", METRICS, 55, filepath)  # warm-up
+
+    start = time.perf_counter()
+    for _ in range(plans):
+        render(content, "Alex", METRICS, 55, filepath)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    render(content, "Alex", METRICS, 55, filepath)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return plans / elapsed, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--plans', type=int, default=50, help='plans rendered per case')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        renderer = PlanRenderer(output_dir)
+        print(f"{'case':<10}{'lines':>7}{'legacy/s':>12}{'renderer/s':>12}{'speedup':>9}{'legacy KiB':>12}{'renderer KiB':>14}")
+        for name, content in make_cases().items():
+            legacy_rate, legacy_peak = measure(render_legacy, content, args.plans, output_dir)
+            rate, peak = measure(renderer.render_pdf, content, args.plans, output_dir)
+            lines = content.count('\n') + 1
+            print(f"{name:<10}{lines:>7}{legacy_rate:>12.1f}{rate:>12.1f}{rate / legacy_rate:>8.1f}x{legacy_peak:>12.0f}{peak:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare recomputing a progress chart from raw history with ProgressSeries
+
+The baseline derives every metric for every stored measurement on each view,
+as a stateless /api/calculate-based chart has to. ProgressSeries derives each
+point once when it is added and answers views from running sums.
+Run from the repository root:
+    python -m benchmarks.bench_progress --days 3650 --views 200 --points 120
+"""
+import argparse
+import random
+import time
+
+from models.fitness_calculator import FitnessCalculator
+from models.progress_series import ProgressSeries, DAY
+
+PROFILE = (34.0, 178.0, 'male', 'moderate', 'lose_fat')
+
+
+def make_history(days, seed=42):
+    """One measurement a day with a slow downward trend and daily noise"""
+    rng = random.Random(seed)
+    start = 1.7e9
+    return [(start + day * DAY, 95 - day * 0.005 + rng.uniform(-0.6, 0.6), 100 - day * 0.003 + rng.uniform(-0.4, 0.4), 40.0)
+            for day in range(days)]
+
+
+def recompute_view(history, points):
+    """Derive every point, then average them into at most points buckets"""
+    age, height, gender, activity_level, goal = PROFILE
+    derived = []
+    for timestamp, weight, waist, neck in history:
+        calculator = FitnessCalculator(age, weight, height, waist, neck, gender, activity_level, goal)
+        derived.append((timestamp, calculator.calculate_bmi(), calculator.calculate_body_fat(), calculator.calculate_tdee()))
+    size = -(-len(derived) // points)
+    return [tuple(sum(values) / len(values) for values in zip(*derived[index:index + size]))
+            for index in range(0, len(derived), size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=3650, help='daily measurements in the history')
+    parser.add_argument('--views', type=int, default=200, help='chart views to time')
+    parser.add_argument('--points', type=int, default=120, help='points per chart')
+    args = parser.parse_args()
+
+    history = make_history(args.days)
+
+    start = time.perf_counter()
+    for _ in range(args.views):
+        recompute_view(history, args.points)
+    recompute = (time.perf_counter() - start) / args.views
+
+    series = ProgressSeries()
+    start = time.perf_counter()
+    for point in history:
+        series.add(*point, PROFILE)
+    append = (time.perf_counter() - start) / len(history)
+
+    start = time.perf_counter()
+    for _ in range(args.views):
+        series.range(max_points=args.points)
+    view = (time.perf_counter() - start) / args.views
+
+    print(f"{args.days} measurements, {args.points}-point chart")
+    print(f"recompute per view:   {recompute * 1000:8.2f} ms")
+    print(f"series per view:      {view * 1000:8.2f} ms  ({recompute / view:.0f}x faster)")
+    print(f"series per new point: {append * 1e6:8.1f} us")
+
+
+if __name__ == '__main__':
+    main()
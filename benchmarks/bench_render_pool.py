@@ -0,0 +1,73 @@
+"""
+Load test concurrent plan rendering: inline threads vs the process pool
+
+Request threads render plans concurrently, either inline (holding the GIL) or
+through RenderPool workers. Run from the repository root:
+    python -m benchmarks.bench_render_pool --threads 8 --plans 200 --workers 4
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api.render_pool import RenderPool
+from benchmarks.bench_pdf_render import make_cases, METRICS
+
+
+def run(pool, content, threads, plans):
+    """Render plans from a pool of request threads and return (plans/s, max thread stall)"""
+    stalls = []
+    stall_lock = threading.Lock()
+    stop = threading.Event()
+
+    def heartbeat():
+        # Measures how long a light-weight thread waits to be scheduled while renders run
+        while not stop.is_set():
+            start = time.perf_counter()
+            time.sleep(0.005)
+            with stall_lock:
+                stalls.append(time.perf_counter() - start - 0.005)
+
+    def render(index):
+        return pool.render(content, "Alex", METRICS, 55, f"bench_{index}")
+
+    monitor = threading.Thread(target=heartbeat, daemon=True)
+    monitor.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(render, range(plans)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    monitor.join()
+    return plans / elapsed, max(stalls) * 1000 if stalls else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8, help='concurrent request threads')
+    parser.add_argument('--plans', type=int, default=200, help='plans rendered per run')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='process pool size')
+    parser.add_argument('--case', choices=['short', 'typical', 'long'], default='typical')
+    args = parser.parse_args()
+
+    content = make_cases()[args.case]
+    with tempfile.TemporaryDirectory() as output_dir:
+        inline = RenderPool(output_dir, workers=0)
+        pooled = RenderPool(output_dir, workers=args.workers)
+        pooled.start()
+        try:
+            inline_rate, inline_stall = run(inline, content, args.threads, args.plans)
+            pooled_rate, pooled_stall = run(pooled, content, args.threads, args.plans)
+        finally:
+            pooled.shutdown()
+
+    print(f"Case: {args.case}, {args.threads} request threads, {args.plans} plans, {args.workers} workers")
+    print(f"Inline:        {inline_rate:8.1f} plans/s  (max heartbeat stall {inline_stall:.1f} ms)")
+    print(f"Process pool:  {pooled_rate:8.1f} plans/s  (max heartbeat stall {pooled_stall:.1f} ms)")
+    print(f"Speedup:       {pooled_rate / inline_rate:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
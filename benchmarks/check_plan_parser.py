@@ -0,0 +1,102 @@
+"""
+Plan parser check: fails if plan text stops parsing into the expected sections
+
+Parses plans in the heading styles the models produce (plain, numbered and
+with ALL CAPS day headings and bullets) and checks the section kinds, the
+workout and meal days and that lines keep the order they were written in.
+Exits non-zero on any mismatch, so it can gate CI. Run from the repository
+root:
+    python -m benchmarks.check_plan_parser
+"""
+import re
+import sys
+
+from api.plan_structure import parse_plan
+from api.streaming import strip_think
+from benchmarks.ollama_stub import SAMPLE_PLAN
+
+SECTION_KINDS = ["workout", "meal", "rest_day", "routines", "summary"]
+
+# The sample plan with its headings numbered as in the prompt, "1. WORKOUT PLAN" and so on
+SECTION_TITLES = ("WORKOUT PLAN", "MEAL PLAN", "REST DAY RECOMMENDATIONS", "MORNING AND EVENING ROUTINES", "GENERAL SUGGESTIONS")
+NUMBERED_PLAN = re.sub(
+    '^(' + '|'.join(SECTION_TITLES) + ')$',
+    lambda match: f"{SECTION_TITLES.index(match.group(1)) + 1}. {match.group(1)}",
+    strip_think(SAMPLE_PLAN),
+    flags=re.MULTILINE
+)
+
+CAPS_PLAN = """WORKOUT PLAN
+
+DAY 1: UPPER BODY
+- Bench press: 3 sets of 8 reps
+- HIIT
+
+DAY 2: LOWER BODY
+- Squats: 4 sets of 8 reps
+
+DAY 3: CONDITIONING
+- 20 minutes of cycling
+
+MEAL PLAN
+
+DAY 1
+- Breakfast: Oats with berries
+This is rich in fiber.
+- Lunch: Chicken salad
+- Dinner: Salmon with quinoa
+
+DAY 2
+- Breakfast: Eggs on toast
+- Lunch: Turkey wrap
+- Dinner: Beef stir-fry
+
+DAY 3
+- Breakfast: Smoothie
+- Lunch: Lentil soup
+- Dinner: Chicken with sweet potato
+
+REST DAY RECOMMENDATIONS
+
+- Walk for 30 minutes
+
+MORNING AND EVENING ROUTINES
+
+MORNING ROUTINE: Drink water
+EVENING ROUTINE: Read before bed
+
+GENERAL SUGGESTIONS
+
+Stay consistent.
+"""
+
+
+def check(name, text, expected_text_order=()):
+    """Return the problems found parsing one plan"""
+    plan = parse_plan(text)
+    problems = []
+    kinds = [section.kind for section in plan.sections]
+    if kinds != SECTION_KINDS:
+        problems.append(f"sections {kinds}, expected {SECTION_KINDS}")
+    if len(plan.workout_days) != 3 or not all(day.exercises for day in plan.workout_days):
+        problems.append(f"{len(plan.workout_days)} workout days, expected 3 with exercises")
+    if len(plan.meal_days) != 3 or not all(len(day.meals) >= 3 for day in plan.meal_days):
+        problems.append(f"{len(plan.meal_days)} meal days, expected 3 with at least 3 meals each")
+    rendered = plan.to_text()
+    positions = [rendered.find(line) for line in expected_text_order]
+    if -1 in positions or positions != sorted(positions):
+        problems.append(f"lines out of order: {list(expected_text_order)}")
+    print(f"{name:10} {'OK' if not problems else 'FAIL: ' + '; '.join(problems)}")
+    return problems
+
+
+def main():
+    failed = False
+    failed |= bool(check("sample", strip_think(SAMPLE_PLAN)))
+    failed |= bool(check("numbered", NUMBERED_PLAN))
+    failed |= bool(check("caps", CAPS_PLAN, ("Oats with berries", "This is rich in fiber.", "Chicken salad")))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Startup budget check: fails if importing the API gets slower or eager again
+
+Imports api.app in fresh interpreters, takes the best time of several runs
+and checks that none of the lazily initialized dependencies were loaded.
+Exits non-zero when the import takes longer than --budget seconds or a
+heavy module shows up, so it can gate CI. Run from the repository root:
+    python -m benchmarks.check_startup --budget 0.5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Modules only the components behind LazyComponent may import
+LAZY_MODULES = ("supabase", "fpdf", "requests", "numpy", "httpx", "asyncio", "sqlite3")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in {lazy!r} if name in sys.modules]}}))
+"""
+
+
+def probe(module, env):
+    code = PROBE.format(module=module, lazy=LAZY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--module', default='api.app')
+    parser.add_argument('--budget', type=float, default=0.5, help='seconds allowed for the import')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    # Warm-up would initialize components in the background and blur the measurement
+    env = dict(os.environ, WARM_UP="")
+    results = [probe(args.module, env) for _ in range(args.runs)]
+    best = min(result["seconds"] for result in results)
+    loaded = sorted({name for result in results for name in result["loaded"]})
+
+    print(f"import {args.module}: best {best * 1000:.0f} ms of {args.runs} runs (budget {args.budget * 1000:.0f} ms)")
+    failed = False
+    if best > args.budget:
+        print("FAIL: import is over budget")
+        failed = True
+    if loaded:
+        print(f"FAIL: loaded at import time: {', '.join(loaded)}")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+"""
+Load test the API against the Ollama stub and in-memory Supabase
+
+Starts the server in a subprocess with SUPABASE_BACKEND=memory and OLLAMA_URL
+pointed at the stub, seeds users and plans, then drives a weighted mix of
+/api/calculate, /api/generate-plan, /api/plan-file and user/plan CRUD
+requests from a fixed number of concurrent clients. Reports requests/second
+and p50/p95/p99 latency per route, and the server's peak RSS, open file
+descriptors and threads (Linux).
+
+Each run is saved as JSON under --baseline-dir and compared with the
+previous run of the same name; --fail-on-regression makes regressions
+beyond --tolerance exit non-zero. Run from the repository root:
+    python -m benchmarks.load_test --mix default --concurrency 16 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import httpx
+
+from benchmarks.bench_async_serving import SERVERS, PLAN_REQUEST, free_port, percentile, process_usage
+from benchmarks.ollama_stub import start_stub
+
+# Route weights for each traffic mix
+MIXES = {
+    "default": {"calculate": 40, "crud": 30, "plan_file": 20, "generate_plan": 10},
+    "read_heavy": {"calculate": 30, "crud": 50, "plan_file": 20},
+    "generation": {"generate_plan": 70, "plan_file": 30},
+}
+
+GOALS = ("lose_fat", "maintenance", "build_muscle")
+ACTIVITY_LEVELS = ("sedentary", "light", "moderate", "active", "very_active")
+
+# A regression is a p95/p99 or peak RSS increase, or a requests/second drop, beyond the tolerance
+LOWER_IS_BETTER = ("p95", "p99")
+# Routes with fewer measured requests are reported but not flagged; their tail latencies are noise
+MIN_SAMPLES = 50
+
+
+def open_fds(pid):
+    """Open file descriptors of a process, or 0 where /proc is unavailable"""
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return 0
+
+
+class LoadState:
+    def __init__(self, seed, profiles):
+        """Users and plan files created so far, shared by the clients"""
+        self.user_ids = []
+        self.plan_files = []
+        self.profiles = profiles
+        self.seed = seed
+
+
+def plan_profiles(count, seed):
+    """Distinct plan requests; clients pick from them, so repeats hit the plan cache"""
+    rng = random.Random(seed)
+    profiles = []
+    for index in range(count):
+        profiles.append(dict(
+            PLAN_REQUEST,
+            name=f"User {index}",
+            age=rng.randint(20, 70),
+            goal=rng.choice(GOALS),
+            activityLevel=rng.choice(ACTIVITY_LEVELS)
+        ))
+    return profiles
+
+
+async def calculate(client, rng, state):
+    body = {
+        "age": rng.randint(18, 80), "weight": round(rng.uniform(45, 140), 1), "height": round(rng.uniform(150, 205), 1),
+        "waist": round(rng.uniform(65, 130), 1), "neck": round(rng.uniform(30, 45), 1),
+        "gender": rng.choice(("male", "female")), "activityLevel": rng.choice(ACTIVITY_LEVELS), "goal": rng.choice(GOALS)
+    }
+    return "POST /api/calculate", await client.post("/api/calculate", json=body)
+
+
+async def crud(client, rng, state):
+    roll = rng.random()
+    user_id = rng.choice(state.user_ids)
+    if roll < 0.1:
+        response = await client.post("/api/user", json={"name": "Load Test", "email": f"load{rng.random()}@example.com"})
+        if response.status_code == 201:
+            state.user_ids.append(response.json()["id"])
+        return "POST /api/user", response
+    if roll < 0.5:
+        return "GET /api/user/<id>", await client.get(f"/api/user/{user_id}")
+    if roll < 0.65:
+        return "PUT /api/user/<id>", await client.put(f"/api/user/{user_id}", json={"weight": rng.randint(50, 110)})
+    if roll < 0.75:
+        return "POST /api/plan/<id>", await client.post(f"/api/plan/{user_id}", json={"mealPlan": {"days": 7}})
+    return "GET /api/plan/<id>", await client.get(f"/api/plan/{user_id}")
+
+
+async def generate_plan(client, rng, state):
+    body = dict(rng.choice(state.profiles), userId=rng.choice(state.user_ids))
+    response = await client.post("/api/generate-plan", json=body)
+    if response.status_code == 200:
+        state.plan_files.append(response.json()["planFile"])
+    return "POST /api/generate-plan", response
+
+
+async def plan_file(client, rng, state):
+    return "GET /api/plan-file/<name>", await client.get(f"/api/plan-file/{rng.choice(state.plan_files)}")
+
+
+OPERATIONS = {"calculate": calculate, "crud": crud, "generate_plan": generate_plan, "plan_file": plan_file}
+
+
+async def seed(client, state, users, plans):
+    """Create users, then generate plans so downloads have files to fetch"""
+    response = await client.post("/api/users/batch", json=[
+        {"name": f"User {index}", "email": f"user{index}@example.com"} for index in range(users)
+    ])
+    response.raise_for_status()
+    state.user_ids.extend(user["id"] for user in response.json())
+    rng = random.Random(state.seed)
+    for _ in range(plans):
+        _, response = await generate_plan(client, rng, state)
+        response.raise_for_status()
+
+
+async def drive(url, mix, state, concurrency, duration, warmup):
+    """Run the mix from concurrency clients; returns (route -> [(latency, status)], elapsed)"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=600, limits=limits) as client:
+        if not state.user_ids:
+            await seed(client, state, users=50, plans=3)
+
+        measure_from = time.perf_counter() + warmup
+        deadline = measure_from + duration
+
+        async def worker(index):
+            rng = random.Random(state.seed * 1000 + index)
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    return
+                operation = OPERATIONS[rng.choices(names, weights)[0]]
+                try:
+                    route, response = await operation(client, rng, state)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    route, status = operation.__name__, type(e).__name__
+                if now >= measure_from:
+                    samples.setdefault(route, []).append((time.perf_counter() - now, status))
+
+        await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    return samples, duration
+
+
+def summarize(samples, elapsed):
+    """requests, errors, statuses, requests/second and latency percentiles (ms) for some samples"""
+    latencies = [latency for latency, _ in samples]
+    statuses = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "statuses": statuses,
+        "rps": round(len(samples) / elapsed, 2),
+        "p50": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99": round(percentile(latencies, 0.99) * 1000, 2)
+    }
+
+
+def run(args):
+    stub = start_stub(latency=args.llm_latency, tokens_per_second=args.tokens_per_second)
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    port = free_port()
+    env = dict(
+        os.environ,
+        SUPABASE_BACKEND="memory",
+        OLLAMA_URL=stub.url,
+        OLLAMA_MAX_CONCURRENCY=str(args.llm_slots),
+        RATE_LIMIT_PER_MINUTE="0",
+        ADMISSION_MAX_QUEUE=str(args.concurrency),
+        PROFILER_ENABLED="0",
+        PLANS_DIR=os.path.join(workdir, "plans"),
+        PLAN_CACHE_DIR=os.path.join(workdir, "plan_cache"),
+        PLAN_INDEX_PATH=os.path.join(workdir, "plan_index.sqlite3"),
+        PROGRESS_DB_PATH=os.path.join(workdir, "progress.sqlite3"),
+        WARM_UP="all"
+    )
+    server = subprocess.Popen(SERVERS[args.server] + [str(port)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    peak = {"rss": 0.0, "fds": 0, "threads": 0}
+    stop = threading.Event()
+
+    def sample():
+        while not stop.is_set():
+            threads, rss = process_usage(server.pid)
+            peak["threads"] = max(peak["threads"], threads)
+            peak["rss"] = max(peak["rss"], rss)
+            peak["fds"] = max(peak["fds"], open_fds(server.pid))
+            time.sleep(0.05)
+
+    try:
+        for _ in range(300):
+            try:
+                if httpx.get(f"{url}/api/ready", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        idle_threads, idle_rss = process_usage(server.pid)
+        idle_fds = open_fds(server.pid)
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        state = LoadState(args.seed, plan_profiles(args.profiles, args.seed))
+        samples, elapsed = asyncio.run(drive(url, MIXES[args.mix], state, args.concurrency, args.duration, args.warmup))
+        stop.set()
+        sampler.join()
+    finally:
+        stop.set()
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "name": args.name or f"{args.mix}-{args.server}-c{args.concurrency}",
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "settings": {
+            "mix": args.mix, "server": args.server, "concurrency": args.concurrency, "duration": args.duration,
+            "llmLatency": args.llm_latency, "tokensPerSecond": args.tokens_per_second, "llmSlots": args.llm_slots,
+            "profiles": args.profiles, "seed": args.seed, "cpus": os.cpu_count()
+        },
+        "overall": summarize([sample for route in samples.values() for sample in route], elapsed),
+        "routes": {route: summarize(route_samples, elapsed) for route, route_samples in sorted(samples.items())},
+        "server": {
+            "idleRssMb": round(idle_rss, 1), "peakRssMb": round(peak["rss"], 1),
+            "idleFds": idle_fds, "peakFds": peak["fds"],
+            "idleThreads": idle_threads, "peakThreads": peak["threads"]
+        }
+    }
+
+
+def change(old, new):
+    return (new - old) / old if old else 0.0
+
+
+def compare(previous, result, tolerance):
+    """Print the change of every figure against the previous run; returns the regressions found"""
+    regressions = []
+
+    def check(label, old, new):
+        for key in ("rps",) + LOWER_IS_BETTER:
+            if key not in old or key not in new:
+                continue
+            delta = change(old[key], new[key])
+            worse = -delta if key == "rps" else delta
+            flag = "  REGRESSION" if worse > tolerance and new["requests"] >= MIN_SAMPLES else ""
+            if flag:
+                regressions.append(f"{label} {key}")
+            print(f"  {label:32} {key:4} {old[key]:10.2f} -> {new[key]:10.2f}  ({delta:+.0%}){flag}")
+
+    print(f"Compared with {previous['timestamp']}:")
+    check("overall", previous["overall"], result["overall"])
+    for route, stats in result["routes"].items():
+        if route in previous["routes"]:
+            check(route, previous["routes"][route], stats)
+    old_rss, new_rss = previous["server"]["peakRssMb"], result["server"]["peakRssMb"]
+    rss_delta = change(old_rss, new_rss)
+    flag = "  REGRESSION" if rss_delta > tolerance else ""
+    if flag:
+        regressions.append("peak RSS")
+    print(f"  {'server':32} RSS  {old_rss:10.1f} -> {new_rss:10.1f}  ({rss_delta:+.0%}){flag}")
+    return regressions
+
+
+def report(result):
+    settings = result["settings"]
+    print(f"{result['name']}: {settings['concurrency']} clients for {settings['duration']}s, "
+          f"stub latency {settings['llmLatency']}s at {settings['tokensPerSecond'] or 'unlimited'} tokens/s")
+    print(f"  {'route':32} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, stats in list(result["routes"].items()) + [("overall", result["overall"])]:
+        print(f"  {route:32} {stats['requests']:8} {stats['errors']:6} {stats['rps']:8.1f} "
+              f"{stats['p50']:8.1f} {stats['p95']:8.1f} {stats['p99']:8.1f}")
+    server = result["server"]
+    print(f"  server RSS {server['idleRssMb']}->{server['peakRssMb']} MB  fds {server['idleFds']}->{server['peakFds']}  "
+          f"threads {server['idleThreads']}->{server['peakThreads']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mix', choices=sorted(MIXES), default='default')
+    parser.add_argument('--server', choices=sorted(SERVERS), default='flask')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds of traffic before measuring')
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='stub seconds before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=0, help='stub token rate, 0 for unlimited')
+    parser.add_argument('--llm-slots', type=int, default=8, help='OLLAMA_MAX_CONCURRENCY for the server')
+    parser.add_argument('--profiles', type=int, default=20, help='distinct plan requests in the mix')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--name', help='baseline name, defaults to <mix>-<server>-c<concurrency>')
+    parser.add_argument('--baseline-dir', default=os.path.join(os.path.dirname(__file__), 'baselines'))
+    parser.add_argument('--no-save', action='store_true', help="don't replace the stored baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative change counted as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    result = run(args)
+    report(result)
+
+    path = os.path.join(args.baseline_dir, f"{result['name']}.json")
+    regressions = []
+    if os.path.exists(path):
+        with open(path) as f:
+            regressions = compare(json.load(f), result, args.tolerance)
+    if not args.no_save:
+        os.makedirs(args.baseline_dir, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved {path}")
+    if regressions and args.fail_on_regression:
+        print(f"FAIL: {', '.join(regressions)} regressed by more than {args.tolerance:.0%}")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+Deterministic local stand-in for the Ollama HTTP API
+
+Serves /api/generate (streaming and non-streaming) and /api/tags with a canned
+plan so the API can be exercised without a model server. Run from the
+repository root and point OLLAMA_URL at it:
+    python -m benchmarks.ollama_stub --port 11435 --latency 2
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_PLAN = """<think>
+The user wants a structured plan. I will lay out workouts first, then meals.
+</think>
+
+WORKOUT PLAN
+
+Day 1: Upper Body Strength
+- Bench press: 3 sets of 8-10 reps
+- Bent-over rows: 3 sets of 8-10 reps
+- Overhead press: 3 sets of 10 reps
+
+Day 2: Lower Body Strength
+- Squats: 4 sets of 8 reps
+- Romanian deadlifts: 3 sets of 10 reps
+- Walking lunges: 3 sets of 12 steps per leg
+
+Day 3: Conditioning and Core
+- 20 minutes of brisk walking or cycling
+- Plank: 3 holds of 45 seconds
+- Dead bugs: 3 sets of 12 reps
+
+MEAL PLAN
+
+Day 1
+- Breakfast: Greek yogurt with berries and oats
+- Lunch: Grilled chicken salad with olive oil dressing
+- Dinner: Baked salmon with quinoa and steamed broccoli
+- Snacks: An apple and a handful of almonds
+
+Day 2
+- Breakfast: Scrambled eggs with spinach on wholegrain toast
+- Lunch: Turkey and vegetable wrap
+- Dinner: Lean beef stir-fry with brown rice
+- Snacks: Cottage cheese with pineapple
+
+Day 3
+- Breakfast: Protein smoothie with banana and peanut butter
+- Lunch: Lentil soup with a side salad
+- Dinner: Chicken breast with sweet potato and green beans
+- Snacks: Carrot sticks with hummus
+
+REST DAY RECOMMENDATIONS
+
+- Take a 30 minute walk outdoors
+- Spend 15 minutes on gentle stretching or yoga
+- Prioritize 7-9 hours of sleep
+
+MORNING AND EVENING ROUTINES
+
+- Morning: Drink a glass of water and do 5 minutes of mobility work
+- Evening: Limit screens an hour before bed and prepare tomorrow's meals
+
+GENERAL SUGGESTIONS
+
+Your metrics are a solid starting point. Stay consistent, track your progress
+weekly and adjust portions if your weight stalls for more than two weeks.
+"""
+
+
+def tokenize(text):
+    """Split text into word-sized chunks that keep their trailing whitespace"""
+    tokens = []
+    current = ""
+    for char in text:
+        current += char
+        if char in " \n":
+            tokens.append(current)
+            current = ""
+    if current:
+        tokens.append(current)
+    return tokens
+
+
+def completion(text, request):
+    """
+    The tokens Ollama would return for a request, and why it stopped
+
+    Honors think=false (no <think> block), options.stop and options.num_predict,
+    which reports done_reason "length" when it cuts the completion short.
+    """
+    options = request.get("options", {})
+    if request.get("think") is False and "</think>" in text:
+        text = text.split("</think>", 1)[1].lstrip("\n")
+    for stop in options.get("stop", []):
+        if stop in text:
+            text = text[:text.index(stop)]
+    tokens = tokenize(text)
+    limit = options.get("num_predict")
+    if limit and 0 < limit < len(tokens):
+        return tokens[:limit], "length"
+    return tokens, "stop"
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": self.server.model}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.record_request(request)
+
+        if self.server.fail:
+            self._send_json(500, {"error": "stub configured to fail"})
+            return
+
+        time.sleep(self.server.latency)
+        tokens, done_reason = completion(self.server.response_text, request)
+        delay = 1.0 / self.server.tokens_per_second if self.server.tokens_per_second else 0
+        model = request.get("model", self.server.model)
+
+        if request.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(delay)
+                self._write_chunk({"model": model, "response": token, "done": False})
+            self._write_chunk({"model": model, "response": "", "done": True, "done_reason": done_reason, "eval_count": len(tokens)})
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            time.sleep(delay * len(tokens))
+            self._send_json(200, {
+                "model": model,
+                "response": "".join(tokens),
+                "done": True,
+                "done_reason": done_reason,
+                "eval_count": len(tokens),
+                "eval_duration": int(delay * len(tokens) * 1e9)
+            })
+
+    def _write_chunk(self, body):
+        line = (json.dumps(body) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+
+class OllamaStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Burst tests open hundreds of connections at once
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.0, tokens_per_second=0, response_text=SAMPLE_PLAN, model="deepseek-r1:8b"):
+        """
+        Threaded HTTP server answering like Ollama
+
+        Parameters:
+        - latency: seconds to wait before the first token
+        - tokens_per_second: token rate, 0 means send everything at once
+        - response_text: the completion returned for every prompt
+        """
+        super().__init__(address, OllamaStubHandler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_text = response_text
+        self.model = model
+        self.fail = False
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def record_request(self, request):
+        with self._lock:
+            self.requests.append(request)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_stub(port=0, **options):
+    """Start a stub server on a background thread and return it"""
+    server = OllamaStubServer(("127.0.0.1", port), **options)
+    thread = threading.Thread(target=server.serve_forever, name="ollama-stub", daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=0, help='0 sends the whole completion at once')
+    args = parser.parse_args()
+
+    server = OllamaStubServer(("127.0.0.1", args.port), latency=args.latency, tokens_per_second=args.tokens_per_second)
+    print(f"Ollama stub listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+# CLI package initialization
\ No newline at end of file
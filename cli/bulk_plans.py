@@ -0,0 +1,333 @@
+"""
+Generate fitness plans for a whole cohort of users from a CSV or JSONL file
+
+Each input row holds the same fields as /api/calculate plus optional id,
+name, email, cuisine, restrictions and medicalConditions (';'-separated in
+CSV). Metrics are computed in bulk, plans are generated with bounded LLM
+concurrency and rendered in parallel into OUT/plans. Every finished user is
+appended to OUT/manifest.jsonl, and re-running the same command resumes
+after the users already done. Run from the repository root:
+    python -m cli.bulk_plans users.csv --out onboarding/acme --concurrency 4
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api.plan_cache import PlanCache, lookup_plan, personalize
+from api.plan_sections import SectionedPlanGenerator, build_plan_prompt
+from api.render_pool import RenderPool
+from api.streaming import strip_think
+from models.batch_calculator import BatchFitnessCalculator
+from utils.config import Config
+from utils.llm_client import LLMUnavailableError
+from utils.llm_router import LLMRouter
+
+REQUIRED_FIELDS = ('age', 'weight', 'height', 'waist', 'neck')
+NUMERIC_FIELDS = REQUIRED_FIELDS
+# Manifest statuses that are not retried on resume
+FINISHED_STATUSES = {"done", "invalid"}
+
+
+def _number(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    return float(value)
+
+
+def normalize_user(row, index):
+    """Map a CSV/JSONL row onto the fields used by the API, with a stable id"""
+    user = {key: value for key, value in row.items() if key is not None}
+    user['id'] = str(user.get('id') or f"row-{index}")
+    user['activityLevel'] = user.get('activityLevel') or user.get('activity_level') or 'moderate'
+    user['gender'] = user.get('gender') or 'male'
+    user['goal'] = user.get('goal') or 'maintenance'
+    preferences = user.get('preferences') or {}
+    user['preferences'] = {
+        "cuisine": preferences.get('cuisine', user.get('cuisine') or 'Not provided'),
+        "restrictions": preferences.get('restrictions', user.get('restrictions') or 'None')
+    }
+    conditions = user.get('medicalConditions') or []
+    if isinstance(conditions, str):
+        conditions = [condition.strip() for condition in conditions.split(';') if condition.strip()]
+    user['medicalConditions'] = conditions
+    for field in NUMERIC_FIELDS:
+        try:
+            user[field] = _number(user.get(field))
+        except (TypeError, ValueError):
+            # Recorded as invalid instead of stopping the run on this row
+            user['error'] = f"Invalid {field}: {user.get(field)!r}"
+            user[field] = None
+    if isinstance(user['age'], float) and user['age'].is_integer():
+        user['age'] = int(user['age'])
+    return user
+
+
+def iter_users(path):
+    """
+    Stream users from a .csv or .jsonl file without loading it into memory
+
+    A row that can't be read comes back as {"id", "error"}, so it is recorded
+    as invalid and skipped on resume instead of aborting the run.
+    """
+    csv_file = path.lower().endswith('.csv')
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        rows = csv.DictReader(f) if csv_file else (line for line in f if line.strip())
+        for index, row in enumerate(rows, start=1):
+            try:
+                user = normalize_user(row if csv_file else json.loads(row), index)
+            except (TypeError, ValueError, AttributeError) as e:
+                user = {"id": f"row-{index}", "error": f"Invalid row: {e}"}
+            yield user
+
+
+def iter_chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def with_metrics(users):
+    """Compute metrics for a chunk of users in one vectorized pass; returns (user, metrics or error)"""
+    valid = [user for user in users if "error" not in user and all(user.get(field) for field in REQUIRED_FIELDS)]
+    results = {}
+    if valid:
+        calculator = BatchFitnessCalculator(
+            ages=[user['age'] for user in valid],
+            weights=[user['weight'] for user in valid],
+            heights=[user['height'] for user in valid],
+            waists=[user['waist'] for user in valid],
+            necks=[user['neck'] for user in valid],
+            genders=[user['gender'] for user in valid],
+            activity_levels=[user['activityLevel'] for user in valid],
+            goals=[user['goal'] for user in valid]
+        )
+        for user, result in zip(valid, calculator.calculate_all()):
+            results[id(user)] = result
+    for user in users:
+        yield user, results.get(id(user), {"error": user.get("error", "Missing required fields")})
+
+
+def plan_request(user, metrics):
+    """Request body in the shape /api/generate-plan receives it"""
+    return {
+        "name": user.get('name') or 'User',
+        "age": user['age'],
+        "goal": user['goal'],
+        "metrics": metrics,
+        "preferences": user['preferences'],
+        "medicalConditions": user['medicalConditions']
+    }
+
+
+def plan_basename(user_id):
+    """File-system safe, collision-free base name for a user's plan"""
+    safe = re.sub(r'[^A-Za-z0-9_-]', '_', user_id)[:48]
+    return f"plan_{safe}_{hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:8]}"
+
+
+def load_manifest(path):
+    """Return the ids whose last manifest entry is finished; tolerates a torn last line"""
+    statuses = {}
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            statuses[entry.get("id")] = entry.get("status")
+    return {user_id for user_id, status in statuses.items() if status in FINISHED_STATUSES}
+
+
+class BulkPlanRunner:
+    def __init__(self, out_dir, concurrency=4, render_workers=0, retries=3, sectioned=True, use_cache=True):
+        """
+        Generates and renders plans for users streamed from an input file
+
+        At most concurrency users are in flight, and at most twice that many
+        are buffered, so memory stays flat no matter how large the input is.
+        """
+        self.out_dir = out_dir
+        self.plans_dir = os.path.join(out_dir, 'plans')
+        self.manifest_path = os.path.join(out_dir, 'manifest.jsonl')
+        self.concurrency = concurrency
+        self.retries = retries
+        os.makedirs(self.plans_dir, exist_ok=True)
+
+        self.llm = LLMRouter.from_config(Config)
+        self.plan_cache = None
+        if use_cache and Config.PLAN_CACHE_ENABLED:
+            self.plan_cache = PlanCache(
+                cache_dir=Config.PLAN_CACHE_DIR or os.path.join(os.path.dirname(__file__), '../plan_cache'),
+                memory_entries=Config.PLAN_CACHE_MEMORY_ENTRIES,
+                ttl=Config.PLAN_CACHE_TTL,
+                max_disk_bytes=Config.PLAN_CACHE_MAX_BYTES
+            )
+        self.sections = None
+        if sectioned:
+            section_options = Config.get_generation_options(Config.OLLAMA_SECTION_NUM_PREDICT)
+            self.sections = SectionedPlanGenerator(
+                lambda prompt: self._generate(prompt, section_options),
+                cache=self.plan_cache,
+                max_parallel=Config.PLAN_SECTION_PARALLELISM,
+                bucketing=Config.PLAN_CACHE_BUCKETING
+            )
+        self.render_pool = RenderPool(self.plans_dir, workers=render_workers, start_method=Config.RENDER_START_METHOD)
+
+        self._manifest_lock = threading.Lock()
+        self._counts = {"done": 0, "failed": 0, "invalid": 0, "skipped": 0, "cached": 0}
+
+    def _generate(self, prompt, options=None):
+        """LLM call that waits out busy or recovering backends instead of failing the user"""
+        attempt = 0
+        while True:
+            try:
+                return strip_think(self.llm.generate(prompt, options)["response"])
+            except LLMUnavailableError as e:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                time.sleep(e.retry_after or min(30, 2 ** attempt))
+
+    def plan_text(self, data):
+        """Return (plan text, cached, regenerated sections), sharing the API's plan cache"""
+        user_name = data['name']
+        # The same lookup as the API's, so both serve and fill the cache alike
+        cache_key, cached_text = lookup_plan(self.plan_cache, data, sectioned=self.sections is not None,
+                                             bucketing=Config.PLAN_CACHE_BUCKETING)
+        if cached_text is not None:
+            return personalize(cached_text, user_name), True, []
+
+        if self.sections is not None:
+            text, regenerated = self.sections.generate(data)
+        else:
+            text, regenerated = self._generate(build_plan_prompt(data)), ["plan"]
+        if cache_key is not None:
+            self.plan_cache.store(cache_key, text, user_name)
+        return text, False, regenerated
+
+    def _process(self, user, metrics):
+        start = time.perf_counter()
+        entry = {"id": user['id'], "name": user.get('name'), "email": user.get('email')}
+        if "error" in metrics:
+            return dict(entry, status="invalid", error=metrics["error"])
+        try:
+            data = plan_request(user, metrics)
+            text, cached, regenerated = self.plan_text(data)
+            plan_file = self.render_pool.render(text, data['name'], metrics, user['age'], plan_basename(user['id']))
+            return dict(
+                entry,
+                status="done",
+                planFile=os.path.join('plans', plan_file),
+                metrics=metrics,
+                cached=cached,
+                regeneratedSections=regenerated,
+                seconds=round(time.perf_counter() - start, 3)
+            )
+        except Exception as e:
+            return dict(entry, status="failed", error=str(e), seconds=round(time.perf_counter() - start, 3))
+
+    def _record(self, manifest, entry):
+        with self._manifest_lock:
+            manifest.write(json.dumps(entry) + "\n")
+            manifest.flush()
+            self._counts[entry["status"]] += 1
+            if entry.get("cached"):
+                self._counts["cached"] += 1
+
+    def run(self, users, chunk_size=256, progress_every=100):
+        """Process every user not already finished in the manifest and return the counts"""
+        finished = load_manifest(self.manifest_path)
+        seen = set()
+        started = time.perf_counter()
+        # Bounds how many users are buffered ahead of the LLM workers
+        slots = threading.BoundedSemaphore(self.concurrency * 2)
+        self.render_pool.start()
+
+        def todo():
+            for user in users:
+                if user['id'] in finished or user['id'] in seen:
+                    with self._manifest_lock:
+                        self._counts["skipped"] += 1
+                    continue
+                seen.add(user['id'])
+                yield user
+
+        with open(self.manifest_path, 'a', encoding='utf-8') as manifest:
+            executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bulk-plan")
+
+            def task(user, metrics):
+                try:
+                    self._record(manifest, self._process(user, metrics))
+                finally:
+                    slots.release()
+
+            try:
+                submitted = 0
+                for chunk in iter_chunks(todo(), chunk_size):
+                    for user, metrics in with_metrics(chunk):
+                        slots.acquire()
+                        executor.submit(task, user, metrics)
+                        submitted += 1
+                        if progress_every and submitted % progress_every == 0:
+                            print(f"Submitted {submitted} users, {self._counts['done']} done, {self._counts['failed']} failed")
+                executor.shutdown(wait=True)
+            except KeyboardInterrupt:
+                print("Interrupted, waiting for users in flight; re-run the same command to resume")
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+            finally:
+                self.render_pool.shutdown()
+
+        summary = dict(self._counts, seconds=round(time.perf_counter() - started, 2))
+        with open(os.path.join(self.out_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help='CSV or JSONL file of users')
+    parser.add_argument('--out', required=True, help='output directory for plans, manifest.jsonl and summary.json')
+    parser.add_argument('--concurrency', type=int, default=Config.OLLAMA_MAX_CONCURRENCY, help='users generated at once')
+    parser.add_argument('--render-workers', type=int, default=Config.RENDER_WORKERS, help='PDF rendering processes, 0 renders inline')
+    parser.add_argument('--chunk-size', type=int, default=256, help='users per vectorized metrics pass')
+    parser.add_argument('--retries', type=int, default=3, help='waits on a busy LLM before a user is marked failed')
+    parser.add_argument('--no-sections', action='store_true', help='use the single whole-plan prompt')
+    parser.add_argument('--no-cache', action='store_true', help='do not read or fill the plan cache')
+    parser.add_argument('--restart', action='store_true', help='discard the manifest and start over')
+    args = parser.parse_args()
+
+    if args.restart and os.path.exists(os.path.join(args.out, 'manifest.jsonl')):
+        os.remove(os.path.join(args.out, 'manifest.jsonl'))
+
+    runner = BulkPlanRunner(
+        args.out,
+        concurrency=max(1, args.concurrency),
+        render_workers=args.render_workers,
+        retries=args.retries,
+        sectioned=Config.PLAN_SECTIONED and not args.no_sections,
+        use_cache=not args.no_cache
+    )
+    summary = runner.run(iter_users(args.input), chunk_size=args.chunk_size)
+    print(f"Done: {summary['done']}, failed: {summary['failed']}, invalid: {summary['invalid']}, "
+          f"skipped: {summary['skipped']}, from cache: {summary['cached']} in {summary['seconds']}s")
+    print(f"Manifest: {runner.manifest_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+import threading
+import time
+from collections import OrderedDict
+
+from utils.metrics import metrics
+
+
+class TTLCache:
+    def __init__(self, ttl=30, max_entries=10000):
+        """
+        Thread-safe LRU cache whose entries expire after ttl seconds
+
+        Every key has a version that invalidate() bumps, so a read that started
+        before a write cannot put stale data back into the cache.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (found, value)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def version(self, key):
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def set(self, key, value, version=None):
+        """Store a value, unless the key was invalidated since version was read"""
+        with self._lock:
+            if version is not None and self._versions.get(key, 0) != version:
+                return False
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._versions.pop(evicted, None)
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        """Coalesces concurrent calls for the same key into one call"""
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run fn() for key, or wait for the call already in flight; returns (result, shared)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+class DataAccessLayer:
+    def __init__(self, client, ttl=30, max_entries=10000):
+        """
+        Read-through cached, batched access to users and plans
+
+        Wraps a SupabaseClient. User and latest-plan reads are cached for ttl
+        seconds and invalidated by writes, and concurrent reads of the same key
+        share a single query.
+        """
+        self.client = client
+        self.cache = TTLCache(ttl=ttl, max_entries=max_entries)
+        self._flights = SingleFlight()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0, "roundTrips": 0}
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _call(self, method, *args):
+        self._count("roundTrips")
+        with metrics.span(f"supabase.{method}"):
+            return getattr(self.client, method)(*args)
+
+    def _read_through(self, key, method, *args):
+        found, value = self.cache.get(key)
+        if found:
+            self._count("hits")
+            return value
+
+        self._count("misses")
+        version = self.cache.version(key)
+
+        def fetch():
+            result = self._call(method, *args)
+            # Missing rows are not cached, they may be created any moment
+            if result is not None:
+                self.cache.set(key, result, version)
+            return result
+
+        result, shared = self._flights.do(key, fetch)
+        if shared:
+            self._count("coalesced")
+        return result
+
+    def _invalidate(self, key):
+        self.cache.invalidate(key)
+        self._count("invalidations")
+
+    # Users
+
+    def get_user(self, user_id):
+        return self._read_through(("user", user_id), "get_user", user_id)
+
+    def get_users(self, user_ids):
+        """Get many users, querying only the ones not already cached in one round trip"""
+        users = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            found, user = self.cache.get(("user", user_id))
+            if found:
+                users[user_id] = user
+            else:
+                missing.append(user_id)
+        self._count("hits", len(users))
+
+        if missing:
+            self._count("misses", len(missing))
+            versions = {user_id: self.cache.version(("user", user_id)) for user_id in missing}
+            for user in self._call("get_users", missing):
+                user_id = user.get("id")
+                users[user_id] = user
+                if user_id in versions:
+                    self.cache.set(("user", user_id), user, versions[user_id])
+
+        return [users[user_id] for user_id in user_ids if user_id in users]
+
+    def create_user(self, user_data):
+        user = self._call("create_user", user_data)
+        if user and user.get("id") is not None:
+            self._invalidate(("user", user["id"]))
+            self.cache.set(("user", user["id"]), user)
+        return user
+
+    def create_users(self, users):
+        created = self._call("create_users", users)
+        for user in created:
+            if user.get("id") is not None:
+                self._invalidate(("user", user["id"]))
+                self.cache.set(("user", user["id"]), user)
+        return created
+
+    def update_user(self, user_id, updated_data):
+        # Invalidate on both sides of the write so reads racing it cannot cache old data
+        self._invalidate(("user", user_id))
+        try:
+            return self._call("update_user", user_id, updated_data)
+        finally:
+            self._invalidate(("user", user_id))
+
+    # Plans
+
+    def get_plan(self, user_id):
+        """Latest plan for a user"""
+        return self._read_through(("plan", user_id), "get_plan", user_id)
+
+    def save_plan(self, user_id, plan_data):
+        self._invalidate(("plan", user_id))
+        try:
+            return self._call("save_plan", user_id, plan_data)
+        finally:
+            self._invalidate(("plan", user_id))
+
+    def save_plans(self, plans):
+        user_ids = {plan.get("user_id") for plan in plans}
+        for user_id in user_ids:
+            self._invalidate(("plan", user_id))
+        try:
+            return self._call("save_plans", plans)
+        finally:
+            for user_id in user_ids:
+                self._invalidate(("plan", user_id))
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["entries"] = len(self.cache)
+        return stats
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+
+from database.sqlite_store import SQLiteStore, format_time, parse_time
+from models.progress_series import ProgressSeries, DAY
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    user_id TEXT NOT NULL,
+    measured_at REAL NOT NULL,
+    weight REAL NOT NULL,
+    waist REAL NOT NULL,
+    neck REAL NOT NULL,
+    age REAL NOT NULL,
+    height REAL NOT NULL,
+    gender TEXT NOT NULL,
+    activity_level TEXT NOT NULL,
+    goal TEXT NOT NULL,
+    PRIMARY KEY (user_id, measured_at)
+) WITHOUT ROWID;
+"""
+
+# Request fields that make up a profile, with defaults as in /api/calculate
+PROFILE_FIELDS = (("age", None), ("height", None), ("gender", "male"), ("activityLevel", "moderate"), ("goal", "maintenance"))
+
+# Writes for one user are serialized on one of these locks, chosen by user id
+USER_LOCK_STRIPES = 64
+
+
+def _timestamps(series):
+    series["timestamps"] = [format_time(timestamp) for timestamp in series["timestamps"]]
+    return series
+
+
+class MeasurementStore(SQLiteStore):
+    def __init__(self, path, rolling_days=28, max_users=1000):
+        """
+        Per-user measurement history for progress charts
+
+        Measurements are stored one row per point in SQLite, keyed by
+        (user_id, measured_at). Recently used users are kept in memory as
+        ProgressSeries, at most max_users of them, so adding a point
+        derives only that point and range queries never recompute the
+        history. A user's series is read from SQLite once when it is first
+        used.
+        """
+        super().__init__(path, SCHEMA)
+        self.rolling_window = rolling_days * DAY
+        self.max_users = max_users
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+        self._user_locks = [threading.Lock() for _ in range(USER_LOCK_STRIPES)]
+
+    def _load(self, user_id):
+        """The user's series, read from SQLite unless it is in memory; call with the lock held"""
+        series = self._series.get(user_id)
+        if series is not None:
+            self._series.move_to_end(user_id)
+            return series
+        series = ProgressSeries(self.rolling_window)
+        rows = self._connect().execute(
+            "SELECT measured_at, weight, waist, neck, age, height, gender, activity_level, goal "
+            "FROM measurements WHERE user_id = ? ORDER BY measured_at",
+            (user_id,)
+        )
+        for row in rows:
+            series.add(row[0], row[1], row[2], row[3], tuple(row[4:]))
+        self._series[user_id] = series
+        while len(self._series) > self.max_users:
+            self._series.popitem(last=False)
+        return series
+
+    def _rows(self, points, profile):
+        """Normalize submitted points to table rows, carrying the profile forward between them"""
+        rows = []
+        for point in points:
+            fields = []
+            for index, (field, default) in enumerate(PROFILE_FIELDS):
+                value = point.get(field)
+                if value is None:
+                    value = profile[index] if profile is not None else default
+                fields.append(value)
+            age, height, gender, activity_level, goal = fields
+            if not all([point.get('weight'), point.get('waist'), point.get('neck'), age, height]):
+                raise ValueError("Each measurement needs weight, waist and neck, and the first one age and height")
+            profile = (float(age), float(height), str(gender).lower(), str(activity_level).lower(), str(goal).lower())
+            timestamp = point.get('timestamp')
+            rows.append((
+                time.time() if timestamp is None else parse_time(timestamp),
+                float(point['weight']), float(point['waist']), float(point['neck'])
+            ) + profile)
+        return rows
+
+    def add(self, user_id, points):
+        """
+        Record measurements for user_id and return its latest point
+
+        Each point has weight, waist and neck, and optionally a timestamp
+        (ISO 8601 or epoch seconds, default now) and the profile fields of
+        /api/calculate. Profile fields left out are taken from the user's
+        previous measurement, so weekly check-ins only need the three
+        measurements.
+
+        The user's lock is held from reading the previous profile until the
+        series is updated, so concurrent adds for one user can't carry
+        forward a stale profile or apply their rows out of order. Other
+        users only wait on the shared lock, which isn't held while writing.
+        """
+        with self._user_locks[hash(user_id) % USER_LOCK_STRIPES]:
+            with self._lock:
+                series = self._load(user_id)
+                rows = self._rows(points, series.profile())
+
+            with self._connect() as connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO measurements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(user_id,) + row for row in rows]
+                )
+
+            # Adding an already loaded point again only replaces it
+            with self._lock:
+                series = self._load(user_id)
+                for row in rows:
+                    series.add(row[0], row[1], row[2], row[3], row[4:])
+                latest = series.point()
+                total = len(series)
+        latest["timestamp"] = format_time(latest["timestamp"])
+        return {"latest": latest, "totalPoints": total}
+
+    def query(self, user_id, start=None, end=None, max_points=None):
+        """Series of user_id between start and end (epoch seconds), downsampled to max_points; None without data"""
+        with self._lock:
+            series = self._load(user_id)
+            if not len(series):
+                return None
+            result = series.range(start, end, max_points)
+            total = len(series)
+        result = _timestamps(result)
+        downsampled = result.pop("downsampled")
+        return {"userId": user_id, "totalPoints": total, "downsampled": downsampled, "series": result}
+
+    def stats(self):
+        row = self._connect().execute("SELECT COUNT(*) FROM measurements").fetchone()
+        with self._lock:
+            loaded = len(self._series)
+        return {"path": self.path, "measurements": row[0], "usersInMemory": loaded, "maxUsers": self.max_users}
@@ -0,0 +1,117 @@
+import copy
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+
+class QueryResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class InMemoryQuery:
+    def __init__(self, store, table):
+        """Subset of the supabase-py query builder used by SupabaseClient"""
+        self._store = store
+        self._table = table
+        self._action = "select"
+        self._payload = None
+        self._filters = []
+        self._order = None
+        self._limit = None
+
+    def select(self, columns='*'):
+        self._action = "select"
+        return self
+
+    def insert(self, data):
+        self._action, self._payload = "insert", data
+        return self
+
+    def upsert(self, data):
+        self._action, self._payload = "upsert", data
+        return self
+
+    def update(self, data):
+        self._action, self._payload = "update", data
+        return self
+
+    def eq(self, column, value):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def execute(self):
+        return QueryResult(self._store._execute(self))
+
+
+class InMemorySupabase:
+    def __init__(self, latency=0.0):
+        """
+        Local stand-in for the Supabase tables, counting round trips
+
+        latency adds a fixed delay to every execute() to mimic the network.
+        """
+        self.latency = latency
+        self.round_trips = 0
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return InMemoryQuery(self, name)
+
+    def _new_row(self, row):
+        row = dict(row)
+        row.setdefault("id", str(uuid.uuid4()))
+        row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        return row
+
+    def _execute(self, query):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.round_trips += 1
+            rows = self._tables.setdefault(query._table, {})
+            matches = lambda row: all(check(row) for check in query._filters)
+
+            if query._action in ("insert", "upsert"):
+                payload = query._payload if isinstance(query._payload, list) else [query._payload]
+                written = []
+                for row in payload:
+                    if query._action == "upsert" and row.get("id") in rows:
+                        rows[row["id"]].update(row)
+                        written.append(rows[row["id"]])
+                    else:
+                        new_row = self._new_row(row)
+                        rows[new_row["id"]] = new_row
+                        written.append(new_row)
+                return copy.deepcopy(written)
+
+            if query._action == "update":
+                updated = []
+                for row in rows.values():
+                    if matches(row):
+                        row.update(query._payload)
+                        updated.append(row)
+                return copy.deepcopy(updated)
+
+            result = [row for row in rows.values() if matches(row)]
+            if query._order is not None:
+                column, desc = query._order
+                result.sort(key=lambda row: row.get(column) or "", reverse=desc)
+            if query._limit is not None:
+                result = result[:query._limit]
+            return copy.deepcopy(result)
@@ -0,0 +1,139 @@
+import base64
+import json
+import time
+
+from database.sqlite_store import SQLiteStore, format_time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    plan_file TEXT NOT NULL,
+    input_hash TEXT,
+    cached INTEGER NOT NULL DEFAULT 0,
+    metrics TEXT,
+    plan TEXT
+);
+CREATE INDEX IF NOT EXISTS plans_user_created ON plans (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS plans_created ON plans (created_at, id);
+"""
+
+# Columns returned by history queries; the plan body is only read for the latest plan
+SUMMARY_COLUMNS = "id, user_id, created_at, plan_file, input_hash, cached, metrics"
+
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at, plan_id):
+    return base64.urlsafe_b64encode(json.dumps([created_at, plan_id]).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) of the last row on the previous page"""
+    try:
+        created_at, plan_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return float(created_at), int(plan_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+class PlanIndex(SQLiteStore):
+    def __init__(self, path):
+        """
+        Local SQLite index of generated plans per user
+
+        Each generated plan is recorded with its file, the hash of the request
+        that produced it and a snapshot of the metrics. History is read newest
+        first with keyset pagination on (created_at, id), so every page is an
+        index range scan no matter how deep it is.
+        """
+        super().__init__(path, SCHEMA)
+
+    def record(self, user_id, plan_file, input_hash=None, metrics=None, plan=None, cached=False, created_at=None):
+        """Add a generated plan for user_id and return its index row"""
+        created_at = time.time() if created_at is None else created_at
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT INTO plans (user_id, created_at, plan_file, input_hash, cached, metrics, plan) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, created_at, plan_file, input_hash, int(cached),
+                 json.dumps(metrics) if metrics is not None else None,
+                 json.dumps(plan) if plan is not None else None)
+            )
+        return {
+            "id": cursor.lastrowid,
+            "user_id": user_id,
+            "created_at": format_time(created_at),
+            "plan_file": plan_file,
+            "input_hash": input_hash,
+            "cached": bool(cached),
+            "metrics": metrics
+        }
+
+    def _summary(self, row):
+        return {
+            "id": row["id"],
+            "user_id": row["user_id"],
+            "created_at": format_time(row["created_at"]),
+            "plan_file": row["plan_file"],
+            "input_hash": row["input_hash"],
+            "cached": bool(row["cached"]),
+            "metrics": json.loads(row["metrics"]) if row["metrics"] else None
+        }
+
+    def latest(self, user_id):
+        """
+        The newest plan for user_id as a fitness_plans row, or None
+
+        Used in place of Supabase when it runs in mock mode.
+        """
+        row = self._connect().execute(
+            f"SELECT {SUMMARY_COLUMNS}, plan FROM plans WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT 1",
+            (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "user_id": row["user_id"],
+            **(json.loads(row["plan"]) if row["plan"] else {}),
+            "planFile": row["plan_file"],
+            "created_at": format_time(row["created_at"])
+        }
+
+    def history(self, user_id, limit=20, cursor=None, start=None, end=None):
+        """
+        One page of user_id's plans, newest first
+
+        start and end (epoch seconds) bound created_at to [start, end). cursor
+        is the next_cursor of the previous page. Returns (rows, next_cursor),
+        where next_cursor is None on the last page.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        conditions = ["user_id = ?"]
+        params = [user_id]
+        if start is not None:
+            conditions.append("created_at >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("created_at < ?")
+            params.append(end)
+        if cursor:
+            conditions.append("(created_at, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+
+        # One extra row tells whether there is another page
+        rows = self._connect().execute(
+            f"SELECT {SUMMARY_COLUMNS} FROM plans WHERE {' AND '.join(conditions)} "
+            "ORDER BY created_at DESC, id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+        return [self._summary(row) for row in rows], next_cursor
+
+    def stats(self):
+        row = self._connect().execute("SELECT COUNT(*), COUNT(DISTINCT user_id) FROM plans").fetchone()
+        return {"path": self.path, "plans": row[0], "users": row[1]}
@@ -1,77 +1,118 @@
-import os
-from supabase import create_client
-from utils.config import Config
-
-class SupabaseClient:
-    def __init__(self):
-        """Initialize the Supabase client with credentials from configuration"""
-        credentials = Config.get_supabase_credentials()
-        self.supabase_url = credentials["url"]
-        self.supabase_key = credentials["key"]
-        
-        if not self.supabase_url or not self.supabase_key:
-            print("Warning: Supabase credentials not found in environment variables.")
-            # Using mock mode if credentials aren't available
-            self.mock_mode = True
-        else:
-            self.supabase = create_client(self.supabase_url, self.supabase_key)
-            self.mock_mode = False
-    
-    def create_user(self, user_data):
-        """Create a new user in the database"""
-        if self.mock_mode:
-            # Mock implementation for testing without database
-            return {"id": "mock-user-id", **user_data}
-            
-        # Insert user data into users table
-        result = self.supabase.table('users').insert(user_data).execute()
-        return result.data[0] if result.data else None
-    
-    def get_user(self, user_id):
-        """Get user data by ID"""
-        if self.mock_mode:
-            # Mock implementation
-            return {"id": user_id, "name": "Test User", "email": "test@example.com"}
-            
-        # Query user data
-        result = self.supabase.table('users').select('*').eq('id', user_id).execute()
-        return result.data[0] if result.data else None
-    
-    def update_user(self, user_id, updated_data):
-        """Update user data"""
-        if self.mock_mode:
-            # Mock implementation
-            return {"id": user_id, **updated_data}
-            
-        # Update user data
-        result = self.supabase.table('users').update(updated_data).eq('id', user_id).execute()
-        return result.data[0] if result.data else None
-    
-    def save_plan(self, user_id, plan_data):
-        """Save a fitness plan for a user"""
-        if self.mock_mode:
-            # Mock implementation
-            return {"id": "mock-plan-id", "user_id": user_id, **plan_data}
-            
-        # Add user_id to plan data
-        plan_data["user_id"] = user_id
-        
-        # Insert plan data
-        result = self.supabase.table('fitness_plans').insert(plan_data).execute()
-        return result.data[0] if result.data else None
-    
-    def get_plan(self, user_id):
-        """Get the latest fitness plan for a user"""
-        if self.mock_mode:
-            # Mock implementation
-            return {
-                "id": "mock-plan-id", 
-                "user_id": user_id,
-                "mealPlan": {"days": 7},
-                "workoutPlan": {"days": 5},
-                "created_at": "2023-01-01T00:00:00"
-            }
-            
-        # Query plan data, ordered by creation date (newest first)
-        result = self.supabase.table('fitness_plans').select('*').eq('user_id', user_id).order('created_at', desc=True).limit(1).execute()
+import os
+from utils.config import Config
+
+class SupabaseClient:
+    def __init__(self, client=None, plan_index=None):
+        """
+        Initialize the Supabase client with credentials from configuration
+
+        An already-built client (e.g. the in-memory stand-in) can be passed instead.
+        In mock mode, plans are read from plan_index (a PlanIndex) when given.
+        """
+        self.plan_index = plan_index
+        if client is not None:
+            self.supabase = client
+            self.mock_mode = False
+            return
+
+        credentials = Config.get_supabase_credentials()
+        self.supabase_url = credentials["url"]
+        self.supabase_key = credentials["key"]
+        
+        if not self.supabase_url or not self.supabase_key:
+            print("Warning: Supabase credentials not found in environment variables.")
+            # Using mock mode if credentials aren't available
+            self.mock_mode = True
+        else:
+            from supabase import create_client
+            self.supabase = create_client(self.supabase_url, self.supabase_key)
+            self.mock_mode = False
+    
+    def create_user(self, user_data):
+        """Create a new user in the database"""
+        if self.mock_mode:
+            # Mock implementation for testing without database
+            return {"id": "mock-user-id", **user_data}
+            
+        # Insert user data into users table
+        result = self.supabase.table('users').insert(user_data).execute()
+        return result.data[0] if result.data else None
+    
+    def create_users(self, users):
+        """Create or update many users in one round trip"""
+        if self.mock_mode:
+            return [{"id": user.get("id", f"mock-user-id-{index}"), **user} for index, user in enumerate(users)]
+            
+        result = self.supabase.table('users').upsert(users).execute()
+        return result.data or []
+    
+    def get_user(self, user_id):
+        """Get user data by ID"""
+        if self.mock_mode:
+            # Mock implementation
+            return {"id": user_id, "name": "Test User", "email": "test@example.com"}
+            
+        # Query user data
+        result = self.supabase.table('users').select('*').eq('id', user_id).execute()
+        return result.data[0] if result.data else None
+    
+    def get_users(self, user_ids):
+        """Get many users by ID in one round trip"""
+        if self.mock_mode:
+            return [{"id": user_id, "name": "Test User", "email": "test@example.com"} for user_id in user_ids]
+            
+        if not user_ids:
+            return []
+        result = self.supabase.table('users').select('*').in_('id', list(user_ids)).execute()
+        return result.data or []
+    
+    def update_user(self, user_id, updated_data):
+        """Update user data"""
+        if self.mock_mode:
+            # Mock implementation
+            return {"id": user_id, **updated_data}
+            
+        # Update user data
+        result = self.supabase.table('users').update(updated_data).eq('id', user_id).execute()
+        return result.data[0] if result.data else None
+    
+    def save_plan(self, user_id, plan_data):
+        """Save a fitness plan for a user"""
+        if self.mock_mode:
+            # Mock implementation
+            return {"id": "mock-plan-id", "user_id": user_id, **plan_data}
+            
+        # Add user_id to plan data
+        plan_data["user_id"] = user_id
+        
+        # Insert plan data
+        result = self.supabase.table('fitness_plans').insert(plan_data).execute()
+        return result.data[0] if result.data else None
+    
+    def save_plans(self, plans):
+        """Save many fitness plans in one round trip; each plan must include its user_id"""
+        if self.mock_mode:
+            return [{"id": f"mock-plan-id-{index}", **plan} for index, plan in enumerate(plans)]
+            
+        result = self.supabase.table('fitness_plans').upsert(plans).execute()
+        return result.data or []
+    
+    def get_plan(self, user_id):
+        """Get the latest fitness plan for a user"""
+        if self.mock_mode:
+            # Plans generated locally are in the plan index
+            plan = self.plan_index.latest(user_id) if self.plan_index is not None else None
+            if plan:
+                return plan
+            # Mock implementation
+            return {
+                "id": "mock-plan-id", 
+                "user_id": user_id,
+                "mealPlan": {"days": 7},
+                "workoutPlan": {"days": 5},
+                "created_at": "2023-01-01T00:00:00"
+            }
+            
+        # Query plan data, ordered by creation date (newest first)
+        result = self.supabase.table('fitness_plans').select('*').eq('user_id', user_id).order('created_at', desc=True).limit(1).execute()
         return result.data[0] if result.data else None 
\ No newline at end of file
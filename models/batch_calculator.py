@@ -0,0 +1,171 @@
+import numpy as np
+
+from models.fitness_calculator import FitnessCalculator
+
+# Same tables and defaults as FitnessCalculator
+ACTIVITY_MULTIPLIERS = FitnessCalculator.ACTIVITY_MULTIPLIERS
+DEFAULT_ACTIVITY_MULTIPLIER = FitnessCalculator.DEFAULT_ACTIVITY_MULTIPLIER
+GOAL_MULTIPLIERS = FitnessCalculator.GOAL_MULTIPLIERS
+DEFAULT_GOAL_MULTIPLIER = FitnessCalculator.DEFAULT_GOAL_MULTIPLIER
+
+
+def _factorize(values, default):
+    """
+    Split a string column into integer codes and its distinct lower-cased keys
+
+    Each distinct raw value is lower-cased once, so columns with a handful of
+    categories cost one dict lookup per row instead of one string operation.
+    """
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.intp, count=len(values))
+    keys = np.array([str(value).lower() for value in index] or [default])
+    return codes, keys
+
+
+def _lookup(codes, keys, table, default):
+    """Map factorized keys to their multipliers"""
+    multipliers = np.array([table.get(key, default) for key in keys], dtype=float)
+    return multipliers[codes]
+
+
+class BatchFitnessCalculator:
+    def __init__(self, ages, weights, heights, waists, necks, genders=None, activity_levels=None, goals=None):
+        """
+        Columnar version of FitnessCalculator that computes metrics for many users at once
+
+        Every argument is a sequence with one entry per user. Numeric columns are
+        converted to float arrays, string columns are lower-cased like the scalar class.
+        Missing string columns default to 'male', 'moderate' and 'maintenance'.
+        Results are identical to calling FitnessCalculator for each user.
+        """
+        self.age = np.asarray(ages, dtype=float)
+        self.weight = np.asarray(weights, dtype=float)
+        self.height = np.asarray(heights, dtype=float)
+        self.waist = np.asarray(waists, dtype=float)
+        self.neck = np.asarray(necks, dtype=float)
+        self.size = len(self.age)
+
+        gender_codes, gender_keys = self._factorize(genders, 'male')
+        activity_codes, activity_keys = self._factorize(activity_levels, 'moderate')
+        goal_codes, goal_keys = self._factorize(goals, 'maintenance')
+
+        self.gender = gender_keys[gender_codes]
+        self.activity_level = activity_keys[activity_codes]
+        self.goal = goal_keys[goal_codes]
+
+        self.is_male = (gender_keys == 'male')[gender_codes]
+        self.is_lose_fat = (goal_keys == 'lose_fat')[goal_codes]
+        self.is_build_muscle = (goal_keys == 'build_muscle')[goal_codes]
+        self.activity_multiplier = _lookup(activity_codes, activity_keys, ACTIVITY_MULTIPLIERS, DEFAULT_ACTIVITY_MULTIPLIER)
+        self.goal_multiplier = _lookup(goal_codes, goal_keys, GOAL_MULTIPLIERS, DEFAULT_GOAL_MULTIPLIER)
+
+    def _factorize(self, values, default):
+        """Factorize a string column, filling it with the default when omitted"""
+        if values is None:
+            return np.zeros(self.size, dtype=np.intp), np.array([default])
+        return _factorize(values, default)
+
+    def __len__(self):
+        return self.size
+
+    def calculate_bmi(self):
+        """Calculate unrounded BMI for every user"""
+        height_in_meters = self.height / 100
+        return self.weight / (height_in_meters ** 2)
+
+    def calculate_body_fat(self):
+        """
+        Calculate unrounded US Navy body fat for every user
+
+        Users whose measurements fall outside the log domain get NaN, where the
+        scalar class would raise a math domain error.
+        """
+        height_in_inches = self.height / 2.54
+        waist_in_inches = self.waist / 2.54
+        neck_in_inches = self.neck / 2.54
+        hip_in_inches = waist_in_inches * 1.4  # Same approximation as the scalar class
+
+        male_span = waist_in_inches - neck_in_inches
+        female_span = waist_in_inches + hip_in_inches - neck_in_inches
+        span = np.where(self.is_male, male_span, female_span)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_span = np.where(span > 0, np.log10(np.where(span > 0, span, 1.0)), np.nan)
+            log_height = np.where(height_in_inches > 0, np.log10(np.where(height_in_inches > 0, height_in_inches, 1.0)), np.nan)
+            male = 495 / (1.0324 - 0.19077 * log_span + 0.15456 * log_height) - 450
+            female = 495 / (1.29579 - 0.35004 * log_span + 0.22100 * log_height) - 450
+
+        return np.where(self.is_male, male, female)
+
+    def calculate_bmr(self):
+        """Calculate BMR (Mifflin-St Jeor) for every user, rounded like the scalar class"""
+        base = (10 * self.weight) + (6.25 * self.height) - (5 * self.age)
+        return np.rint(np.where(self.is_male, base + 5, base - 161))
+
+    def calculate_tdee(self):
+        """Calculate TDEE for every user"""
+        return np.rint(self.calculate_bmr() * self.activity_multiplier)
+
+    def calculate_goal_calories(self):
+        """Calculate goal calories for every user"""
+        return np.rint(self.calculate_tdee() * self.goal_multiplier)
+
+    def calculate_macros(self, goal_calories=None):
+        """Calculate protein, carbs and fat in grams for every user"""
+        if goal_calories is None:
+            goal_calories = self.calculate_goal_calories()
+
+        lose_fat = self.is_lose_fat
+
+        weight_in_lbs = self.weight * 2.2
+        protein_g = np.where(lose_fat, weight_in_lbs, np.where(self.is_build_muscle, weight_in_lbs * 1.1, weight_in_lbs * 0.8))
+        protein_calories = protein_g * 4
+
+        fat_calories = np.where(lose_fat, goal_calories * 0.25, goal_calories * 0.3)
+        fat_g = fat_calories / 9
+
+        carb_calories = goal_calories - protein_calories - fat_calories
+        carb_g = carb_calories / 4
+
+        return {
+            "protein": np.rint(protein_g),
+            "carbs": np.rint(carb_g),
+            "fat": np.rint(fat_g)
+        }
+
+    def calculate_all(self):
+        """
+        Calculate every metric and return one result dict per user
+
+        The dicts have the same shape as the /api/calculate response. Users with
+        invalid body fat measurements get an error entry instead.
+        """
+        bmr = self.calculate_bmr()
+        tdee = np.rint(bmr * self.activity_multiplier)
+        goal_calories = np.rint(tdee * self.goal_multiplier)
+        macros = self.calculate_macros(goal_calories)
+        body_fat = self.calculate_body_fat()
+
+        # Two-decimal rounding goes through Python's round() so values match the scalar class exactly
+        columns = zip(
+            self.calculate_bmi().tolist(),
+            body_fat.tolist(),
+            bmr.astype(int).tolist(),
+            tdee.astype(int).tolist(),
+            goal_calories.astype(int).tolist(),
+            macros["protein"].astype(int).tolist(),
+            macros["carbs"].astype(int).tolist(),
+            macros["fat"].astype(int).tolist()
+        )
+
+        return [
+            {"error": "math domain error"} if fat_pct != fat_pct else {  # NaN body fat
+                "bmi": round(bmi, 2),
+                "bodyFatPercentage": round(fat_pct, 2),
+                "bmr": bmr_value,
+                "tdee": tdee_value,
+                "goalCalories": calories,
+                "macros": {"protein": protein, "carbs": carbs, "fat": fat}
+            }
+            for bmi, fat_pct, bmr_value, tdee_value, calories, protein, carbs, fat in columns
+        ]
@@ -0,0 +1,173 @@
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+
+from models.fitness_calculator import FitnessCalculator
+
+DAY = 24 * 3600
+WEEK = 7 * DAY
+
+# Series as submitted, and the series derived from them as points arrive
+MEASURED_SERIES = ("weight", "waist", "neck")
+DERIVED_SERIES = ("bmi", "bodyFatPercentage", "bmr", "tdee", "weightAverage", "weeklyWeightChange")
+SERIES = MEASURED_SERIES + DERIVED_SERIES
+
+NAN = float('nan')
+
+
+def _value(value):
+    """A stored value for JSON: rounded, with NaN (undefined) as None"""
+    return None if math.isnan(value) else round(value, 2)
+
+
+class ProgressSeries:
+    def __init__(self, rolling_window=28 * DAY):
+        """
+        One user's measurements over time, with their derived series
+
+        Every series is a flat array of doubles aligned with timestamps. The
+        derived series (BMI, body fat, BMR, TDEE, a rolling weight average
+        over rolling_window seconds and the weekly weight change) are
+        computed once per point when it arrives; only a back-dated point
+        makes the points after it be derived again.
+
+        Each series also keeps running sums and counts of its defined values,
+        so the mean over any range takes two lookups. Downsampled range
+        queries use them to cost one step per returned point, however many
+        points the range holds.
+        """
+        self.rolling_window = rolling_window
+        self.timestamps = array('d')
+        self.values = {name: array('d') for name in SERIES}
+        # Profiles (age, height, gender, activity level, goal) are shared by the points that use them
+        self.profiles = []
+        self.profile_ids = array('L')
+        self._profile_index = {}
+        self._time_sums = array('d', [0.0])
+        self._sums = {name: array('d', [0.0]) for name in SERIES}
+        self._counts = {name: array('L', [0]) for name in SERIES}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def profile(self, index=-1):
+        """The profile of the point at index, by default the latest one"""
+        return self.profiles[self.profile_ids[index]] if self.profile_ids else None
+
+    def _profile_id(self, profile):
+        profile_id = self._profile_index.get(profile)
+        if profile_id is None:
+            profile_id = self._profile_index[profile] = len(self.profiles)
+            self.profiles.append(profile)
+        return profile_id
+
+    def add(self, timestamp, weight, waist, neck, profile):
+        """
+        Add a measurement; profile is (age, height, gender, activity_level, goal)
+
+        A point with the timestamp of an existing one replaces it. Returns the
+        point with its derived values.
+        """
+        position = bisect_left(self.timestamps, timestamp)
+        replace = position < len(self.timestamps) and self.timestamps[position] == timestamp
+        columns = (self.timestamps, self.values["weight"], self.values["waist"], self.values["neck"], self.profile_ids)
+        for column, value in zip(columns, (timestamp, weight, waist, neck, self._profile_id(profile))):
+            if replace:
+                column[position] = value
+            else:
+                column.insert(position, value)
+        self._derive_from(position)
+        return self.point(position)
+
+    def _truncate(self, position):
+        """Drop derived values and running totals from position on"""
+        for name in DERIVED_SERIES:
+            del self.values[name][position:]
+        del self._time_sums[position + 1:]
+        for name in SERIES:
+            del self._sums[name][position + 1:]
+            del self._counts[name][position + 1:]
+
+    def _accumulate(self, index, name, value):
+        defined = not math.isnan(value)
+        self._sums[name].append(self._sums[name][index] + (value if defined else 0.0))
+        self._counts[name].append(self._counts[name][index] + defined)
+
+    def _derive_from(self, position):
+        """Derive every point from position to the end; appending a point derives just that one"""
+        self._truncate(position)
+        timestamps = self.timestamps
+        weights = self.values["weight"]
+        for index in range(position, len(timestamps)):
+            timestamp = timestamps[index]
+            weight = weights[index]
+            age, height, gender, activity_level, goal = self.profiles[self.profile_ids[index]]
+            calculator = FitnessCalculator(age, weight, height, self.values["waist"][index], self.values["neck"][index],
+                                           gender, activity_level, goal)
+            try:
+                body_fat = calculator.calculate_body_fat()
+            except (ValueError, ZeroDivisionError):
+                # Waist and neck outside the formula's domain
+                body_fat = NAN
+
+            self._time_sums.append(self._time_sums[index] + timestamp)
+            for name in MEASURED_SERIES:
+                self._accumulate(index, name, self.values[name][index])
+
+            # Mean weight over the rolling window ending at this point
+            start = bisect_right(timestamps, timestamp - self.rolling_window, 0, index)
+            weight_sums, weight_counts = self._sums["weight"], self._counts["weight"]
+            average = (weight_sums[index + 1] - weight_sums[start]) / (weight_counts[index + 1] - weight_counts[start])
+
+            # Change against the latest point at least a week earlier, scaled to a week
+            earlier = bisect_right(timestamps, timestamp - WEEK, 0, index) - 1
+            weekly_change = (weight - weights[earlier]) * WEEK / (timestamp - timestamps[earlier]) if earlier >= 0 else NAN
+
+            derived = {
+                "bmi": calculator.calculate_bmi(),
+                "bodyFatPercentage": body_fat,
+                "bmr": calculator.calculate_bmr(),
+                "tdee": calculator.calculate_tdee(),
+                "weightAverage": average,
+                "weeklyWeightChange": weekly_change
+            }
+            for name, value in derived.items():
+                self.values[name].append(value)
+                self._accumulate(index, name, value)
+
+    def point(self, index=-1):
+        """One point as a dict of its timestamp and every series"""
+        return dict({"timestamp": self.timestamps[index]}, **{name: _value(self.values[name][index]) for name in SERIES})
+
+    def range(self, start=None, end=None, max_points=None):
+        """
+        Points with start <= timestamp < end, at most max_points of them
+
+        Returns {"timestamps": [...], <series>: [...], "downsampled": bool}.
+        Ranges with more points are split into max_points equal time buckets,
+        each reported as the mean time and mean values of its points.
+        """
+        low = 0 if start is None else bisect_left(self.timestamps, start)
+        high = len(self.timestamps) if end is None else bisect_left(self.timestamps, end)
+        if max_points is None or high - low <= max_points:
+            result = {"timestamps": list(self.timestamps[low:high])}
+            for name in SERIES:
+                result[name] = [_value(value) for value in self.values[name][low:high]]
+            result["downsampled"] = False
+            return result
+
+        # Bucket boundaries in time, found by bisection; the last bucket includes the last point
+        first, last = self.timestamps[low], self.timestamps[high - 1]
+        width = (last - first) / max_points
+        edges = [low] + [bisect_left(self.timestamps, first + width * bucket, low, high) for bucket in range(1, max_points)] + [high]
+        buckets = [(left, right) for left, right in zip(edges, edges[1:]) if left < right]
+        time_sums = self._time_sums
+        result = {"timestamps": [(time_sums[right] - time_sums[left]) / (right - left) for left, right in buckets]}
+        for name in SERIES:
+            sums, counts = self._sums[name], self._counts[name]
+            result[name] = [
+                round((sums[right] - sums[left]) / (counts[right] - counts[left]), 2) if counts[right] > counts[left] else None
+                for left, right in buckets
+            ]
+        result["downsampled"] = True
+        return result
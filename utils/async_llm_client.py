@@ -0,0 +1,220 @@
+import asyncio
+import json
+import time
+
+import httpx
+
+from utils.llm_client import BaseLLMClient, LLMUnavailableError, RETRYABLE_STATUS
+from utils.llm_router import Backend, LLMRouter
+
+
+class AsyncLLMClient(BaseLLMClient):
+    def __init__(self, base_url, model, connect_timeout=5, read_timeout=300, max_retries=2,
+                 backoff_base=0.5, backoff_max=8, max_concurrency=4, queue_timeout=60,
+                 breaker_threshold=5, breaker_reset=30, options=None, keep_alive=None, think=None):
+        """
+        asyncio counterpart of LLMClient for the ASGI server
+
+        Same parameters, retries, circuit breaker and stats as LLMClient, but a
+        request waiting on Ollama is a suspended coroutine instead of a thread.
+        The httpx client and semaphore are created on first use, inside the
+        event loop that serves requests.
+        """
+        super().__init__(base_url, model, max_retries=max_retries, backoff_base=backoff_base, backoff_max=backoff_max,
+                         queue_timeout=queue_timeout, breaker_threshold=breaker_threshold, breaker_reset=breaker_reset,
+                         options=options, keep_alive=keep_alive, think=think)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_concurrency = max_concurrency
+
+        self._client = None
+        self._slots = None
+
+    def _http(self):
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def _acquire(self):
+        self._http()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._count("rejected")
+            raise LLMUnavailableError("All LLM slots are busy", retry_after=5)
+        self._add_in_flight(1)
+
+    def _release(self):
+        self._add_in_flight(-1)
+        self._slots.release()
+
+    async def _post(self, payload, stream=False):
+        """POST to /api/generate with retries, returning (response, trial) as LLMClient._post does"""
+        client = self._http()
+        attempt = 0
+        while True:
+            trial = self.breaker.before_request()
+            try:
+                request = client.build_request("POST", f"{self.base_url}/api/generate", json=payload)
+                response = await client.send(request, stream=stream)
+                if response.status_code in RETRYABLE_STATUS or response.status_code >= 400:
+                    await response.aclose()
+                    raise httpx.HTTPStatusError(f"{response.status_code} from LLM backend", request=request, response=response)
+                return response, trial
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                await asyncio.sleep(self._retry_delay(e, status, attempt))
+                attempt += 1
+            except asyncio.CancelledError:
+                # Cancelled before the backend answered; hand back the trial
+                self.breaker.finish(trial, None)
+                raise
+
+    async def generate(self, prompt, options=None):
+        """Run a non-streaming generation and return Ollama's response body"""
+        await self._acquire()
+        self._count("requests")
+        start = time.perf_counter()
+        trial = None
+        succeeded = None
+        try:
+            response, trial = await self._post(self._payload(prompt, False, options))
+            body = response.json()
+            succeeded = True
+            return body
+        except Exception:
+            if trial is not None:
+                succeeded = False
+            raise
+        finally:
+            # A cancelled request leaves succeeded as None
+            self._finish(trial, succeeded, start)
+            self._release()
+
+    async def stream(self, prompt, options=None):
+        """Yield Ollama's NDJSON chunks; retries only happen before the first chunk"""
+        await self._acquire()
+        self._count("requests")
+        start = time.perf_counter()
+        trial = None
+        succeeded = None
+        try:
+            response, trial = await self._post(self._payload(prompt, True, options), stream=True)
+            try:
+                first = True
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    if first:
+                        self.time_to_first_token.observe(time.perf_counter() - start)
+                        first = False
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise RuntimeError(chunk["error"])
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+            finally:
+                await response.aclose()
+            succeeded = True
+        except Exception:
+            if trial is not None:
+                # The stream broke, or carried an error, after it started
+                succeeded = False
+            raise
+        finally:
+            # Also runs when the stream is closed early or the task is cancelled
+            self._finish(trial, succeeded, start)
+            self._release()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class AsyncLLMRouter(LLMRouter):
+    """
+    LLMRouter for the event loop: the same weighted least-connections routing,
+    with requests waiting for a slot on an asyncio.Condition
+    """
+
+    def __init__(self, backends, queue_slo=10, queue_timeout=60):
+        super().__init__(backends, queue_slo=queue_slo, queue_timeout=queue_timeout)
+        self._slot_freed = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a router from Config, one AsyncLLMClient per configured backend"""
+        client_options = config.get_ollama_config()
+        backends = []
+        for spec in config.get_ollama_backends():
+            options = dict(client_options, base_url=spec["url"], model=spec["model"], max_concurrency=spec["capacity"])
+            backends.append(Backend(
+                name=f"{spec['url']}/{spec['model']}",
+                client=AsyncLLMClient(**options),
+                weight=spec["weight"],
+                capacity=spec["capacity"],
+                fallback=spec["fallback"]
+            ))
+        return cls(backends, queue_slo=config.OLLAMA_QUEUE_SLO, queue_timeout=config.OLLAMA_QUEUE_TIMEOUT)
+
+    async def _acquire(self, exclude=()):
+        """Reserve a slot on the best backend not in exclude, waiting for one to free up if needed"""
+        if self._slot_freed is None:
+            self._slot_freed = asyncio.Condition()
+        start = time.monotonic()
+        primaries, fallbacks = self._candidates(exclude)
+
+        async with self._slot_freed:
+            self._check_healthy(primaries + fallbacks)
+            while True:
+                backend, wait = self._choose(primaries, fallbacks, time.monotonic() - start)
+                if backend is not None:
+                    return backend
+                try:
+                    await asyncio.wait_for(self._slot_freed.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _release(self, backend):
+        async with self._slot_freed:
+            backend.in_flight -= 1
+            self._slot_freed.notify()
+
+    async def generate(self, prompt, options=None):
+        """Run a non-streaming generation on the chosen backend, failing over like LLMRouter.generate()"""
+        tried = set()
+        while True:
+            backend = await self._acquire(tried)
+            try:
+                return await backend.client.generate(prompt, options)
+            except LLMUnavailableError:
+                tried.add(backend)
+                if len(tried) == len(self.backends):
+                    raise
+            finally:
+                await self._release(backend)
+
+    async def stream(self, prompt, options=None):
+        """Stream a generation from the chosen backend, holding its slot until done"""
+        tried = set()
+        while True:
+            backend = await self._acquire(tried)
+            started = False
+            try:
+                async for chunk in backend.client.stream(prompt, options):
+                    started = True
+                    yield chunk
+                return
+            except LLMUnavailableError:
+                tried.add(backend)
+                if started or len(tried) == len(self.backends):
+                    raise
+            finally:
+                await self._release(backend)
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.client.aclose()
@@ -1,44 +1,210 @@
-import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env file if it exists
-load_dotenv()
-
-# Default configuration that can be overridden by environment variables
-class Config:
-    """Configuration class for the application"""
-    
-    # API Keys
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "YOUR_API_KEY")
-    
-    # Supabase Configuration
-    SUPABASE_URL = os.getenv("SUPABASE_URL", "YOUR_URL")
-    SUPABASE_KEY = os.getenv("SUPABASE_KEY", "YOUR_API_KEY")
-    
-    # Flask Configuration
-    FLASK_ENV = os.getenv("FLASK_ENV", "development")
-    FLASK_DEBUG = os.getenv("FLASK_DEBUG", "1") == "1"  # Convert string to boolean
-    
-    # Other Configuration
-    PORT = int(os.getenv("PORT", "5000"))
-    
-    @classmethod
-    def get_supabase_credentials(cls):
-        """Get Supabase credentials as a dictionary"""
-        return {
-            "url": cls.SUPABASE_URL,
-            "key": cls.SUPABASE_KEY
-        }
-        
-    @classmethod
-    def get_gemini_config(cls):
-        """Get Gemini API configuration"""
-        return {
-            "api_key": cls.GEMINI_API_KEY,
-            "generation_config": {
-                "temperature": 0.7,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 2048,
-            }
-        } 
+import os
+import json
+from dotenv import load_dotenv
+
+# Load environment variables from .env file if it exists
+load_dotenv()
+
+# Default configuration that can be overridden by environment variables
+class Config:
+    """Configuration class for the application"""
+    
+    # API Keys
+    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "YOUR_API_KEY")
+    
+    # Supabase Configuration
+    SUPABASE_URL = os.getenv("SUPABASE_URL", "YOUR_URL")
+    SUPABASE_KEY = os.getenv("SUPABASE_KEY", "YOUR_API_KEY")
+    SUPABASE_BACKEND = os.getenv("SUPABASE_BACKEND", "supabase")  # "memory" uses the in-process stand-in, e.g. for load tests
+    SUPABASE_MEMORY_LATENCY = float(os.getenv("SUPABASE_MEMORY_LATENCY", "0"))  # seconds added to every in-memory query
+    
+    # Flask Configuration
+    FLASK_ENV = os.getenv("FLASK_ENV", "development")
+    FLASK_DEBUG = os.getenv("FLASK_DEBUG", "1") == "1"  # Convert string to boolean
+    
+    # Ollama Configuration
+    OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+    OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "deepseek-r1:8b")
+    OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))  # seconds
+    OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "300"))  # seconds
+    OLLAMA_MAX_RETRIES = int(os.getenv("OLLAMA_MAX_RETRIES", "2"))
+    OLLAMA_BACKOFF = float(os.getenv("OLLAMA_BACKOFF", "0.5"))  # base backoff in seconds
+    OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4"))  # Match OLLAMA_NUM_PARALLEL on the server
+    OLLAMA_QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "60"))  # seconds to wait for a free slot
+    OLLAMA_BREAKER_THRESHOLD = int(os.getenv("OLLAMA_BREAKER_THRESHOLD", "5"))  # consecutive failures
+    OLLAMA_BREAKER_RESET = float(os.getenv("OLLAMA_BREAKER_RESET", "30"))  # seconds
+    # JSON list of backends, e.g. [{"url": "http://gpu-1:11434", "model": "deepseek-r1:8b", "weight": 2, "capacity": 4}]
+    # Entries with "fallback": true only take requests that waited longer than OLLAMA_QUEUE_SLO
+    OLLAMA_BACKENDS = os.getenv("OLLAMA_BACKENDS", "")
+    OLLAMA_FALLBACK_MODEL = os.getenv("OLLAMA_FALLBACK_MODEL", "")  # Smaller model on OLLAMA_URL used past the SLO
+    OLLAMA_QUEUE_SLO = float(os.getenv("OLLAMA_QUEUE_SLO", "10"))  # seconds
+    # Generation limits: a whole plan, and one section of a sectioned plan, in tokens
+    OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", "4096"))
+    OLLAMA_SECTION_NUM_PREDICT = int(os.getenv("OLLAMA_SECTION_NUM_PREDICT", "1536"))
+    OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "0"))  # 0 keeps the model's default context size
+    OLLAMA_STOP = os.getenv("OLLAMA_STOP", "")  # JSON list of stop sequences
+    OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "")  # How long the model stays loaded, e.g. "30m"; empty uses the server's default
+    OLLAMA_THINK = os.getenv("OLLAMA_THINK", "")  # "0" asks reasoning models to skip their <think> preamble
+    
+    # Plan Job Queue Configuration
+    PLAN_JOB_WORKERS = int(os.getenv("PLAN_JOB_WORKERS", "2"))
+    PLAN_JOB_QUEUE_SIZE = int(os.getenv("PLAN_JOB_QUEUE_SIZE", "50"))
+    PLAN_JOB_RETRY_AFTER = int(os.getenv("PLAN_JOB_RETRY_AFTER", "30"))  # seconds
+    
+    # Plan Cache Configuration
+    PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "1") == "1"
+    PLAN_CACHE_DIR = os.getenv("PLAN_CACHE_DIR")  # Defaults to plan_cache/ next to plans/
+    PLAN_CACHE_MEMORY_ENTRIES = int(os.getenv("PLAN_CACHE_MEMORY_ENTRIES", "256"))
+    PLAN_CACHE_TTL = int(os.getenv("PLAN_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+    PLAN_CACHE_MAX_BYTES = int(os.getenv("PLAN_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+    PLAN_CACHE_BUCKETING = os.getenv("PLAN_CACHE_BUCKETING", "0") == "1"  # Round metrics so similar users share plans
+    PLAN_SECTIONED = os.getenv("PLAN_SECTIONED", "0") == "1"  # Generate and cache plan sections independently; each plan then makes one LLM call per section
+    PLAN_SECTION_PARALLELISM = int(os.getenv("PLAN_SECTION_PARALLELISM", "5"))
+    
+    # Speculative Plan Generation Configuration
+    # Fills the plan cache for frequently requested profiles while the LLM is idle
+    PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "0") == "1"
+    PREWARM_HOURS = os.getenv("PREWARM_HOURS", "1-6")  # Off-peak local hours, start-end; empty for any hour
+    PREWARM_BUDGET = int(os.getenv("PREWARM_BUDGET", "200"))  # Generations per off-peak window
+    PREWARM_MAX_CONCURRENT = int(os.getenv("PREWARM_MAX_CONCURRENT", "1"))  # Keep below the LLM capacity
+    PREWARM_MAX_LIVE = int(os.getenv("PREWARM_MAX_LIVE", "0"))  # Live plan generations above which prewarming pauses
+    PREWARM_MIN_REQUESTS = int(os.getenv("PREWARM_MIN_REQUESTS", "2"))  # Recent requests needing an entry before it is generated
+    PREWARM_WINDOW = int(os.getenv("PREWARM_WINDOW", str(7 * 24 * 3600)))  # seconds of request history counted
+    PREWARM_MAX_SAMPLES = int(os.getenv("PREWARM_MAX_SAMPLES", "5000"))
+    PREWARM_INTERVAL = int(os.getenv("PREWARM_INTERVAL", "60"))  # seconds between runs
+    
+    # PDF Rendering Configuration
+    # Leaves one core for request threads; 0 renders inline
+    RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(min(4, (os.cpu_count() or 1) - 1))))
+    RENDER_START_METHOD = os.getenv("RENDER_START_METHOD", "spawn")
+    
+    # Plan Storage Configuration
+    PLANS_DIR = os.getenv("PLANS_DIR")  # Local plan files and render staging, defaults to plans/ in the repository
+    PLAN_STORAGE_BACKEND = os.getenv("PLAN_STORAGE_BACKEND", "local")  # local, memory or s3
+    PLAN_STORAGE_BUCKET = os.getenv("PLAN_STORAGE_BUCKET", "fitness-plans")
+    PLAN_STORAGE_ENDPOINT = os.getenv("PLAN_STORAGE_ENDPOINT")  # S3-compatible endpoint URL, e.g. MinIO
+    PLAN_RETENTION_TTL = int(os.getenv("PLAN_RETENTION_TTL", str(30 * 24 * 3600)))  # seconds
+    PLAN_STORAGE_QUOTA_BYTES = int(os.getenv("PLAN_STORAGE_QUOTA_BYTES", str(1024 ** 3)))
+    PLAN_GC_INTERVAL = int(os.getenv("PLAN_GC_INTERVAL", "3600"))  # seconds
+    PLAN_PRECOMPRESS = os.getenv("PLAN_PRECOMPRESS", "1") == "1"  # Store a gzip copy of .txt plans
+    PLAN_INDEX_PATH = os.getenv("PLAN_INDEX_PATH")  # SQLite plan history index, defaults to plan_index.sqlite3 in PLANS_DIR
+    USE_X_SENDFILE = os.getenv("USE_X_SENDFILE", "0") == "1"  # Let the front-end server send plan files
+    
+    # Progress Tracking Configuration
+    PROGRESS_DB_PATH = os.getenv("PROGRESS_DB_PATH")  # SQLite measurement history, defaults to progress/progress.sqlite3
+    PROGRESS_ROLLING_DAYS = int(os.getenv("PROGRESS_ROLLING_DAYS", "28"))  # Window of the rolling weight average
+    PROGRESS_MAX_POINTS = int(os.getenv("PROGRESS_MAX_POINTS", "366"))  # Longer ranges are downsampled to this many points
+    PROGRESS_CACHE_USERS = int(os.getenv("PROGRESS_CACHE_USERS", "1000"))  # Users whose series are kept in memory
+    
+    # Metrics Configuration
+    CALCULATE_CACHE_SIZE = int(os.getenv("CALCULATE_CACHE_SIZE", "4096"))  # memoized /api/calculate inputs
+    
+    # Data Access Configuration
+    DATA_CACHE_TTL = float(os.getenv("DATA_CACHE_TTL", "30"))  # seconds
+    DATA_CACHE_MAX_ENTRIES = int(os.getenv("DATA_CACHE_MAX_ENTRIES", "10000"))
+    
+    # Observability Configuration
+    PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+    PROFILER_THRESHOLD = float(os.getenv("PROFILER_THRESHOLD", "2"))  # seconds before a request is sampled
+    PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.01"))  # seconds between samples
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # Bearer token for /api/metrics/profiler; unset disables the endpoint
+    
+    # Admission Control for plan generation
+    ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "0"))  # Plans generated at once, 0 = total LLM backend capacity
+    ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))  # Requests waiting for a slot before new ones are shed
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))  # seconds
+    ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "10"))  # Retry-After for shed requests, in seconds
+    RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "6"))  # Plan requests per client address, 0 disables
+    RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "3"))
+    RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")  # memory or redis (shared by every worker)
+    RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+    
+    # Startup Configuration
+    # Comma-separated components to initialize before /api/ready passes: supabase, storage, index, progress, pdf, llm or all
+    WARM_UP = os.getenv("WARM_UP", "")
+    
+    # Other Configuration
+    PORT = int(os.getenv("PORT", "5000"))
+    
+    @classmethod
+    def get_supabase_credentials(cls):
+        """Get Supabase credentials as a dictionary"""
+        return {
+            "url": cls.SUPABASE_URL,
+            "key": cls.SUPABASE_KEY
+        }
+        
+    @classmethod
+    def get_admission_capacity(cls):
+        """
+        Plans generated at once: ADMISSION_MAX_CONCURRENT, or the capacity of the primary LLM backends
+
+        Fallback backends only take requests that waited past the queue SLO, so they add no capacity.
+        A sectioned plan makes up to PLAN_SECTION_PARALLELISM LLM calls at once, so it takes that many slots.
+        """
+        if cls.ADMISSION_MAX_CONCURRENT > 0:
+            return cls.ADMISSION_MAX_CONCURRENT
+        capacity = sum(spec["capacity"] for spec in cls.get_ollama_backends() if not spec["fallback"])
+        if cls.PLAN_SECTIONED:
+            capacity //= max(1, cls.PLAN_SECTION_PARALLELISM)
+        return max(1, capacity)
+        
+    @classmethod
+    def get_ollama_config(cls):
+        """Get Ollama client configuration"""
+        return {
+            "base_url": cls.OLLAMA_URL,
+            "model": cls.OLLAMA_MODEL,
+            "connect_timeout": cls.OLLAMA_CONNECT_TIMEOUT,
+            "read_timeout": cls.OLLAMA_READ_TIMEOUT,
+            "max_retries": cls.OLLAMA_MAX_RETRIES,
+            "backoff_base": cls.OLLAMA_BACKOFF,
+            "max_concurrency": cls.OLLAMA_MAX_CONCURRENCY,
+            "queue_timeout": cls.OLLAMA_QUEUE_TIMEOUT,
+            "breaker_threshold": cls.OLLAMA_BREAKER_THRESHOLD,
+            "breaker_reset": cls.OLLAMA_BREAKER_RESET,
+            "options": cls.get_generation_options(),
+            "keep_alive": cls.OLLAMA_KEEP_ALIVE or None,
+            "think": None if cls.OLLAMA_THINK == "" else cls.OLLAMA_THINK == "1"
+        }
+        
+    @classmethod
+    def get_generation_options(cls, num_predict=None):
+        """Ollama generation options; num_predict overrides OLLAMA_NUM_PREDICT"""
+        options = {}
+        num_predict = cls.OLLAMA_NUM_PREDICT if num_predict is None else num_predict
+        if num_predict > 0:
+            options["num_predict"] = num_predict
+        if cls.OLLAMA_NUM_CTX > 0:
+            options["num_ctx"] = cls.OLLAMA_NUM_CTX
+        stop = json.loads(cls.OLLAMA_STOP) if cls.OLLAMA_STOP.strip() else []
+        if stop:
+            options["stop"] = stop
+        return options
+        
+    @classmethod
+    def get_ollama_backends(cls):
+        """Get the list of Ollama backends with defaults filled in"""
+        specs = json.loads(cls.OLLAMA_BACKENDS) if cls.OLLAMA_BACKENDS.strip() else [{"url": cls.OLLAMA_URL}]
+        if cls.OLLAMA_FALLBACK_MODEL:
+            specs.append({"url": cls.OLLAMA_URL, "model": cls.OLLAMA_FALLBACK_MODEL, "fallback": True})
+        return [{
+            "url": spec["url"],
+            "model": spec.get("model", cls.OLLAMA_MODEL),
+            "weight": float(spec.get("weight", 1)),
+            "capacity": int(spec.get("capacity", cls.OLLAMA_MAX_CONCURRENCY)),
+            "fallback": bool(spec.get("fallback", False))
+        } for spec in specs]
+        
+    @classmethod
+    def get_gemini_config(cls):
+        """Get Gemini API configuration"""
+        return {
+            "api_key": cls.GEMINI_API_KEY,
+            "generation_config": {
+                "temperature": 0.7,
+                "top_p": 0.95,
+                "top_k": 40,
+                "max_output_tokens": 2048,
+            }
+        } 
@@ -0,0 +1,115 @@
+import threading
+import time
+
+
+class LazyComponent:
+    def __init__(self, name, factory, warm_up=None):
+        """
+        Stands in for an expensive object that is built on first use
+
+        Attribute access is forwarded to the object returned by factory(),
+        which is called once, on the first access, from whichever thread gets
+        there first. warm_up is an optional callable(instance) run by warm()
+        to do any further start-up work ahead of the first request.
+        """
+        self.name = name
+        self._factory = factory
+        self._warm_up = warm_up
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self):
+        return self._instance is not None
+
+    def get(self):
+        """Return the object, building it if this is the first use"""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+                instance = self._instance
+        return instance
+
+    def warm(self):
+        instance = self.get()
+        if self._warm_up is not None:
+            self._warm_up(instance)
+        return instance
+
+    def __getattr__(self, name):
+        # Only called for attributes the proxy itself doesn't have
+        if name.startswith('__') or name in ('_factory', '_warm_up', '_instance', '_lock'):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+    def __repr__(self):
+        state = "initialized" if self.initialized else "not initialized"
+        return f"<LazyComponent {self.name} ({state})>"
+
+
+class WarmUp:
+    def __init__(self, components):
+        """
+        Initializes chosen LazyComponents in the background before a worker reports ready
+
+        components maps a name to its LazyComponent. Until run() has finished,
+        and if any component failed to start, ready is False.
+        """
+        self.components = components
+        self.names = ()
+        self.timings = {}
+        self.errors = {}
+        self._done = threading.Event()
+        self._done.set()
+
+    def parse(self, names):
+        """Component names from a comma-separated setting, where 'all' selects every component"""
+        names = [name.strip() for name in names.split(',') if name.strip()] if isinstance(names, str) else list(names)
+        if 'all' in names:
+            return list(self.components)
+        unknown = [name for name in names if name not in self.components]
+        if unknown:
+            print(f"Warning: unknown warm-up components ignored: {', '.join(unknown)}")
+        return [name for name in names if name in self.components]
+
+    def run(self, names):
+        self.names = tuple(self.parse(names))
+        self._done.clear()
+        try:
+            for name in self.names:
+                start = time.perf_counter()
+                try:
+                    self.components[name].warm()
+                except Exception as e:
+                    print(f"Warning: warm-up of {name} failed: {e}")
+                    self.errors[name] = str(e)
+                self.timings[name] = round(time.perf_counter() - start, 4)
+        finally:
+            self._done.set()
+
+    def start(self, names):
+        """Warm up in a background thread; returns at once"""
+        names = self.parse(names)
+        if not names:
+            return
+        self._done.clear()
+        thread = threading.Thread(target=self.run, args=(names,), name="warm-up", daemon=True)
+        thread.start()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    @property
+    def ready(self):
+        return self._done.is_set() and not self.errors
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "warmUp": list(self.names),
+            "seconds": dict(self.timings),
+            "errors": dict(self.errors),
+            "initialized": {name: component.initialized for name, component in self.components.items()}
+        }
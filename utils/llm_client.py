@@ -0,0 +1,296 @@
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.llm_errors import LLMUnavailableError, CircuitOpenError
+from utils.metrics import LatencyHistogram
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """
+        Fails fast after failure_threshold consecutive failures
+
+        After reset_timeout seconds one trial request is let through; success
+        closes the circuit again, failure re-opens it.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Raise CircuitOpenError if the request should not reach the backend; returns True for the trial request"""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError("LLM backend is unavailable, circuit is open", retry_after=int(remaining) + 1)
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._trial_running:
+                    raise CircuitOpenError("LLM backend is recovering, try again shortly", retry_after=1)
+                self._trial_running = True
+                return True
+            return False
+
+    def available(self):
+        """Whether before_request() would let a request through right now"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            if self.state == self.HALF_OPEN:
+                return not self._trial_running
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def finish(self, trial, succeeded):
+        """
+        Record the outcome of a request the backend accepted
+
+        succeeded is None when the caller gave up before the request finished
+        (a closed stream or a cancelled task). That only counts as a failure
+        for the trial request, so a half-open circuit always gets its trial back.
+        """
+        if succeeded:
+            self.record_success()
+        elif succeeded is False or trial:
+            self.record_failure()
+
+
+class BaseLLMClient:
+    def __init__(self, base_url, model, max_retries=2, backoff_base=0.5, backoff_max=8, queue_timeout=60,
+                 breaker_threshold=5, breaker_reset=30, options=None, keep_alive=None, think=None):
+        """
+        Settings, circuit breaker, retry decisions and stats shared by LLMClient
+        and AsyncLLMClient, which only differ in how they wait and send
+        """
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.options = options or {}
+        self.keep_alive = keep_alive
+        self.think = think
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.latency = LatencyHistogram()
+        self.time_to_first_token = LatencyHistogram()
+
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = {"requests": 0, "retries": 0, "failures": 0, "rejected": 0}
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._counters[name] += amount
+
+    def _add_in_flight(self, amount):
+        with self._stats_lock:
+            self._in_flight += amount
+
+    def _retry_delay(self, error, status, attempt):
+        """
+        Record a failed attempt and return the seconds to back off before the next one
+
+        status is the HTTP status the backend answered with, or None when it
+        could not be reached. A rejection that won't change on retry is raised
+        as is; failures still failing after max_retries raise LLMUnavailableError.
+        """
+        if status is not None and status not in RETRYABLE_STATUS:
+            # The backend answered, it is just rejecting this request
+            self.breaker.record_success()
+            self._count("failures")
+            raise error
+        self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            self._count("failures")
+            raise LLMUnavailableError(f"LLM backend is unavailable: {error}", retry_after=5) from error
+        self._count("retries")
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt + 1))))
+
+    def _finish(self, trial, succeeded, start):
+        """
+        Record a finished request and its latency
+
+        trial is None when the backend never accepted the request. succeeded
+        is False when it failed after that and None when the caller gave up.
+        """
+        if trial is not None:
+            if succeeded is False:
+                self._count("failures")
+            self.breaker.finish(trial, succeeded)
+        self.latency.observe(time.perf_counter() - start)
+
+    def _payload(self, prompt, stream, options=None):
+        payload = {"model": self.model, "prompt": prompt, "stream": stream}
+        options = dict(self.options, **(options or {}))
+        if options:
+            payload["options"] = options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        if self.think is not None:
+            payload["think"] = self.think
+        return payload
+
+    def stats(self):
+        """Counters, breaker state and latency histograms"""
+        with self._stats_lock:
+            stats = dict(self._counters)
+            stats["inFlight"] = self._in_flight
+        stats["circuit"] = self.breaker.state
+        stats["latencySeconds"] = self.latency.snapshot()
+        stats["timeToFirstTokenSeconds"] = self.time_to_first_token.snapshot()
+        return stats
+
+
+class LLMClient(BaseLLMClient):
+    def __init__(self, base_url, model, connect_timeout=5, read_timeout=300, max_retries=2,
+                 backoff_base=0.5, backoff_max=8, max_concurrency=4, queue_timeout=60,
+                 breaker_threshold=5, breaker_reset=30, options=None, keep_alive=None, think=None):
+        """
+        Pooled, keep-alive client for the Ollama generate API
+
+        Parameters:
+        - base_url, model: Ollama server and model name
+        - connect_timeout, read_timeout: per-attempt timeouts in seconds
+        - max_retries: extra attempts on connection errors, timeouts and 429/5xx
+        - backoff_base, backoff_max: exponential backoff bounds, with full jitter
+        - max_concurrency: requests in flight at once, match the backend's parallel slots
+        - queue_timeout: seconds to wait for a free slot before giving up
+        - breaker_threshold, breaker_reset: circuit breaker failure count and cool-down
+        - options: default generation options (num_predict, stop, num_ctx...), merged under per-call ones
+        - keep_alive, think: sent with every request when set
+        """
+        super().__init__(base_url, model, max_retries=max_retries, backoff_base=backoff_base, backoff_max=backoff_max,
+                         queue_timeout=queue_timeout, breaker_threshold=breaker_threshold, breaker_reset=breaker_reset,
+                         options=options, keep_alive=keep_alive, think=think)
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_concurrency, 1))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def _acquire(self):
+        """Take a concurrency slot, failing if none frees up within queue_timeout"""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count("rejected")
+            raise LLMUnavailableError("All LLM slots are busy", retry_after=5)
+        self._add_in_flight(1)
+
+    def _release(self):
+        self._add_in_flight(-1)
+        self._slots.release()
+
+    def _post(self, payload, stream=False):
+        """
+        POST to /api/generate with retries, returning (response, trial)
+
+        trial is True when the request is the circuit breaker's half-open trial;
+        the caller records its outcome with _finish(). Backend failures still
+        failing after the retries are raised as LLMUnavailableError.
+        """
+        attempt = 0
+        while True:
+            trial = self.breaker.before_request()
+            try:
+                response = self.session.post(f"{self.base_url}/api/generate", json=payload, timeout=self.timeout, stream=stream)
+                if response.status_code in RETRYABLE_STATUS:
+                    response.close()
+                    raise requests.HTTPError(f"{response.status_code} from LLM backend", response=response)
+                response.raise_for_status()
+                return response, trial
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                status = getattr(e.response, 'status_code', None) if isinstance(e, requests.HTTPError) else None
+                time.sleep(self._retry_delay(e, status, attempt))
+                attempt += 1
+
+    def generate(self, prompt, options=None):
+        """Run a non-streaming generation and return Ollama's response body"""
+        self._acquire()
+        self._count("requests")
+        start = time.perf_counter()
+        trial = None
+        succeeded = None
+        try:
+            response, trial = self._post(self._payload(prompt, False, options))
+            body = response.json()
+            succeeded = True
+            return body
+        except Exception:
+            if trial is not None:
+                # The backend answered with something that isn't a generation
+                succeeded = False
+            raise
+        finally:
+            self._finish(trial, succeeded, start)
+            self._release()
+
+    def stream(self, prompt, options=None):
+        """
+        Yield Ollama's NDJSON chunks for a streaming generation
+
+        The concurrency slot is held until the stream is exhausted or closed.
+        Retries only happen before the first chunk arrives.
+        """
+        self._acquire()
+        self._count("requests")
+        start = time.perf_counter()
+        trial = None
+        succeeded = None
+        try:
+            response, trial = self._post(self._payload(prompt, True, options), stream=True)
+            first = True
+            with response:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    if first:
+                        self.time_to_first_token.observe(time.perf_counter() - start)
+                        first = False
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise RuntimeError(chunk["error"])
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+            succeeded = True
+        except Exception:
+            if trial is not None:
+                # The stream broke, or carried an error, after it started
+                succeeded = False
+            raise
+        finally:
+            # Also runs when the caller closes the stream early
+            self._finish(trial, succeeded, start)
+            self._release()
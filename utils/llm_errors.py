@@ -0,0 +1,10 @@
+class LLMUnavailableError(Exception):
+    """Raised when the LLM backend cannot take the request right now"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """Raised without contacting the backend while the circuit breaker is open"""
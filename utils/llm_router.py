@@ -0,0 +1,183 @@
+import threading
+import time
+
+from utils.llm_client import LLMClient, LLMUnavailableError, CircuitOpenError, LatencyHistogram
+
+
+class Backend:
+    def __init__(self, name, client, weight=1.0, capacity=4, fallback=False):
+        """One Ollama instance and model known to the router"""
+        self.name = name
+        self.client = client
+        self.weight = weight
+        self.capacity = capacity
+        self.fallback = fallback
+        self.in_flight = 0
+        self.routed = 0
+
+    def healthy(self):
+        """A backend is skipped while its circuit is open and cooling down, or half-open with its trial running"""
+        return self.client.breaker.available()
+
+    def load(self):
+        """Weighted least-connections score of sending one more request here"""
+        return (self.in_flight + 1) / (self.capacity * self.weight)
+
+
+class LLMRouter:
+    def __init__(self, backends, queue_slo=10, queue_timeout=60):
+        """
+        Routes generations to the least-loaded healthy backend
+
+        Parameters:
+        - backends: Backend instances; fallback ones are only used once a request
+          has waited queue_slo seconds for a primary slot
+        - queue_slo: seconds a request may wait for a primary backend
+        - queue_timeout: seconds a request may wait for any backend before failing
+        """
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.backends = backends
+        self.queue_slo = queue_slo
+        self.queue_timeout = queue_timeout
+        self.queue_wait = LatencyHistogram(buckets=(0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60))
+        self._condition = threading.Condition()
+        self._fallbacks_used = 0
+        self._rejected = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a router from Config, one LLMClient per configured backend"""
+        client_options = config.get_ollama_config()
+        backends = []
+        for spec in config.get_ollama_backends():
+            options = dict(client_options, base_url=spec["url"], model=spec["model"], max_concurrency=spec["capacity"])
+            backends.append(Backend(
+                name=f"{spec['url']}/{spec['model']}",
+                client=LLMClient(**options),
+                weight=spec["weight"],
+                capacity=spec["capacity"],
+                fallback=spec["fallback"]
+            ))
+        return cls(backends, queue_slo=config.OLLAMA_QUEUE_SLO, queue_timeout=config.OLLAMA_QUEUE_TIMEOUT)
+
+    def _pick(self, candidates):
+        free = [backend for backend in candidates if backend.in_flight < backend.capacity and backend.healthy()]
+        if not free:
+            return None
+        return min(free, key=lambda backend: (backend.load(), -backend.weight))
+
+    def _candidates(self, exclude):
+        """(primaries, fallbacks) left once the backends in exclude are skipped"""
+        backends = [backend for backend in self.backends if backend not in exclude]
+        return [backend for backend in backends if not backend.fallback], [backend for backend in backends if backend.fallback]
+
+    def _check_healthy(self, candidates):
+        if not any(backend.healthy() for backend in candidates):
+            self._rejected += 1
+            raise CircuitOpenError("No healthy LLM backend is available", retry_after=5)
+
+    def _choose(self, primaries, fallbacks, waited):
+        """
+        Reserve a slot on the best backend, returning (backend, None) or (None, seconds to wait)
+
+        Called with the router's lock held, by this router and AsyncLLMRouter.
+        Fallbacks are only picked once the request has waited queue_slo
+        seconds or every primary is down. Raises LLMUnavailableError once it
+        has waited queue_timeout.
+        """
+        backend = self._pick(primaries)
+        primaries_down = not any(primary.healthy() for primary in primaries)
+        if backend is None and (waited >= self.queue_slo or primaries_down):
+            backend = self._pick(fallbacks)
+            if backend is not None:
+                self._fallbacks_used += 1
+        if backend is not None:
+            backend.in_flight += 1
+            backend.routed += 1
+            self.queue_wait.observe(waited)
+            return backend, None
+
+        if waited >= self.queue_timeout:
+            self._rejected += 1
+            raise LLMUnavailableError("All LLM backends are busy", retry_after=5)
+        # Wake up at the SLO deadline so fallbacks get a chance, or when a slot frees
+        deadline = self.queue_slo if waited < self.queue_slo and fallbacks else self.queue_timeout
+        return None, max(deadline - waited, 0.01)
+
+    def _acquire(self, exclude=()):
+        """Reserve a slot on the best backend not in exclude, waiting for one to free up if needed"""
+        start = time.monotonic()
+        primaries, fallbacks = self._candidates(exclude)
+
+        with self._condition:
+            self._check_healthy(primaries + fallbacks)
+            while True:
+                backend, wait = self._choose(primaries, fallbacks, time.monotonic() - start)
+                if backend is not None:
+                    return backend
+                self._condition.wait(timeout=wait)
+
+    def _release(self, backend):
+        with self._condition:
+            backend.in_flight -= 1
+            self._condition.notify()
+
+    def generate(self, prompt, options=None):
+        """
+        Run a non-streaming generation on the chosen backend
+
+        A backend that turns out to be unavailable after it was picked (its
+        circuit opened, its slots were full or it kept failing) is skipped and
+        the request goes to the next best one, until every backend was tried.
+        """
+        tried = set()
+        while True:
+            backend = self._acquire(tried)
+            try:
+                return backend.client.generate(prompt, options)
+            except LLMUnavailableError:
+                tried.add(backend)
+                if len(tried) == len(self.backends):
+                    raise
+            finally:
+                self._release(backend)
+
+    def stream(self, prompt, options=None):
+        """Stream a generation from the chosen backend, holding its slot until done; fails over like generate()"""
+        tried = set()
+        while True:
+            backend = self._acquire(tried)
+            started = False
+            try:
+                for chunk in backend.client.stream(prompt, options):
+                    started = True
+                    yield chunk
+                return
+            except LLMUnavailableError:
+                # Only before the first chunk; nothing has reached the caller yet
+                tried.add(backend)
+                if started or len(tried) == len(self.backends):
+                    raise
+            finally:
+                self._release(backend)
+
+    def stats(self):
+        """Routing counters plus each backend's client stats"""
+        with self._condition:
+            backends = [{
+                "name": backend.name,
+                "model": backend.client.model,
+                "weight": backend.weight,
+                "capacity": backend.capacity,
+                "fallback": backend.fallback,
+                "healthy": backend.healthy(),
+                "inFlight": backend.in_flight,
+                "routed": backend.routed
+            } for backend in self.backends]
+            stats = {"fallbacksUsed": self._fallbacks_used, "rejected": self._rejected}
+        for entry, backend in zip(backends, self.backends):
+            entry["client"] = backend.client.stats()
+        stats["queueWaitSeconds"] = self.queue_wait.snapshot()
+        stats["backends"] = backends
+        return stats
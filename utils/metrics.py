@@ -0,0 +1,326 @@
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+# Upper bounds (seconds) for request and stage durations
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Upper bounds (bytes) for rendered plan files
+SIZE_BUCKETS = (4096, 16384, 65536, 262144, 1048576, 4194304)
+# Upper bounds for LLM tokens per second
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+# Upper bounds (seconds) of the LLM latency histogram buckets
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """Cumulative latency histogram in the Prometheus style"""
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            index = len(self.buckets)
+            for position, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    index = position
+                    break
+            self._counts[index] += 1
+            self._sum += seconds
+            self._count += 1
+
+    def snapshot(self):
+        """Return cumulative bucket counts, sum and count"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "sum": round(total, 4), "count": count}
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class CounterMetric:
+    def __init__(self, name, help_text, labels=()):
+        """Monotonic counter, one value per combination of label values"""
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class HistogramMetric:
+    def __init__(self, name, help_text, labels=(), buckets=DURATION_BUCKETS):
+        """Histogram per combination of label values, built on LatencyHistogram"""
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            histogram = self._histograms.get(label_values)
+            if histogram is None:
+                histogram = self._histograms[label_values] = LatencyHistogram(self.buckets)
+        histogram.observe(value)
+
+    def snapshots(self):
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {label_values: histogram.snapshot() for label_values, histogram in histograms.items()}
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, snapshot in sorted(self.snapshots().items()):
+            for bound, count in snapshot["buckets"].items():
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, ('le', bound))} {count}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {snapshot['sum']}")
+            lines.append(f"{self.name}_count{labels} {snapshot['count']}")
+        return lines
+
+
+class GaugeMetric:
+    def __init__(self, name, help_text, read):
+        """Gauge whose value is read from a callable when metrics are exposed"""
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def expose(self):
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class MetricsRegistry:
+    def __init__(self, prefix="trainer_"):
+        """Named metrics exposed together in the Prometheus text format"""
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._spans = threading.local()
+
+    def _register(self, name, factory):
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory(name)
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(name, lambda full_name: CounterMetric(full_name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DURATION_BUCKETS):
+        return self._register(name, lambda full_name: HistogramMetric(full_name, help_text, labels, buckets))
+
+    def gauge(self, name, help_text, read):
+        return self._register(name, lambda full_name: GaugeMetric(full_name, help_text, read))
+
+    def expose(self):
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+    # Spans
+
+    def begin_trace(self):
+        """Start collecting the spans timed on this thread"""
+        self._spans.current = []
+
+    def end_trace(self):
+        """Stop collecting and return the (name, seconds) spans timed since begin_trace()"""
+        spans = getattr(self._spans, "current", None) or []
+        self._spans.current = None
+        return spans
+
+    @contextmanager
+    def span(self, name):
+        """Time a stage into the stage duration histogram, counting it as an error if it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.counter("stage_errors_total", "Stages that raised, by exception type", ("stage", "error")).inc(name, type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.histogram("stage_duration_seconds", "Time spent in each stage of a request", ("stage",)).observe(elapsed, name)
+            spans = getattr(self._spans, "current", None)
+            if spans is not None:
+                spans.append((name, elapsed))
+
+    def observe_generation(self, body, elapsed):
+        """Record token counts and throughput from an Ollama response body"""
+        if body.get("done_reason") == "length":
+            # Hit num_predict: the plan is cut short
+            self.counter("llm_truncated_total", "Generations stopped by the token limit").inc()
+        tokens = body.get("eval_count")
+        if not tokens:
+            return
+        self.counter("llm_tokens_total", "Tokens generated by the LLM").inc(amount=tokens)
+        prompt_tokens = body.get("prompt_eval_count")
+        if prompt_tokens:
+            self.counter("llm_prompt_tokens_total", "Prompt tokens evaluated by the LLM").inc(amount=prompt_tokens)
+        # Ollama reports eval_duration in nanoseconds; fall back to wall time without it
+        seconds = body.get("eval_duration", 0) / 1e9 or elapsed
+        if seconds > 0:
+            self.histogram("llm_tokens_per_second", "LLM generation throughput", buckets=RATE_BUCKETS).observe(tokens / seconds)
+
+
+# Shortest sampling interval; below it the sampler thread spins on sys._current_frames()
+MIN_PROFILER_INTERVAL = 0.001
+
+
+def _positive_seconds(name, value, minimum):
+    """value as float seconds, raising ValueError unless it is finite and at least minimum"""
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be a number of seconds")
+    seconds = float(value)
+    if not math.isfinite(seconds) or seconds < minimum:
+        raise ValueError(f"{name} must be at least {minimum} seconds")
+    return seconds
+
+
+class SlowRequestProfiler:
+    def __init__(self, threshold=1.0, interval=0.01, max_profiles=20, max_depth=64):
+        """
+        Sampling profiler for slow requests, switched on and off at runtime
+
+        While enabled, a sampler thread grabs the stacks of request threads
+        that have been running for more than threshold seconds, every interval
+        seconds. The collapsed stacks of the last max_profiles slow requests
+        are kept for inspection.
+        """
+        self.threshold = _positive_seconds("threshold", threshold, 0)
+        self.interval = _positive_seconds("interval", interval, MIN_PROFILER_INTERVAL)
+        self.max_depth = max_depth
+        self.enabled = False
+        self.profiles = deque(maxlen=max_profiles)
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def configure(self, enabled=None, threshold=None, interval=None):
+        """Change the settings given; raises ValueError, leaving all of them unchanged, if one is invalid"""
+        if threshold is not None:
+            threshold = _positive_seconds("threshold", threshold, 0)
+        if interval is not None:
+            interval = _positive_seconds("interval", interval, MIN_PROFILER_INTERVAL)
+        if enabled is not None and not isinstance(enabled, bool):
+            raise ValueError("enabled must be true or false")
+        with self._lock:
+            if threshold is not None:
+                self.threshold = threshold
+            if interval is not None:
+                self.interval = interval
+            if enabled is not None:
+                self.enabled = enabled
+        if self.enabled:
+            self._start()
+        else:
+            self._stop.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._sample_loop, args=(self._stop,), name="slow-request-profiler", daemon=True)
+            self._thread.start()
+
+    def request_started(self, label):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._active[threading.get_ident()] = {"label": label, "start": time.perf_counter(), "stacks": Counter()}
+
+    def request_finished(self):
+        with self._lock:
+            request = self._active.pop(threading.get_ident(), None)
+        if request is None:
+            return
+        duration = time.perf_counter() - request["start"]
+        if duration >= self.threshold and request["stacks"]:
+            self.profiles.append({
+                "request": request["label"],
+                "durationSeconds": round(duration, 4),
+                "samples": sum(request["stacks"].values()),
+                "stacks": [{"stack": stack, "count": count} for stack, count in request["stacks"].most_common(25)]
+            })
+
+    def _collapse(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _sample_loop(self, stop):
+        while not stop.wait(self.interval):
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, request in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None and now - request["start"] >= self.threshold:
+                        request["stacks"][self._collapse(frame)] += 1
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "thresholdSeconds": self.threshold,
+            "intervalSeconds": self.interval,
+            "profiles": list(self.profiles)
+        }
+
+
+# Process-wide registry used by the API and data access layer
+metrics = MetricsRegistry()